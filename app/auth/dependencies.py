@@ -13,11 +13,7 @@ try:
 except Exception:
     get_firestore_client = None
 
-# NEW: import helper to find by doc id in Firestore
-try:
-    from app.auth.firestore_user import get_user_by_id as fs_get_user_by_id
-except Exception:
-    fs_get_user_by_id = None
+from app.auth.identity import resolve_identity, attach
 
 security = HTTPBearer(auto_error=False)
 
@@ -71,7 +67,7 @@ async def get_current_user(
 
             if db is not None:
                 try:
-                    user = db.query(User).filter(User.id == int(user_id)).first()
+                    user = attach(db, resolve_identity(request, user_id))
                 except Exception:
                     user = None
                 print(f"[DEBUG] get_current_user: SQL lookup result={bool(user)}")
@@ -95,26 +91,21 @@ async def get_current_user(
     user_id = request.session.get('user_id')
     print(f"[DEBUG] get_current_user: no bearer token, session_user_id={user_id}, db_present={db is not None}")
     if user_id:
+        # пользователь уже определён CurrentUserMiddleware для этого запроса (или берётся из кеша снимков)
         if db is not None:
             try:
-                user = db.query(User).filter(User.id == user_id).first()
+                user = attach(db, resolve_identity(request, user_id))
             except Exception:
-                try:
-                    from app.tasks.database import ensure_db_migrations
-                    ensure_db_migrations()
-                    user = db.query(User).filter(User.id == user_id).first()
-                except Exception:
-                    user = None
+                user = None
             print(f"[DEBUG] get_current_user: SQL session lookup result={bool(user)}")
             return user
 
         # Firestore mode: сначала попробуем найти документ по ID (session хранит doc id)
         try:
-            if fs_get_user_by_id is not None:
-                u = fs_get_user_by_id(str(user_id))
-                print(f"[DEBUG] get_current_user: firestore lookup by doc id result={bool(u)}")
-                if u:
-                    return u
+            u = resolve_identity(request, user_id)
+            print(f"[DEBUG] get_current_user: firestore lookup by doc id result={bool(u)}")
+            if u:
+                return u
         except Exception as ex:
             print(f"[DEBUG] get_current_user: firestore lookup by doc id raised: {ex}")
             pass
@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any
 from types import SimpleNamespace
 
 from app.auth.firebase_admin import get_firestore_client
+from app.auth.identity import invalidate_user
 
 
 def _doc_to_user_obj(doc) -> SimpleNamespace:
@@ -91,6 +92,7 @@ def update_user(doc_id: str, fields: Dict[str, Any]) -> Optional[SimpleNamespace
         return None
     doc_ref = client.collection('users').document(str(doc_id))
     doc_ref.update(fields)
+    invalidate_user(doc_id)
     doc = doc_ref.get()
     return _doc_to_user_obj(doc)
 
@@ -100,4 +102,5 @@ def delete_user(doc_id: str):
     if not client:
         return False
     client.collection('users').document(str(doc_id)).delete()
+    invalidate_user(doc_id)
     return True
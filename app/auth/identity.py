@@ -0,0 +1,185 @@
+"""
+Определение текущего пользователя один раз на запрос.
+
+CurrentUserMiddleware и зависимости get_current_user/require_user используют общий результат
+(request.state), а снимки пользователей хранятся в небольшом in-process LRU с коротким TTL.
+Снимок — отсоединённый объект User (или SimpleNamespace в Firestore режиме); в сессию запроса
+он добавляется через db.merge(load=False), без запроса к БД, и годится только для чтения
+(идентичность, профиль в шаблонах): баланс меняется через change_currency атомарным UPDATE.
+
+Кеш сбрасывается при записи пользователя: для SQL — по событиям сессии SQLAlchemy (любой flush,
+изменивший User: профиль, настройки, валюта, last_login...), для Firestore — из функций записи.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.tasks.database import SessionLocal
+from app.auth.models import User
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU с ограничением по времени жизни записей (потокобезопасный)"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, value = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+_settings = get_settings()
+user_cache = TTLCache(maxsize=_settings.identity_cache_size, ttl=_settings.identity_cache_ttl)
+
+
+def invalidate_user(user_id):
+    """Сбросить снимок пользователя (после изменения профиля, настроек, валюты и т.п.)"""
+    if user_id is not None:
+        user_cache.invalidate(str(user_id))
+
+
+def _load_user(user_id) -> Optional[Any]:
+    if SessionLocal is not None:
+        db = SessionLocal()
+        try:
+            try:
+                user = db.get(User, int(user_id))
+            except Exception:
+                from app.tasks.database import ensure_db_migrations
+                ensure_db_migrations()
+                user = db.get(User, int(user_id))
+            if user is not None:
+                db.expunge(user)
+            return user
+        finally:
+            db.close()
+
+    # Firestore mode — документ пользователя по id
+    from app.auth.firestore_user import get_user_by_id as fs_get_user_by_id
+    return fs_get_user_by_id(str(user_id))
+
+
+def get_user_snapshot(user_id) -> Optional[Any]:
+    """Снимок пользователя из кеша или из БД/Firestore"""
+    if user_id is None:
+        return None
+    key = str(user_id)
+    user = user_cache.get(key)
+    if user is None:
+        user = _load_user(user_id)
+        if user is not None:
+            user_cache.put(key, user)
+    return user
+
+
+def resolve_identity(request, user_id=_MISSING) -> Optional[Any]:
+    """Пользователь запроса (по id из сессии или явно переданному id из токена); результат запоминается в request.state"""
+    if user_id is _MISSING:
+        try:
+            user_id = request.session.get('user_id')
+        except Exception:
+            user_id = None
+    if not user_id:
+        return None
+
+    resolved = getattr(request.state, 'identity', None)
+    if resolved is not None and resolved[0] == str(user_id):
+        return resolved[1]
+
+    user = get_user_snapshot(user_id)
+    request.state.identity = (str(user_id), user)
+    return user
+
+
+def attach(db: Optional[Session], user):
+    """Объект пользователя, привязанный к сессии запроса (без SELECT).
+
+    Поля снимка могут отставать на TTL кеша: для записи денег используйте change_currency,
+    для остальных изменений — свежий объект (db.refresh / populate_existing).
+    """
+    if db is None or not isinstance(user, User):
+        return user
+    return db.merge(user, load=False)
+
+
+def change_currency(db: Session, user_id, delta: int, minimum: Optional[int] = None) -> bool:
+    """Атомарно изменить баланс: UPDATE users SET currency = currency + delta, без чтения объекта.
+
+    minimum — нижняя граница баланса после изменения (для списаний); если её не хватает, строка
+    не обновляется и возвращается False. Загруженный в сессию User (в т.ч. снимок из attach)
+    помечается устаревшим, снимок в кеше сбрасывается после commit.
+    """
+    balance = func.coalesce(User.currency, 0) + delta
+    stmt = update(User).where(User.id == user_id).values(currency=balance)
+    if minimum is not None:
+        stmt = stmt.where(balance >= minimum)
+    result = db.execute(stmt.execution_options(synchronize_session=False))
+    if not result.rowcount:
+        return False
+    db.info.setdefault('changed_user_ids', set()).add(user_id)
+    loaded = db.identity_map.get(db.identity_key(User, user_id))
+    if loaded is not None:
+        db.expire(loaded, ['currency'])
+    return True
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
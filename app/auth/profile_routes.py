@@ -5,7 +5,7 @@ from app.tasks.database import get_db
 from app.auth.models import User
 from app.auth.schemas import UserResponse, UserProfileUpdate, UserSettingsUpdate, PasswordChange
 from app.auth.dependencies import require_user
-from app.auth.security import verify_password, get_password_hash, validate_password
+from app.auth.security import verify_password_async, get_password_hash_async, validate_password
 from app.core.fastapi_config import templates
 from app.auth.firestore_user import (
     get_user_by_id as fs_get_user_by_id,
@@ -144,7 +144,7 @@ async def change_password(
                 detail="Вы используете вход через Google. Смена пароля недоступна."
             )
 
-        if not verify_password(password_data.current_password, current_user.hashed_password):
+        if not await verify_password_async(password_data.current_password, current_user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Неверный текущий пароль"
@@ -156,7 +156,7 @@ async def change_password(
                 detail="Новый пароль должен содержать минимум 8 символов"
             )
 
-        current_user.hashed_password = get_password_hash(password_data.new_password)
+        current_user.hashed_password = await get_password_hash_async(password_data.new_password)
         db.commit()
 
         return {"message": "Пароль успешно изменён"}
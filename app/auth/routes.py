@@ -1,4 +1,5 @@
-from datetime import datetime
+import secrets
+from datetime import datetime, timedelta
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
@@ -20,9 +21,9 @@ from app.auth.security import (
     create_access_token,
     create_refresh_token,
     decode_token,
-    get_password_hash,
+    get_password_hash_async,
     validate_password,
-    verify_password,
+    verify_and_update_password_async,
 )
 from app.core.fastapi_config import templates
 from app.tasks.database import get_db
@@ -110,7 +111,7 @@ async def register(
             email=user_data.email,
             username=user_data.username,
             display_name=user_data.display_name or user_data.email.split('@')[0],
-            hashed_password=get_password_hash(user_data.password),
+            hashed_password=await get_password_hash_async(user_data.password),
             is_verified=False
         )
 
@@ -162,7 +163,7 @@ async def register(
         'email': user_data.email,
         'username': user_data.username,
         'display_name': user_data.display_name or user_data.email.split('@')[0],
-        'hashed_password': get_password_hash(user_data.password),
+        'hashed_password': await get_password_hash_async(user_data.password),
         'is_verified': False,
     }
 
@@ -197,12 +198,16 @@ async def login(
                 detail="Неверный email или пароль"
             )
 
-        if not verify_password(credentials.password, user.hashed_password):
+        valid, new_hash = await verify_and_update_password_async(credentials.password, user.hashed_password)
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Неверный email или пароль"
             )
 
+        # хеш со старой стоимостью/схемой пересчитывается при успешном входе
+        if new_hash:
+            user.hashed_password = new_hash
         user.last_login = datetime.utcnow()
         db.commit()
 
@@ -223,8 +228,11 @@ async def login(
     if not existing or not getattr(existing, 'hashed_password', None):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Неверный email или пароль')
 
-    if not verify_password(credentials.password, existing.hashed_password):
+    valid, new_hash = await verify_and_update_password_async(credentials.password, existing.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Неверный email или пароль')
+    if new_hash:
+        fs_update_user(existing.id, {'hashed_password': new_hash})
 
     access_token = create_access_token(data={"sub": str(existing.id), "email": existing.email})
     refresh_token = create_refresh_token(data={"sub": str(existing.id)})
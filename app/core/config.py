@@ -24,7 +24,19 @@ class Settings(BaseSettings):
     default_quest_deadline_days: int = 1
 
     # Generator settings
-    generator_check_interval: int = 300  # секунды
+    # Планировщик шаблонов квестов (в serverless окружении выключить и запускать
+    # app/helper_scripts/generate_due_quests.py по расписанию)
+    template_scheduler_enabled: bool = True
+    generator_check_interval: int = 300  # секунды, максимум между проверками
+
+    # Кеш снимков пользователей для определения текущего пользователя (app/auth/identity.py)
+    identity_cache_ttl: int = 30  # секунды
+    identity_cache_size: int = 1024
+
+    # Фоновое истечение дедлайнов (в serverless окружении выключить и запускать
+    # app/helper_scripts/expire_overdue_quests.py по расписанию)
+    expiry_worker_enabled: bool = True
+    expiry_max_sleep: int = 300  # секунды, максимум между проверками
 
     model_config = ConfigDict(
         env_file='.env',
@@ -0,0 +1,24 @@
+from app.tasks.database import SessionLocal
+from app.tasks.expiry import expire_overdue_quests
+
+
+def expire():
+    """Проваливает просроченные активные квесты (для запуска по cron, когда фоновый воркер выключен)"""
+    if SessionLocal is None:
+        print('❌ SQL база не инициализирована (включён FIRESTORE_ENABLED?)')
+        raise SystemExit(1)
+
+    db = SessionLocal()
+    try:
+        expired, next_deadline = expire_overdue_quests(db)
+    finally:
+        db.close()
+
+    print(f'✅ Проваленных по дедлайну квестов: {expired}')
+    if next_deadline:
+        print(f'   Ближайший дедлайн: {next_deadline}')
+
+
+if __name__ == "__main__":
+    # python -m app.helper_scripts.expire_overdue_quests
+    expire()
@@ -0,0 +1,26 @@
+from app.tasks.database import SessionLocal, schedule_templates
+from app.tasks.generator import generate_due_templates, next_template_run
+
+
+def generate(reschedule: bool = False):
+    """Создаёт квесты по наступившим шаблонам всех пользователей (для запуска по cron, когда планировщик выключен)"""
+    db = SessionLocal() if SessionLocal is not None else None
+    try:
+        if reschedule and db is not None:
+            count = schedule_templates(db)
+            print(f'✅ Расписание пересчитано для {count} шаблонов')
+        quest_ids = generate_due_templates(db)
+        next_run = next_template_run(db)
+    finally:
+        if db is not None:
+            db.close()
+
+    print(f'✅ Создано квестов по шаблонам: {len(quest_ids)}')
+    if next_run:
+        print(f'   Следующий запуск: {next_run}')
+
+
+if __name__ == "__main__":
+    import sys
+    # python -m app.helper_scripts.generate_due_quests [--reschedule]
+    generate(reschedule='--reschedule' in sys.argv)
@@ -0,0 +1,24 @@
+from app.tasks.database import SessionLocal, rebuild_quest_dag
+
+
+def rebuild():
+    """Перестраивает транзитивное замыкание quest_closure и счётчики незавершённых родителей"""
+    if SessionLocal is None:
+        print('❌ SQL база не инициализирована (включён FIRESTORE_ENABLED?)')
+        raise SystemExit(1)
+
+    db = SessionLocal()
+    try:
+        count = rebuild_quest_dag(db)
+    finally:
+        db.close()
+
+    print(f'✅ Граф квестов перестроен: {count} связей предок-потомок')
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Перестройка графа квестов")
+    print("=" * 50)
+    # python -m app.helper_scripts.rebuild_quest_graph
+    rebuild()
@@ -0,0 +1,27 @@
+import sys
+
+from app.tasks.database import SessionLocal, recalculate_quest_progress
+
+
+def recalculate(quest_ids=None):
+    """Пересчитывает сохранённый прогресс (progress/total_weight/completed_weight) квестов по их подзадачам"""
+    if SessionLocal is None:
+        print('❌ SQL база не инициализирована (включён FIRESTORE_ENABLED?)')
+        raise SystemExit(1)
+
+    db = SessionLocal()
+    try:
+        count = recalculate_quest_progress(db, quest_ids)
+    finally:
+        db.close()
+
+    print(f'✅ Прогресс пересчитан для {count} квестов')
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Пересчёт прогресса квестов")
+    print("=" * 50)
+    # python -m app.helper_scripts.recalculate_quest_progress [quest_id ...]
+    ids = [int(a) for a in sys.argv[1:]] or None
+    recalculate(ids)
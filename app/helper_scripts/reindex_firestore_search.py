@@ -0,0 +1,17 @@
+import sys
+
+from app.tasks.firestore_service import reindex_search_tokens
+
+
+def reindex(user_id=None):
+    """Пересобирает индекс поиска (search_tokens) в документах квестов Firestore"""
+    count = reindex_search_tokens(user_id)
+    print(f'✅ Индекс поиска обновлён для {count} квестов')
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Переиндексация поиска квестов (Firestore)")
+    print("=" * 50)
+    # python -m app.helper_scripts.reindex_firestore_search [user_id]
+    reindex(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -17,12 +17,7 @@ from app.auth.profile_routes import router as profile_router
 import app.shop.routes as shop_routes
 from app.physics.main import router as physics_router
 from app.main_page import router as main_router
-from app.tasks.database import SessionLocal
-from app.auth.models import User as AuthUser
-try:
-    from app.auth.firestore_user import get_user_by_id as fs_get_user_by_id
-except Exception:
-    fs_get_user_by_id = None
+from app.auth.identity import resolve_identity
 
 SESSION_MAX_AGE_IN_SECONDS = 86400 * 30
 
@@ -45,19 +40,47 @@ async def lifespan(app: FastAPI):
             print('⚠️ Предупреждение: не удалось импортировать модели аутентификации при старте:', e)
 
         try:
-            from app.tasks.database import Base, engine, ensure_db_migrations
+            from app.tasks.database import Base, engine, async_engine, ensure_db_migrations, ensure_indexes
+            from app.tasks.search import ensure_search_index
             # Если engine не инициализирован (например, FIRESTORE_ENABLED=True), пропускаем создание таблиц
-            if engine is not None:
+            if async_engine is not None:
+                ensure_db_migrations()
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                    await conn.run_sync(ensure_indexes)
+                    await conn.run_sync(ensure_search_index)
+                print('✅ Таблицы БД проверены/созданы (async create_all)')
+            elif engine is not None:
                 ensure_db_migrations()
                 Base.metadata.create_all(bind=engine)
+                with engine.begin() as conn:
+                    ensure_indexes(conn)
+                    ensure_search_index(conn)
                 print('✅ Таблицы БД проверены/созданы (create_all)')
             else:
                 print('ℹ️ SQL engine не инициализирован (вероятно включён FIRESTORE). Пропускаем создание SQL-таблиц.')
         except Exception as e:
             print('⚠️ Предупреждение: не удалось создать таблицы БД при старте:', e)
 
+        if settings.expiry_worker_enabled:
+            from app.tasks.expiry import start_expiry_worker
+            if await start_expiry_worker(settings.expiry_max_sleep) is not None:
+                print('⏰ Воркер истечения дедлайнов запущен')
+
+        if settings.template_scheduler_enabled:
+            from app.tasks.generator import start_template_scheduler
+            await start_template_scheduler(settings.generator_check_interval)
+            print('🔁 Планировщик шаблонов квестов запущен')
+
         yield
     finally:
+        from app.tasks.generator import stop_template_scheduler
+        await stop_template_scheduler()
+        from app.tasks.expiry import stop_expiry_worker
+        await stop_expiry_worker()
+        from app.tasks.database import async_engine
+        if async_engine is not None:
+            await async_engine.dispose()
         print(f"{settings.app_name} остановлен")
 
 app = FastAPI(
@@ -89,28 +112,8 @@ class CurrentUserMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request, call_next):
         request.state.current_user = None
         try:
-            user_id = None
-            try:
-                user_id = request.session.get('user_id')
-            except Exception:
-                user_id = None
-
-            if user_id:
-                if SessionLocal is not None:
-                    db = SessionLocal()
-                    try:
-                        user = db.query(AuthUser).filter(AuthUser.id == user_id).first()
-                        request.state.current_user = user
-                    finally:
-                        db.close()
-                else:
-                    # Firestore mode — try to fetch user document
-                    try:
-                        if fs_get_user_by_id is not None:
-                            u = fs_get_user_by_id(str(user_id))
-                            request.state.current_user = u
-                    except Exception:
-                        request.state.current_user = None
+            # снимок пользователя из кеша identity; зависимости get_current_user используют тот же результат
+            request.state.current_user = resolve_identity(request)
         except Exception as e:
             print('Ошибка при получении current_user в CurrentUserMiddleware:', e)
         response = await call_next(request)
@@ -265,6 +268,15 @@ async def debug_current_user(request: Request):
         } if cu else None
     }
 
+@app.get('/_debug/password_hashing')
+async def debug_password_hashing():
+    """Загрузка пула хеширования паролей: выполняется/в очереди/отклонено (503)"""
+    if not settings.debug:
+        return RedirectResponse(url='/', status_code=303)
+
+    from app.auth.security import password_hasher
+    return password_hasher.stats()
+
 @app.get('/_internal/session_debug')
 async def session_debug(request: Request):
     """Диагностический endpoint: возвращает сессию и cookies текущего запроса (временный)."""
@@ -1,14 +1,51 @@
 from dataclasses import dataclass
-from typing import Tuple
-from fastapi import Request, HTTPException, APIRouter
+from typing import Any, Callable, Tuple, Dict, Optional
+from fastapi import Request, HTTPException, APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import HTTPConnection
 from typing import List
+from collections import OrderedDict
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import logging
+import math
+import os
+import secrets
+import struct
+import threading
+import time
 import numpy as np
 from app.core.fastapi_config import templates
 
 router = APIRouter(prefix="/M10")
-simulator = None
+logger = logging.getLogger(__name__)
+
+# Симуляторы хранятся по сессиям: LRU с ограничением по памяти решёток и временем простоя
+SIMULATOR_MEMORY_BYTES = int(os.getenv("M10_SIMULATOR_MEMORY_MB", 256)) * 1024 * 1024
+SIMULATOR_TTL_SECONDS = int(os.getenv("M10_SESSION_TTL", 1800))
+# Каталог для снимков вытесненных симуляторов (пусто — не сохранять); общий каталог позволяет
+# продолжить симуляцию в другом воркере
+SNAPSHOT_DIR = os.getenv("M10_SNAPSHOT_DIR", "")
+# Решётка хранится как int8 (байт на спин); проходы по решётке идут блоками по SWEEP_CHUNK спинов,
+# чтобы временные массивы не зависели от размера куба
+MAX_CUBE_SIZE = int(os.getenv("M10_MAX_CUBE_SIZE", 256))
+SWEEP_CHUNK = 1 << 20
+# Потоковая передача кадров по WebSocket: верхняя граница частоты кадров
+STREAM_MAX_FPS = float(os.getenv("M10_STREAM_MAX_FPS", 30))
+# Сканирование по температуре (параллельный отжиг): процессы пула, верхние границы на запрос —
+# обновления спинов, реплико-раунды обмена (K × раунды) и время; число блоков для ошибок и
+# объём работы одной задачи пула (между передачами решёток); при нескольких блоках волна не длиннее
+# SCAN_WAVE_ROUNDS раундов, чтобы пары на границах блоков обменивались почти так же часто, как внутренние
+SCAN_WORKERS = int(os.getenv("M10_SCAN_WORKERS") or os.cpu_count() or 1)
+SCAN_MAX_UPDATES = float(os.getenv("M10_SCAN_MAX_UPDATES", 5e8))
+SCAN_MAX_ROUNDS = float(os.getenv("M10_SCAN_MAX_ROUNDS", 1e6))
+SCAN_TIMEOUT = float(os.getenv("M10_SCAN_TIMEOUT", 300))
+SCAN_BINS = 10
+SCAN_TASK_UPDATES = 1 << 24
+SCAN_WAVE_ROUNDS = 4
 
 
 class SimulationRequest(BaseModel):
@@ -17,6 +54,7 @@ class SimulationRequest(BaseModel):
     field_strength_T: float = 0.0
     cube_size: int = 8
     num_steps: int = 1
+    algorithm: str = "checkerboard"
 
 
 class SpinSnapshot(BaseModel):
@@ -27,6 +65,9 @@ class SpinSnapshot(BaseModel):
     magnetization: float
     temperature: float
     field: float
+    algorithm: str = "checkerboard"
+    autocorrelation_time: Optional[float] = None
+    statistics: Optional[Dict[str, Any]] = None
 
 
 class SimulationResponse(BaseModel):
@@ -45,11 +86,102 @@ class SpinState:
     field_strength: float
 
 
+ALGORITHMS = ("metropolis", "checkerboard", "wolff")
+
+
+class Welford:
+    """Среднее и дисперсия потока значений за один проход (алгоритм Уэлфорда)"""
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class BinningAccumulator:
+    """Поток измерений с логарифмическим биннингом: на уровне l — Уэлфорд по средним блоков из 2^l значений.
+    Ошибка среднего берётся с самого грубого уровня, где ещё не меньше MIN_BLOCKS блоков (блоки длиннее
+    времени автокорреляции почти независимы), а τ_int = ½·(ошибка_l / ошибка_0)². Память — O(число уровней)"""
+    MIN_BLOCKS = 32
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self.levels: List[Welford] = []
+        self._pending: List[Optional[float]] = []
+
+    def add(self, x: float):
+        value = float(x)
+        for level in range(self.MAX_LEVELS):
+            if level == len(self.levels):
+                self.levels.append(Welford())
+                self._pending.append(None)
+            self.levels[level].add(value)
+            if self._pending[level] is None:
+                self._pending[level] = value
+                return
+            value = 0.5 * (self._pending[level] + value)
+            self._pending[level] = None
+
+    @property
+    def count(self) -> int:
+        return self.levels[0].count if self.levels else 0
+
+    @property
+    def mean(self) -> float:
+        return self.levels[0].mean if self.levels else 0.0
+
+    @property
+    def variance(self) -> float:
+        return self.levels[0].variance if self.levels else 0.0
+
+    def _level_error(self, level: int) -> float:
+        stats = self.levels[level]
+        return float(np.sqrt(stats.variance / stats.count))
+
+    def _reliable_level(self) -> int:
+        level = 0
+        while level + 1 < len(self.levels) and self.levels[level + 1].count >= self.MIN_BLOCKS:
+            level += 1
+        return level
+
+    def error(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return self._level_error(self._reliable_level())
+
+    def autocorrelation_time(self) -> Optional[float]:
+        """τ_int в шагах ряда; None — мало данных для биннинга или ряд постоянный"""
+        if len(self.levels) < 2 or self.levels[1].count < self.MIN_BLOCKS or self.variance == 0:
+            return None
+        ratio = self._level_error(self._reliable_level()) / self._level_error(0)
+        return float(max(0.5 * ratio * ratio, 0.5))
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {"mean": self.mean, "error": self.error(), "tau": self.autocorrelation_time()}
+
+
 class Spin3DSimulator:
-    def __init__(self, size: int = 8):
+    def __init__(self, size: int = 8, algorithm: str = "checkerboard", seed=None):
         self.size = max(1, int(size))
-        self.rng = np.random.default_rng()
-        self.spins = self.rng.choice([-1, 1], size=(self.size, self.size, self.size))
+        if self.size > MAX_CUBE_SIZE:
+            raise ValueError(f"Размер куба не больше {MAX_CUBE_SIZE}")
+        self.rng = np.random.default_rng(seed)
+        # шаг и смена параметров из HTTP-запроса и из потока одной сессии идут по очереди (см. locked_step)
+        self.lock = threading.Lock()
+        self.spins = self.rng.integers(0, 2, size=(self.size, self.size, self.size), dtype=np.int8)
+        self.spins *= 2
+        self.spins -= 1
         self.temperature_K = 300.0
         self.field_strength_T = 0.0
         self.field_angle = 0.0
@@ -57,6 +189,10 @@ class Spin3DSimulator:
         self.alpha = 1.0
         self.beta = 8.0
         self.mc_steps = max(1, self.size)
+        self.reset_statistics()
+        self.algorithm = None
+        self.set_algorithm(algorithm)
+        self.labels, self.colors = self.sublattice_labels(self.size)
 
         self.K_B = 1.380649e-23
         self.ENERGY_SCALE = 1.0
@@ -64,11 +200,53 @@ class Spin3DSimulator:
         self.energy = 0.0
         self.neighbour_energy = 0.0
 
+        self.rebuild_maps()
+
+        self.acceptance = None
+        self._acceptance_key = None
+        self.update_acceptance_table()
+
+        self.calculate_energy()
+
+    def rebuild_maps(self):
         self.up_count = np.sum(self.spins > 0, axis=2)
         self.down_count = np.sum(self.spins < 0, axis=2)
         self.mean_spin_map = (self.up_count - self.down_count) / float(self.size)
 
-        self.calculate_energy()
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.spins.nbytes + self.up_count.nbytes + self.down_count.nbytes + self.mean_spin_map.nbytes
+        )
+
+    def save_snapshot(self, path: str):
+        """Компактный снимок: спины упакованы по биту, плюс параметры симуляции"""
+        np.savez_compressed(
+            path,
+            spins=np.packbits(self.spins.ravel() > 0),
+            size=self.size,
+            algorithm=self.algorithm,
+            temperature_K=self.temperature_K,
+            field=np.array([self.field_angle, self.field_strength_T]),
+        )
+
+    @classmethod
+    def from_spins(cls, spins: np.ndarray, algorithm: str = "checkerboard", seed=None) -> 'Spin3DSimulator':
+        sim = cls(size=spins.shape[0], algorithm=algorithm, seed=seed)
+        sim.spins = np.ascontiguousarray(spins, dtype=np.int8)
+        sim.rebuild_maps()
+        sim.calculate_energy()
+        return sim
+
+    @classmethod
+    def load_snapshot(cls, path: str) -> 'Spin3DSimulator':
+        with np.load(path) as data:
+            size = int(data['size'])
+            bits = np.unpackbits(data['spins'], count=size ** 3).astype(np.int8)
+            sim = cls.from_spins((2 * bits - 1).reshape(size, size, size), str(data['algorithm']))
+            sim.set_temperature(float(data['temperature_K']))
+            sim.set_field(*(float(v) for v in data['field']))
+        return sim
 
     @staticmethod
     def temperature_to_normalized(T_K: float) -> float:
@@ -82,24 +260,109 @@ class Spin3DSimulator:
         B_normalized = self.field_to_normalized(self.field_strength_T)
         return 0.0, B_normalized
 
-    def calculate_energy(self) -> float:
+    @staticmethod
+    def sublattice_labels(size: int) -> Tuple[np.ndarray, int]:
+        """Метки слоёв для раскраски без соседей одного цвета с учётом периодичности: цвет спина —
+        (метка_i + метка_j + метка_k) mod colors. Для чётного размера это шахматная раскраска,
+        для нечётного — три цвета (последний слой по каждой оси получает свою метку)"""
+        labels = (np.arange(size) % 2).astype(np.int8)
+        colors = 2
+        if size % 2:
+            labels[-1] = 2
+            colors = 3
+        return labels, colors
+
+    def slabs(self):
+        """Границы блоков слоёв по оси 0, в каждом не больше SWEEP_CHUNK спинов"""
+        planes = max(1, SWEEP_CHUNK // (self.size * self.size))
+        for a in range(0, self.size, planes):
+            yield a, min(self.size, a + planes)
+
+    def sublattice_mask(self, a: int, b: int, color: int) -> np.ndarray:
+        labels = self.labels
+        return (labels[a:b, None, None] + labels[None, :, None] + labels[None, None, :]) % self.colors == color
+
+    def neighbour_sum(self, a: int = 0, b: int = None) -> np.ndarray:
+        """Сумма шести соседей (int8) для слоёв a..b-1; копируются только соседние слои блока, не вся решётка"""
         s = self.spins
-        neigh = (
-            np.roll(s, 1, axis=0) + np.roll(s, -1, axis=0) +
-            np.roll(s, 1, axis=1) + np.roll(s, -1, axis=1) +
-            np.roll(s, 1, axis=2) + np.roll(s, -1, axis=2)
-        )
-        self.neighbour_energy = -0.5 * self.coupling * float(np.sum(s * neigh))
-        self.energy = -0.5 * float(np.sum(s))
+        b = self.size if b is None else b
+        slab = s[a:b]
+        out = s.take(range(a - 1, b - 1), axis=0, mode='wrap')
+        out += s.take(range(a + 1, b + 1), axis=0, mode='wrap')
+        for axis in (1, 2):
+            out += np.roll(slab, 1, axis=axis)
+            out += np.roll(slab, -1, axis=axis)
+        return out
+
+    def update_acceptance_table(self):
+        """Вероятности принятия переворота для всех возможных (спин, сумма соседей): dE = 2s(J·Σ + B)
+        принимает всего 2×13 значений, поэтому экспонента считается только при смене T, B или J"""
+        _, By = self.get_field_components()
+        T_norm = self.temperature_to_normalized(self.temperature_K)
+        key = (T_norm, By, self.coupling, self.alpha)
+        if key == self._acceptance_key:
+            return
+        spin = np.array([-1, 1])[:, None]
+        neighbors = np.arange(-6, 7)[None, :]
+        dE = 2 * spin * (self.coupling * neighbors + By)
+        with np.errstate(over='ignore'):
+            prob = self.alpha * np.exp(-dE / (T_norm + 1e-12))
+        # строка 0 — спин -1, строка 1 — спин +1; столбец — сумма соседей + 6
+        self.acceptance = np.where(dE < 0, 1.0, prob)
+
+        # Вольф: вероятность связи соседей с одинаковыми спинами и связи спина, сонаправленного с полем,
+        # с «призрачным» спином поля
+        self.cluster_bond_prob = 1.0 - np.exp(-2.0 * max(self.coupling, 0.0) / (T_norm + 1e-12))
+        self.ghost_bond_prob = 1.0 - np.exp(-2.0 * abs(By) / (T_norm + 1e-12))
+        # средний размер кластера при этих параметрах — по нему выбирается число кластеров за обновление
+        self.cluster_sizes = Welford()
+        self._acceptance_key = key
+        # статистика имеет смысл только для ряда при одних и тех же параметрах
+        self.reset_statistics()
+
+    def calculate_energy(self) -> float:
+        bonds = 0
+        for a, b in self.slabs():
+            # s·Σсоседей ∈ [-6, 6] — произведение помещается в int8, сумма накапливается в int64
+            bonds += int(np.sum(self.spins[a:b] * self.neighbour_sum(a, b), dtype=np.int64))
+        self.neighbour_energy = -0.5 * self.coupling * float(bonds)
+        self.energy = -0.5 * float(np.sum(self.spins, dtype=np.int64))
         return self.energy
 
     def calculate_magnetization(self) -> float:
         return float(np.mean(self.spins))
 
+    @property
+    def magnetization(self) -> float:
+        """Намагниченность без прохода по решётке: self.energy = -Σs/2 поддерживается всеми обновлениями"""
+        return -2.0 * self.energy / self.spins.size
+
+    def reset_statistics(self):
+        self.energy_stats = BinningAccumulator()
+        self.magnetization_stats = BinningAccumulator()
+        self.abs_magnetization_stats = BinningAccumulator()
+
+    def record_statistics(self):
+        self.energy_stats.add(self.hamiltonian() / self.spins.size)
+        self.magnetization_stats.add(self.magnetization)
+        self.abs_magnetization_stats.add(abs(self.magnetization))
+
+    def statistics(self) -> Dict[str, Any]:
+        """Средние с ошибками и τ_int по шагам с последней смены параметров; χ = N·var(|m|)/T, C = N·var(e)/T²"""
+        n = self.spins.size
+        T_norm = self.temperature_to_normalized(self.temperature_K)
+        return {
+            "samples": self.energy_stats.count,
+            "energy_per_spin": self.energy_stats.summary(),
+            "magnetization": self.magnetization_stats.summary(),
+            "abs_magnetization": self.abs_magnetization_stats.summary(),
+            "susceptibility": n * self.abs_magnetization_stats.variance / T_norm,
+            "heat_capacity": n * self.energy_stats.variance / T_norm ** 2,
+        }
+
     def metropolis_step(self) -> int:
         accepted = 0
-        _, By = self.get_field_components()
-        T_norm = self.temperature_to_normalized(self.temperature_K)
+        acceptance = self.acceptance
 
         for _ in range(self.mc_steps):
             i = int(self.rng.integers(0, self.size))
@@ -116,15 +379,13 @@ class Spin3DSimulator:
                 self.spins[i, j, (k-1) % self.size]
             )
 
-            E_old = -self.coupling * s * neighbors - s * By
-            E_new = -self.coupling * (-s) * neighbors - (-s) * By
-            dE = E_new - E_old
-
-            if dE < 0 or self.rng.random() < self.alpha * np.exp(-dE / (T_norm + 1e-12)):
+            if self.rng.random() < acceptance[int(s > 0), neighbors + 6]:
                 self.spins[i, j, k] = -s
-                delta_neigh = -0.5 * self.coupling * ((-s) - s) * neighbors
-                self.neighbour_energy += float(delta_neigh)
-                self.energy += 2 * (-s)
+                # те же слагаемые, что в calculate_energy: -J·s·Σсоседей по связям и -s/2 от поля
+                # (при size == 1 спин — сам себе сосед, и энергия связей не меняется)
+                if self.size > 1:
+                    self.neighbour_energy += float(2 * self.coupling * s * neighbors)
+                self.energy += float(s)
                 accepted += 1
 
                 if s > 0:
@@ -138,20 +399,138 @@ class Spin3DSimulator:
 
         return accepted
 
+    def checkerboard_sweep(self) -> int:
+        """Проход по всей решётке: подрешётки обновляются по очереди, внутри подрешётки — все спины сразу.
+        Соседи обновляемых спинов в этот момент не меняются, поэтому каждое обновление — обычный
+        Метрополис с детальным балансом"""
+        accepted = 0
+        # таблица в одну строку: индекс 13·[s > 0] + Σсоседей + 6
+        acceptance = self.acceptance.ravel()
+
+        # подрешётка целиком обновляется до следующей; внутри неё блоки независимы
+        for color in range(self.colors):
+            for a, b in self.slabs():
+                s = self.spins[a:b]
+                neighbors = self.neighbour_sum(a, b)
+                prob = acceptance[13 * (s > 0) + neighbors + 6]
+                flip = self.sublattice_mask(a, b, color) & (self.rng.random(s.shape) < prob)
+
+                flipped = np.where(flip, s, np.int8(0))
+                s[flip] *= -1
+                if self.size > 1:
+                    self.neighbour_energy += float(2 * self.coupling * np.sum(flipped * neighbors, dtype=np.int64))
+                self.energy += float(np.sum(flipped, dtype=np.int64))
+
+                delta = flipped.sum(axis=2, dtype=np.int64)
+                self.up_count[a:b] -= delta
+                self.down_count[a:b] += delta
+                accepted += int(np.count_nonzero(flip))
+
+        self.mean_spin_map = (self.up_count - self.down_count) / float(self.size)
+        return accepted
+
+    def _neighbour_indices(self, flat: np.ndarray) -> np.ndarray:
+        """Плоские индексы шести соседей (с периодичностью) для массива плоских индексов, форма (6, len)"""
+        n = self.size
+        n2 = n * n
+        i, j, k = flat // n2, (flat // n) % n, flat % n
+        base_i, base_j, base_k = flat - i * n2, flat - j * n, flat - k
+        return np.stack([
+            base_i + (i + 1) % n * n2, base_i + (i - 1) % n * n2,
+            base_j + (j + 1) % n * n, base_j + (j - 1) % n * n,
+            base_k + (k + 1) % n, base_k + (k - 1) % n,
+        ])
+
+    def wolff_cluster(self) -> int:
+        """Один кластер Вольфа: рост в ширину от случайного спина, каждый слой фронта обрабатывается
+        массивами. Поле учитывается призрачным спином: каждый спин кластера, сонаправленный с полем,
+        связан с ним с вероятностью p_ghost, и такой кластер не переворачивается (рост сразу прекращается).
+        Возвращает число перевёрнутых спинов"""
+        _, By = self.get_field_components()
+        spins = self.spins.reshape(-1)
+        seed = int(self.rng.integers(0, spins.size))
+        s0 = int(spins[seed])
+        ghost_prob = self.ghost_bond_prob if s0 * By > 0 else 0.0
+
+        in_cluster = np.zeros(spins.size, dtype=bool)
+        in_cluster[seed] = True
+        frontier = np.array([seed])
+        members = [frontier]
+        while frontier.size:
+            if ghost_prob and self.rng.random() >= (1.0 - ghost_prob) ** frontier.size:
+                return 0
+            candidates = self._neighbour_indices(frontier).ravel()
+            candidates = candidates[(spins[candidates] == s0) & ~in_cluster[candidates]]
+            candidates = candidates[self.rng.random(candidates.size) < self.cluster_bond_prob]
+            frontier = np.unique(candidates)
+            in_cluster[frontier] = True
+            members.append(frontier)
+        cluster = np.concatenate(members)
+
+        neighbours = self._neighbour_indices(cluster)
+        neighbour_sum = spins[neighbours].sum(axis=0)
+        inner = in_cluster[neighbours].sum()
+        spins[cluster] = -s0
+        # меняются только связи на границе кластера: Σ s·Σсоседей включает внутренние связи дважды
+        if self.size > 1:
+            self.neighbour_energy += float(2 * self.coupling * (s0 * neighbour_sum.sum() - inner))
+        self.energy += float(s0 * cluster.size)
+
+        columns = np.bincount(cluster // self.size, minlength=self.size * self.size).reshape(self.size, self.size)
+        self.up_count -= s0 * columns
+        self.down_count += s0 * columns
+        self.mean_spin_map = (self.up_count - self.down_count) / float(self.size)
+        return int(cluster.size)
+
+    def wolff_update(self) -> int:
+        """Кластеры Вольфа: около N спинов за обновление (не больше mc_steps кластеров).
+
+        Число кластеров выбирается до обновления по среднему размеру прошлых кластеров: остановка
+        по накопленному размеру текущих кластеров зависела бы от состояния, и измерения в точках
+        остановки смещались бы к упорядоченным состояниям"""
+        stats = self.cluster_sizes
+        n_clusters = 1 if not stats.count else min(self.mc_steps, max(1, round(self.spins.size / max(stats.mean, 1.0))))
+        flipped = 0
+        for _ in range(n_clusters):
+            size = self.wolff_cluster()
+            flipped += size
+            stats.add(max(size, 1))
+        return flipped
+
+    def autocorrelation_time(self) -> Optional[float]:
+        """Время автокорреляции |M| (в шагах step) для текущего алгоритма; модуль — потому что
+        без поля кластерные перевороты меняют знак M, и ряд M декоррелирует тривиально"""
+        return self.abs_magnetization_stats.autocorrelation_time()
+
+    def update(self) -> int:
+        """Одно обновление выбранным алгоритмом (проход, случайные спины или кластеры)"""
+        return {
+            "metropolis": self.metropolis_step,
+            "checkerboard": self.checkerboard_sweep,
+            "wolff": self.wolff_update,
+        }[self.algorithm]()
+
+    def hamiltonian(self) -> float:
+        """Энергия, которую выбирает динамика: -J·Σсвязей - B·Σs (в отличие от get_energy для отображения)"""
+        _, By = self.get_field_components()
+        return self.neighbour_energy + 2.0 * By * self.energy
+
     def step(self) -> dict:
         T_norm = self.temperature_to_normalized(self.temperature_K)
         num_mc_updates = max(1, int(T_norm * self.beta))
 
         if self.size >= 100:
             num_mc_updates = max(1, num_mc_updates // 4)
+        if self.algorithm == "wolff":
+            # один проход кластерами (≈N перевёрнутых спинов) вблизи Tc декоррелирует сильнее десятков проходов Метрополиса
+            num_mc_updates = 1
 
         for _ in range(num_mc_updates):
-            self.metropolis_step()
-
-        if self.size < 100:
-            self.calculate_energy()
+            self.update()
 
-        magnetization = float(np.mean(self.spins))
+        # энергия и намагниченность ведутся приращениями от принятых переворотов
+        magnetization = self.magnetization
+        self.record_statistics()
 
         return {
             'energy': self.get_energy(),
@@ -160,8 +539,16 @@ class Spin3DSimulator:
             'field': self.field_strength_T
         }
 
+    def set_algorithm(self, algorithm: str):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+        if algorithm != self.algorithm:
+            self.reset_statistics()
+        self.algorithm = algorithm
+
     def set_temperature(self, T_K: float):
         self.temperature_K = max(0.0, float(T_K))
+        self.update_acceptance_table()
 
     def get_energy(self):
         Bx, By = self.get_field_components()
@@ -170,6 +557,7 @@ class Spin3DSimulator:
     def set_field(self, angle: float, strength_T: float):
         self.field_angle = 0.0
         self.field_strength_T = float(strength_T)
+        self.update_acceptance_table()
 
     def get_2d_layer(self, z: int = None) -> np.ndarray:
         if z is None:
@@ -187,8 +575,173 @@ class Spin3DSimulator:
         return angles
 
 
+class SimulatorRegistry:
+    """Симуляторы по ключу сессии: LRU с ограничением суммарного объёма решёток (max_bytes) и TTL простоя.
+    Вытесненные симуляторы сохраняются в snapshot_dir (если задан) и восстанавливаются при следующем запросе;
+    снимки, не востребованные за TTL, удаляются (проверка каталога не чаще раза в SNAPSHOT_SWEEP_SECONDS)"""
+
+    SNAPSHOT_SWEEP_SECONDS = 60.0
+
+    def __init__(self, max_bytes: int, ttl: float, snapshot_dir: str = ""):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self._data: 'OrderedDict[str, Tuple[Spin3DSimulator, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # снимки вытесненных симуляторов пишутся после освобождения _lock (под замком самого симулятора)
+        self._to_save: List[Tuple[str, Spin3DSimulator]] = []
+        self._swept_at = 0.0
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.restored = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _snapshot_path(self, key: str) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.snapshot_dir, f"M10_{name}.npz")
+
+    def _drop(self, key: str, save: bool):
+        sim, _ = self._data.pop(key)
+        self.nbytes -= sim.nbytes
+        if save and self.snapshot_dir:
+            self._to_save.append((self._snapshot_path(key), sim))
+
+    def _save_dropped(self):
+        """Сохранить снимки вытесненных симуляторов; замок симулятора — чтобы не писать решётку
+        посреди прохода потока, который ещё держит этот симулятор"""
+        with self._lock:
+            to_save, self._to_save = self._to_save, []
+        for path, sim in to_save:
+            try:
+                with sim.lock:
+                    sim.save_snapshot(path)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить снимок M10: {e}")
+
+    def _sweep_snapshots(self, now: float):
+        """Удалить снимки старше TTL: сессии, которые не вернулись, не копят файлы в snapshot_dir"""
+        if not self.snapshot_dir or now - self._swept_at < self.SNAPSHOT_SWEEP_SECONDS:
+            return
+        self._swept_at = now
+        cutoff = time.time() - self.ttl
+        try:
+            entries = list(os.scandir(self.snapshot_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not (entry.name.startswith("M10_") and entry.name.endswith(".npz")):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _restore(self, key: str, size: int) -> Optional[Spin3DSimulator]:
+        if not self.snapshot_dir:
+            return None
+        path = self._snapshot_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            sim = Spin3DSimulator.load_snapshot(path)
+        except Exception as e:
+            logger.warning(f"Не удалось восстановить снимок M10: {e}")
+            return None
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return sim if sim.size == size else None
+
+    def _expire(self, now: float):
+        for key in [key for key, (_, last) in self._data.items() if now - last > self.ttl]:
+            self._drop(key, save=True)
+            self.expired += 1
+
+    def _insert(self, key: str, sim: Spin3DSimulator, now: float):
+        self._data[key] = (sim, now)
+        self.nbytes += sim.nbytes
+        # текущий симулятор не вытесняем, даже если он один больше лимита
+        while self.nbytes > self.max_bytes and len(self._data) > 1:
+            self._drop(next(iter(self._data)), save=True)
+            self.evictions += 1
+
+    def get(self, key: str, size: int, algorithm: str) -> Spin3DSimulator:
+        """Симулятор сессии; при смене размера куба создаётся новый"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            sim = self._data[key][0] if key in self._data else None
+            if sim is not None and sim.size == size:
+                self.hits += 1
+                self._data[key] = (sim, now)
+                self._data.move_to_end(key)
+            else:
+                if sim is not None:
+                    self._drop(key, save=False)
+                self.misses += 1
+                sim = self._restore(key, size)
+                if sim is not None:
+                    self.restored += 1
+                else:
+                    sim = Spin3DSimulator(size=size, algorithm=algorithm)
+                self._insert(key, sim, now)
+        self._save_dropped()
+        self._sweep_snapshots(now)
+        return sim
+
+    def reset(self, key: str, size: int, algorithm: str) -> Spin3DSimulator:
+        sim = Spin3DSimulator(size=size, algorithm=algorithm)
+        with self._lock:
+            if key in self._data:
+                self._drop(key, save=False)
+            self._insert(key, sim, time.monotonic())
+        self._save_dropped()
+        return sim
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._data),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "restored": self.restored,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+simulators = SimulatorRegistry(SIMULATOR_MEMORY_BYTES, SIMULATOR_TTL_SECONDS, SNAPSHOT_DIR)
+
+
+def simulator_session_key(request: HTTPConnection) -> str:
+    """Ключ симулятора: отдельный идентификатор в cookie-сессии (без SessionMiddleware — адрес клиента).
+    Ключ выдаётся уже при отдаче страницы: запись в сессию из WebSocket не попадает в cookie, и
+    без этого поток и HTTP-запросы получили бы разные симуляторы"""
+    if "session" in request.scope:
+        key = request.session.get("m10_simulator")
+        if not key:
+            key = secrets.token_hex(16)
+            request.session["m10_simulator"] = key
+        return key
+    return request.client.host if request.client else "anonymous"
+
+
 @router.get("/", response_class=HTMLResponse)
 async def get_spin_page(request: Request):
+    simulator_session_key(request)
     try:
         return templates.TemplateResponse("physics/M10.html", {"request": request})
     except Exception as e:
@@ -205,37 +758,45 @@ async def get_spin_page(request: Request):
 
 @router.get("/spin", response_class=HTMLResponse)
 async def spin_page(request: Request):
+    simulator_session_key(request)
     try:
         return templates.TemplateResponse("physics/M10.html", {"request": request})
     except Exception as e:
         return HTMLResponse(f"<h1>Error: {str(e)}</h1>", status_code=500)
 
 
-@router.post("/step", response_model=SimulationResponse)
-async def single_step(request: SimulationRequest):
-    global simulator
+def locked_step(simulator: Spin3DSimulator, params: SimulationRequest, render: Callable[[Spin3DSimulator, dict], Any]):
+    """Параметры, шаг и чтение результата (render) под замком симулятора: POST /step и поток
+    одной сессии не меняют решётку одновременно. Вызывается в потоке (asyncio.to_thread)"""
+    with simulator.lock:
+        simulator.set_algorithm(params.algorithm)
+        simulator.set_temperature(params.temperature_K)
+        simulator.set_field(params.field_angle, params.field_strength_T)
+        return render(simulator, simulator.step())
 
-    try:
-        if simulator is None or simulator.size != request.cube_size:
-            simulator = Spin3DSimulator(size=request.cube_size)
 
-        simulator.set_temperature(request.temperature_K)
-        simulator.set_field(request.field_angle, request.field_strength_T)
+def spin_snapshot(simulator: Spin3DSimulator, stats: dict) -> SpinSnapshot:
+    up_counts, down_counts = simulator.get_magnetization_map()
+    return SpinSnapshot(
+        up_count=up_counts.tolist(),
+        down_count=down_counts.tolist(),
+        directions=simulator.get_direction_map().tolist(),
+        energy=stats['energy'],
+        magnetization=stats['magnetization'],
+        temperature=stats['temperature'],
+        field=stats['field'],
+        algorithm=simulator.algorithm,
+        autocorrelation_time=simulator.autocorrelation_time(),
+        statistics=simulator.statistics()
+    )
 
-        stats = simulator.step()
 
-        up_counts, down_counts = simulator.get_magnetization_map()
-        directions = simulator.get_direction_map()
-
-        snapshot = SpinSnapshot(
-            up_count=up_counts.tolist(),
-            down_count=down_counts.tolist(),
-            directions=directions.tolist(),
-            energy=stats['energy'],
-            magnetization=stats['magnetization'],
-            temperature=stats['temperature'],
-            field=stats['field']
-        )
+@router.post("/step", response_model=SimulationResponse)
+async def single_step(request: SimulationRequest, http_request: Request):
+    try:
+        simulator = simulators.get(simulator_session_key(http_request), request.cube_size, request.algorithm)
+        # шаг куба 256³ длится секунды — в потоке, чтобы не блокировать цикл событий
+        snapshot = await asyncio.to_thread(locked_step, simulator, request, spin_snapshot)
 
         return SimulationResponse(
             success=True,
@@ -243,15 +804,369 @@ async def single_step(request: SimulationRequest):
             message="Step completed"
         )
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/reset")
-async def reset_simulation(request: SimulationRequest):
-    global simulator
-    simulator = Spin3DSimulator(size=request.cube_size)
-    simulator.set_temperature(request.temperature_K)
-    simulator.set_field(request.field_angle, request.field_strength_T)
+async def reset_simulation(request: SimulationRequest, http_request: Request):
+    try:
+        simulator = simulators.reset(simulator_session_key(http_request), request.cube_size, request.algorithm)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with simulator.lock:
+        simulator.set_temperature(request.temperature_K)
+        simulator.set_field(request.field_angle, request.field_strength_T)
 
     return {"success": True, "message": "Simulation reset"}
+
+
+# Заголовок бинарного кадра (little-endian): версия, байт на значение up_count, размер куба, номер шага,
+# энергия (float64), намагниченность, температура, поле, время автокорреляции (float32, NaN — нет оценки).
+# За заголовком — up_count (size×size, uint8 или uint16); down_count = size - up_count, направления
+# клиент считает из (up - down) / size
+FRAME_HEADER = struct.Struct("<BBHIdffff")
+FRAME_VERSION = 1
+
+
+def encode_frame(simulator: Spin3DSimulator, stats: dict, step: int) -> bytes:
+    dtype = np.dtype("<u1") if simulator.size < 256 else np.dtype("<u2")
+    tau = simulator.autocorrelation_time()
+    header = FRAME_HEADER.pack(
+        FRAME_VERSION, dtype.itemsize, simulator.size, step,
+        stats['energy'], stats['magnetization'], stats['temperature'], stats['field'],
+        math.nan if tau is None else tau
+    )
+    return header + simulator.up_count.astype(dtype).tobytes()
+
+
+class StreamParams(SimulationRequest):
+    fps: float = 10.0
+
+
+@router.websocket("/stream")
+async def stream_simulation(websocket: WebSocket):
+    """Симуляция на сервере с отправкой бинарных кадров с частотой fps.
+
+    Клиент шлёт JSON: {"type": "params", ...поля SimulationRequest, "fps": ...} — запустить или изменить
+    параметры, {"type": "pause"} / {"type": "resume"}. Раз в секунду сервер присылает
+    {"type": "statistics", ...} (см. Spin3DSimulator.statistics). Если клиент не успевает принимать, неотправленный
+    кадр заменяется новым: в очереди не больше одного кадра, пропущенные кадры не досылаются"""
+    await websocket.accept()
+    key = simulator_session_key(websocket)
+    params: Optional[StreamParams] = None
+    paused = False
+    pending: Optional[bytes] = None
+    frame_ready = asyncio.Event()
+    params_changed = asyncio.Event()
+    step = 0
+    dropped = 0
+
+    async def receive():
+        nonlocal params, paused
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get("type")
+            if kind == "pause":
+                paused = True
+            elif kind == "resume":
+                paused = False
+                params_changed.set()
+            elif kind == "params":
+                try:
+                    params = StreamParams(**{k: v for k, v in message.items() if k != "type"})
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    continue
+                paused = False
+                params_changed.set()
+
+    async def send():
+        nonlocal pending
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, pending = pending, None
+            if frame is not None:
+                await websocket.send_bytes(frame)
+
+    async def produce():
+        nonlocal pending, step, dropped, paused
+        loop = asyncio.get_running_loop()
+        while True:
+            if params is None or paused:
+                params_changed.clear()
+                await params_changed.wait()
+                continue
+            started = loop.time()
+            current = params
+            try:
+                simulator = simulators.get(key, current.cube_size, current.algorithm)
+                frame, statistics = await asyncio.to_thread(
+                    locked_step, simulator, current,
+                    lambda sim, stats: (encode_frame(sim, stats, step + 1), sim.statistics())
+                )
+            except ValueError as e:
+                paused = True
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            step += 1
+            if pending is not None:
+                dropped += 1
+            pending = frame
+            frame_ready.set()
+            fps = min(max(current.fps, 0.1), STREAM_MAX_FPS)
+            # накопленная статистика — раз в секунду, отдельным текстовым сообщением
+            if step % max(1, int(fps)) == 0:
+                await websocket.send_json({"type": "statistics", **statistics})
+            await asyncio.sleep(max(0.0, 1.0 / fps - (loop.time() - started)))
+
+    tasks = [asyncio.create_task(coro()) for coro in (receive, send, produce)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка потока M10: {e}", exc_info=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+        logger.info(f"Поток M10 закрыт: кадров {step}, пропущено {dropped}")
+
+
+class TemperatureScanRequest(BaseModel):
+    cube_size: int = Field(8, ge=2, le=64)
+    T_min_K: float = Field(600.0, gt=0)
+    T_max_K: float = Field(2000.0, gt=0)
+    n_temperatures: int = Field(16, ge=2, le=64)
+    field_strength_T: float = 0.0
+    algorithm: str = "checkerboard"
+    n_thermalization: int = Field(200, ge=0, le=20000)
+    n_sweeps: int = Field(1000, ge=SCAN_BINS, le=100000)
+    swap_interval: int = Field(5, ge=1, le=1000)
+
+
+def run_replica_block(task: dict) -> dict:
+    """Процесс пула: блок соседних по температуре реплик живёт в процессе несколько раундов обмена.
+    Реплики продвигаются по swap_interval обновлений, после каждого раунда соседям внутри блока
+    предлагается обмен температурами (чётные и нечётные пары по очереди). Измерения пишутся для
+    шагов с номера measure_from (до него — термализация)"""
+    temperatures = task['temperatures_K']
+    betas = [1.0 / Spin3DSimulator.temperature_to_normalized(T) for T in temperatures]
+    *seeds, swap_seed = task['seed'].spawn(len(temperatures) + 1)
+    rng = np.random.default_rng(swap_seed)
+    sims = []
+    for spins, seed, T in zip(task['replicas'], seeds, temperatures):
+        sim = Spin3DSimulator.from_spins(spins, task['algorithm'], seed=seed)
+        sim.set_temperature(T)
+        sim.set_field(0.0, task['field_strength_T'])
+        sims.append(sim)
+    n = sims[0].spins.size
+    K = len(sims)
+    step, end = task['first_step'], task['first_step'] + task['n_steps']
+    n_measured = max(0, end - max(step, task['measure_from']))
+    energies = np.empty((K, n_measured))
+    magnetizations = np.empty((K, n_measured))
+    swaps_tried = np.zeros(max(K - 1, 0))
+    swaps_done = np.zeros(max(K - 1, 0))
+    parity = task['parity']
+    while step < end:
+        n_steps = min(task['swap_interval'], end - step)
+        for _ in range(n_steps):
+            measured = step - max(task['first_step'], task['measure_from'])
+            for t, sim in enumerate(sims):
+                sim.update()
+                if measured >= 0:
+                    energies[t, measured] = sim.hamiltonian() / n
+                    magnetizations[t, measured] = abs(sim.magnetization)
+            step += 1
+        for t in range(parity % 2, K - 1, 2):
+            swaps_tried[t] += 1
+            delta = (betas[t] - betas[t + 1]) * (sims[t].hamiltonian() - sims[t + 1].hamiltonian())
+            if delta >= 0 or rng.random() < np.exp(delta):
+                sims[t], sims[t + 1] = sims[t + 1], sims[t]
+                sims[t].set_temperature(temperatures[t])
+                sims[t + 1].set_temperature(temperatures[t + 1])
+                swaps_done[t] += 1
+        parity += 1
+    return {
+        'replicas': [sim.spins for sim in sims],
+        'energy': [sim.hamiltonian() for sim in sims],
+        'energies': energies,
+        'magnetizations': magnetizations,
+        'swaps_tried': swaps_tried,
+        'swaps_done': swaps_done,
+    }
+
+
+_scan_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_scan_pool() -> ProcessPoolExecutor:
+    global _scan_pool
+    if _scan_pool is None:
+        _scan_pool = ProcessPoolExecutor(max_workers=SCAN_WORKERS)
+    return _scan_pool
+
+
+async def run_replica_blocks(tasks: List[dict]) -> List[dict]:
+    """Блоки реплик параллельно в пуле процессов; если пул сломан — пересоздаём его и считаем в потоке"""
+    global _scan_pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.gather(*(loop.run_in_executor(_get_scan_pool(), run_replica_block, task) for task in tasks))
+    except BrokenProcessPool:
+        logger.warning("Пул реплик M10 сломан, пересоздаю")
+        _scan_pool = None
+        return [await asyncio.to_thread(run_replica_block, task) for task in tasks]
+
+
+def scan_observables(energies: np.ndarray, magnetizations: np.ndarray, T_norm: float, n_spins: int) -> Dict[str, float]:
+    """Средние по ряду измерений при одной температуре и ошибки по блокам: ⟨|m|⟩, ⟨e⟩,
+    χ = N·var(|m|)/T и C = N·var(e)/T² (энергия и температура в безразмерных единицах модели).
+    Ошибки — разброс оценок по SCAN_BINS последовательным блокам ряда"""
+    def estimates(e, m):
+        return np.array([m.mean(), e.mean(), n_spins * m.var() / T_norm, n_spins * e.var() / T_norm ** 2])
+
+    total = estimates(energies, magnetizations)
+    blocks = np.array([
+        estimates(e, m) for e, m in zip(np.array_split(energies, SCAN_BINS), np.array_split(magnetizations, SCAN_BINS))
+    ])
+    errors = blocks.std(axis=0, ddof=1) / np.sqrt(SCAN_BINS)
+    names = ('magnetization', 'energy', 'susceptibility', 'heat_capacity')
+    result = {name: float(value) for name, value in zip(names, total)}
+    result.update({f"{name}_error": float(error) for name, error in zip(names, errors)})
+    return result
+
+
+def scan_blocks(K: int, n_blocks: int, wave: int) -> List[Tuple[int, int]]:
+    """Разбиение температур на n_blocks соседних блоков; на нечётных волнах границы сдвинуты на
+    полблока, чтобы пары на границах тоже регулярно обменивались внутри процесса"""
+    edges = np.linspace(0, K, n_blocks + 1).astype(int)
+    if wave % 2:
+        edges[1:-1] += int(np.diff(edges).min()) // 2
+    return list(zip(edges[:-1], edges[1:]))
+
+
+async def temperature_scan(params: TemperatureScanRequest) -> dict:
+    """Параллельный отжиг (replica exchange): K реплик при температурах от T_min до T_max (геометрическая
+    сетка), каждые swap_interval обновлений соседним по температуре репликам предлагается обмен
+    температурами с вероятностью min(1, exp((β_i - β_j)(E_i - E_j))).
+
+    Реплики разбиты на блоки соседних температур; блок живёт в процессе пула несколько раундов обмена
+    (волна ≈ SCAN_TASK_UPDATES обновлений спинов, но при нескольких блоках не больше SCAN_WAVE_ROUNDS
+    раундов), между волнами решётки возвращаются и обмениваются пары на границах блоков, а границы
+    сдвигаются. Так каждая пара пробует обмен не реже раза в SCAN_WAVE_ROUNDS раундов, а передач решёток
+    в пул в SCAN_WAVE_ROUNDS раз меньше, чем раундов"""
+    if params.algorithm not in ALGORITHMS:
+        raise ValueError(f"Неизвестный алгоритм: {params.algorithm}")
+    if params.T_max_K <= params.T_min_K:
+        raise ValueError("T_max_K должна быть больше T_min_K")
+    K = params.n_temperatures
+    n_spins = params.cube_size ** 3
+    total_steps = params.n_thermalization + params.n_sweeps
+    work = K * n_spins * total_steps
+    if work > SCAN_MAX_UPDATES:
+        raise ValueError(f"Слишком большой расчёт: {work:.3g} обновлений спинов, допустимо {SCAN_MAX_UPDATES:.3g}")
+    n_rounds = math.ceil(total_steps / params.swap_interval)
+    if K * n_rounds > SCAN_MAX_ROUNDS:
+        raise ValueError(f"Слишком много раундов обмена: {K} реплик × {n_rounds} раундов, допустимо {SCAN_MAX_ROUNDS:.3g}; "
+                         f"увеличьте swap_interval")
+
+    temperatures = np.geomspace(params.T_min_K, params.T_max_K, K)
+    betas = 1.0 / np.array([Spin3DSimulator.temperature_to_normalized(T) for T in temperatures])
+    seeds = np.random.SeedSequence()
+    rng = np.random.default_rng(seeds.spawn(1)[0])
+    # replicas[t] — решётка реплики, находящейся при температуре t
+    replicas = [Spin3DSimulator(params.cube_size, params.algorithm, seed=seed).spins for seed in seeds.spawn(K)]
+    series_e = [[] for _ in range(K)]
+    series_m = [[] for _ in range(K)]
+    swaps_tried = np.zeros(K - 1)
+    swaps_done = np.zeros(K - 1)
+
+    # в блоке не меньше двух реплик, иначе все обмены шли бы только между волнами
+    n_blocks = max(1, min(SCAN_WORKERS, K // 2))
+    block_updates = math.ceil(K / n_blocks) * n_spins * params.swap_interval
+    rounds_per_wave = max(1, min(n_rounds, SCAN_TASK_UPDATES // block_updates))
+    if n_blocks > 1:
+        rounds_per_wave = min(rounds_per_wave, SCAN_WAVE_ROUNDS)
+    deadline = time.monotonic() + SCAN_TIMEOUT
+    done_steps = 0
+    wave = 0
+    while done_steps < total_steps:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Сканирование не уложилось в {SCAN_TIMEOUT:g} с")
+        n_steps = min(rounds_per_wave * params.swap_interval, total_steps - done_steps)
+        blocks = scan_blocks(K, n_blocks, wave)
+        tasks = [{
+            'replicas': replicas[lo:hi],
+            'temperatures_K': temperatures[lo:hi].tolist(),
+            'field_strength_T': params.field_strength_T,
+            'algorithm': params.algorithm,
+            'swap_interval': params.swap_interval,
+            'first_step': done_steps,
+            'n_steps': n_steps,
+            'measure_from': params.n_thermalization,
+            'parity': lo + done_steps // params.swap_interval,
+            'seed': seed,
+        } for (lo, hi), seed in zip(blocks, seeds.spawn(len(blocks)))]
+        results = await run_replica_blocks(tasks)
+
+        energies = np.empty(K)
+        for (lo, hi), result in zip(blocks, results):
+            replicas[lo:hi] = result['replicas']
+            energies[lo:hi] = result['energy']
+            swaps_tried[lo:hi - 1] += result['swaps_tried']
+            swaps_done[lo:hi - 1] += result['swaps_done']
+            for t in range(lo, hi):
+                if result['energies'].shape[1]:
+                    series_e[t].append(result['energies'][t - lo])
+                    series_m[t].append(result['magnetizations'][t - lo])
+        done_steps += n_steps
+
+        # пары на границах блоков
+        for _, t in blocks[:-1]:
+            swaps_tried[t - 1] += 1
+            delta = (betas[t - 1] - betas[t]) * (energies[t - 1] - energies[t])
+            if delta >= 0 or rng.random() < np.exp(delta):
+                replicas[t - 1], replicas[t] = replicas[t], replicas[t - 1]
+                swaps_done[t - 1] += 1
+        wave += 1
+
+    points = []
+    for t in range(K):
+        e = np.concatenate(series_e[t]) if series_e[t] else np.zeros(0)
+        m = np.concatenate(series_m[t]) if series_m[t] else np.zeros(0)
+        point = {'temperature_K': float(temperatures[t])}
+        point.update(scan_observables(e, m, 1.0 / betas[t], n_spins))
+        points.append(point)
+    return {
+        'points': points,
+        'swap_acceptance': (swaps_done / np.maximum(swaps_tried, 1)).tolist(),
+        'n_measurements': params.n_sweeps,
+        'n_waves': wave,
+    }
+
+
+@router.post("/scan")
+async def run_temperature_scan(params: TemperatureScanRequest):
+    try:
+        started = time.monotonic()
+        result = await temperature_scan(params)
+        return {"success": True, **result, "elapsed_s": round(time.monotonic() - started, 3)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка сканирования M10: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sessions")
+async def get_simulator_registry_stats():
+    return {"success": True, **simulators.stats()}
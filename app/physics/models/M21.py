@@ -2,12 +2,21 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import io
+import asyncio
 import base64
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 from scipy import linalg
-from typing import Tuple, List, Dict, Optional
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator, gmres
+from scipy.special import ellipk
+from typing import Any, Tuple, List, Dict, Optional
 import logging
+import os
+import threading
 import warnings
+from collections import OrderedDict
 
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, Field, model_validator
@@ -19,13 +28,74 @@ router = APIRouter(prefix="/M21", tags=["Physics M21"])
 
 EPSILON_0 = 8.854187817e-12  # Ф/м
 
+# Сколько памяти могут занимать закешированные LU-разложения (запросы, отличающиеся только V, не решают СЛАУ заново)
+FACTORIZATION_CACHE_BYTES = int(os.getenv("M21_FACTORIZATION_CACHE_MB", 256)) * 1024 * 1024
+
+# Начиная с этого числа панелей плотная матрица не строится: GMRES с treecode-оператором (память ~ N log N)
+ITERATIVE_SOLVER_THRESHOLD = int(os.getenv("M21_ITERATIVE_THRESHOLD", 4000))
+# Панелей в ячейке нижнего уровня treecode и пар «панель — ячейка» за один проход умножения
+TREECODE_LEAF_SIZE = 16
+TREECODE_SEPARATION = 2
+TREECODE_CHUNK = 200_000
+GMRES_TOL = 1e-5
+GMRES_RESTART = 50
+GMRES_MAXITER = 4
+# FFT-оператор пластин точный (без мультипольного приближения), поэтому и допуск строже
+FFT_GMRES_TOL = 1e-8
+# Узлов Гаусса–Лежандра на пояс в осесимметричной постановке
+RING_QUADRATURE = 8
+
+# Ограничения n_divisions: 3D-сетка (direct / iterative) и решатели, которые масштабируются (fft, axisym)
+MAX_DIVISIONS_3D = 100
+MAX_DIVISIONS_FAST = 300
+# Плотная матрица (solver=direct) — не больше стольких панелей
+DIRECT_SOLVER_MAX_ELEMENTS = 8000
+
+# Расчёт поля для картинки: бюджет памяти на промежуточные массивы, и с какого числа панелей
+# дальние ячейки заменяются мультипольным разложением (FIELD_LEAF_SIZE панелей в ячейке,
+# «дальние» — дальше FIELD_MULTIPOLE_RATIO радиусов ячейки)
+FIELD_MEMORY_BUDGET = int(os.getenv("M21_FIELD_MEMORY_MB", 64)) * 1024 * 1024
+FIELD_MULTIPOLE_THRESHOLD = 20000
+FIELD_LEAF_SIZE = 64
+FIELD_MULTIPOLE_RATIO = 4.0
+
+# PNG полей рисуются в отдельных процессах (matplotlib медленный и держит GIL) и кешируются по параметрам запроса
+RENDER_WORKERS = int(os.getenv("M21_RENDER_WORKERS", 1))
+IMAGE_CACHE_BYTES = int(os.getenv("M21_IMAGE_CACHE_MB", 32)) * 1024 * 1024
+
+
+class BEMMesh:
+    """Сетка граничных элементов в виде структуры массивов: центры (N, 3), площади (N,)
+    и номер тела (0 — первая сфера/пластина, 1 — вторая) лежат в непрерывных массивах NumPy"""
+
+    __slots__ = ('centers', 'areas', 'body_ids')
+
+    def __init__(self, centers: np.ndarray, areas: np.ndarray, body_ids: np.ndarray):
+        self.centers = np.ascontiguousarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.areas = np.ascontiguousarray(areas, dtype=np.float64).ravel()
+        self.body_ids = np.ascontiguousarray(body_ids, dtype=np.int8).ravel()
+
+    def __len__(self) -> int:
+        return self.areas.shape[0]
+
+    @classmethod
+    def concat(cls, *meshes: 'BEMMesh') -> 'BEMMesh':
+        return cls(
+            np.concatenate([m.centers for m in meshes]),
+            np.concatenate([m.areas for m in meshes]),
+            np.concatenate([m.body_ids for m in meshes]),
+        )
+
+    def body_mask(self, body_id: int) -> np.ndarray:
+        return self.body_ids == body_id
+
+    def count(self, body_id: int) -> int:
+        return int(np.count_nonzero(self.body_mask(body_id)))
 
-class SphereElement:
-    def __init__(self, center: np.ndarray, area: float, sphere_id: int):
-        self.center = center
-        self.area = area
-        self.sphere_id = sphere_id
-        self.charge_density = 0.0
+    def body_center(self, body_id: int) -> np.ndarray:
+        """Средняя точка панелей тела (для сферы — её центр)"""
+        pts = self.centers[self.body_mask(body_id)]
+        return pts.mean(axis=0) if pts.size else np.zeros(3)
 
 
 class ElectrostaticsRequest(BaseModel):
@@ -34,7 +104,11 @@ class ElectrostaticsRequest(BaseModel):
     R2: float = Field(..., gt=0, le=1.0, description="Радиус второй сферы / полуразмер пластины (м)")
     d: float = Field(..., ge=0, le=10.0, description="Расстояние между центрами (м)")
     V: float = Field(..., gt=0, le=1000, description="Разность потенциалов (В)")
-    n_divisions: int = Field(10, ge=3, le=100, description="Количество делений сетки")
+    n_divisions: int = Field(10, ge=3, le=MAX_DIVISIONS_FAST, description="Количество делений сетки")
+    solver: str = Field("auto", description="Метод решения: auto | direct | iterative | fft | axisym")
+    field_dtype: str = Field("float64", description="Точность расчёта поля для картинки: float64 | float32")
+    field_multipole: Optional[bool] = Field(None, description="Мультипольное приближение поля (None — по размеру сетки)")
+    render: str = Field("png", description="png — картинка с сервера | data — массивы float32 (base64) для отрисовки в браузере")
 
     @model_validator(mode='after')
     def validate_distance(self) -> 'ElectrostaticsRequest':
@@ -65,72 +139,325 @@ class ElectrostaticsResponse(BaseModel):
     C_numerical: float
     C_analytical: float
     n_elements: int
-    field_img: str
+    cache_hit: bool = False
+    solver: str = "direct"
+    field_img: str = ""
+    field_data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
 
-def generate_sphere_mesh(radius: float, center: np.ndarray, n_divisions: int, sphere_id: int = 0) -> List[SphereElement]:
-    elements = []
+def generate_sphere_mesh(radius: float, center: np.ndarray, n_divisions: int, sphere_id: int = 0) -> BEMMesh:
     theta_values = np.linspace(0, np.pi, n_divisions + 1)
     phi_values = np.linspace(0, 2 * np.pi, n_divisions + 1)
+    theta_mid = (theta_values[:-1] + theta_values[1:]) / 2
+    phi_mid = (phi_values[:-1] + phi_values[1:]) / 2
 
-    for i in range(n_divisions):
-        for j in range(n_divisions):
-            theta1, theta2 = theta_values[i], theta_values[i + 1]
-            phi1, phi2 = phi_values[j], phi_values[j + 1]
-            theta_mid = (theta1 + theta2) / 2
-            phi_mid = (phi1 + phi2) / 2
+    # индексы (i, j) = (theta, phi), порядок панелей тот же, что у построчного обхода
+    sin_t = np.sin(theta_mid)[:, None]
+    cos_t = np.cos(theta_mid)[:, None]
+    centers = np.empty((n_divisions, n_divisions, 3))
+    centers[..., 0] = center[0] + radius * sin_t * np.cos(phi_mid)[None, :]
+    centers[..., 1] = center[1] + radius * sin_t * np.sin(phi_mid)[None, :]
+    centers[..., 2] = center[2] + radius * cos_t
 
-            x = center[0] + radius * np.sin(theta_mid) * np.cos(phi_mid)
-            y = center[1] + radius * np.sin(theta_mid) * np.sin(phi_mid)
-            z = center[2] + radius * np.cos(theta_mid)
+    band = np.cos(theta_values[:-1]) - np.cos(theta_values[1:])
+    areas = np.abs(radius ** 2 * np.outer(band, np.diff(phi_values)))
+    return BEMMesh(centers, areas, np.full(n_divisions * n_divisions, sphere_id))
 
-            area = radius ** 2 * (phi2 - phi1) * (np.cos(theta1) - np.cos(theta2))
-            elem = SphereElement(np.array([x, y, z]), abs(area), sphere_id)
-            elements.append(elem)
-    return elements
 
-
-def generate_plate_mesh(half_size: float, z_center: float, n_divisions: int, sphere_id: int = 0) -> List[SphereElement]:
-    elements = []
+def generate_plate_mesh(half_size: float, z_center: float, n_divisions: int, sphere_id: int = 0) -> BEMMesh:
     coords = np.linspace(-half_size, half_size, n_divisions + 1)
     dx = coords[1] - coords[0]
-    area = dx ** 2
+    mids = (coords[:-1] + coords[1:]) / 2
 
-    for i in range(n_divisions):
-        for j in range(n_divisions):
-            x = (coords[i] + coords[i + 1]) / 2
-            y = (coords[j] + coords[j + 1]) / 2
-            elem = SphereElement(np.array([x, y, z_center]), area, sphere_id)
-            elements.append(elem)
-    return elements
+    centers = np.empty((n_divisions, n_divisions, 3))
+    centers[..., 0] = mids[:, None]
+    centers[..., 1] = mids[None, :]
+    centers[..., 2] = z_center
+    areas = np.full(n_divisions * n_divisions, dx ** 2)
+    return BEMMesh(centers, areas, np.full(n_divisions * n_divisions, sphere_id))
 
 
-def calculate_potential_matrix(elements: List[SphereElement]) -> np.ndarray:
-    centers = np.array([e.center for e in elements])
-    areas = np.array([e.area for e in elements])
+def calculate_potential_matrix(mesh: BEMMesh) -> np.ndarray:
+    centers = mesh.centers
 
-    diff = centers[:, None, :] - centers[None, :, :]
-    r_mat = np.linalg.norm(diff, axis=2)
+    # квадраты расстояний накапливаются по координатам: без промежуточного массива N×N×3
+    r_mat = np.zeros((len(mesh), len(mesh)))
+    for k in range(3):
+        col = centers[:, k]
+        r_mat += np.subtract.outer(col, col) ** 2
+    np.sqrt(r_mat, out=r_mat)
 
-    with np.errstate(divide='ignore', invalid='ignore'):
-        A = np.where(r_mat > 0, 1.0 / (4 * np.pi * EPSILON_0 * r_mat), 0.0)
+    with np.errstate(divide='ignore'):
+        A = np.divide(1.0, 4 * np.pi * EPSILON_0 * r_mat, out=r_mat)
+    A[np.isinf(A)] = 0.0
 
-    r_equiv = np.sqrt(areas / np.pi)
+    r_equiv = np.sqrt(mesh.areas / np.pi)
     np.fill_diagonal(A, 1.0 / (4 * np.pi * EPSILON_0 * r_equiv))
     return A
 
 
+def _expand_ranges(starts_a: np.ndarray, counts_a: np.ndarray,
+                   starts_b: np.ndarray, counts_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Все пары (i, j), i ∈ [starts_a, starts_a + counts_a), j ∈ [starts_b, starts_b + counts_b),
+    для каждой пары диапазонов; внутри пары — построчно (i старший)"""
+    sizes = counts_a * counts_b
+    owner = np.repeat(np.arange(len(sizes)), sizes)
+    offset = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    width = counts_b[owner]
+    return starts_a[owner] + offset // width, starts_b[owner] + offset % width
+
+
+# соседи ячейки — в пределах TREECODE_SEPARATION ячеек по каждой оси; дальше работает мультипольное разложение
+_NEIGHBOR_RANGE = range(-TREECODE_SEPARATION, TREECODE_SEPARATION + 1)
+_NEIGHBOR_OFFSETS = np.array([(i, j, k) for i in _NEIGHBOR_RANGE for j in _NEIGHBOR_RANGE for k in _NEIGHBOR_RANGE])
+_CHILD_OFFSETS = np.array([(i, j, k) for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+
+
+class _GridLevel:
+    """Непустые ячейки одного уровня равномерной сетки и панели, отсортированные по ячейкам"""
+
+    def __init__(self, coords: np.ndarray, origin: np.ndarray, width: float, centers: np.ndarray):
+        self.span = int(coords.max()) + 2 * TREECODE_SEPARATION + 1
+        keys = self.encode(coords)
+        self.keys, self.cell_of = np.unique(keys, return_inverse=True)
+        self.coords = self.decode(self.keys)
+        self.cell_centers = origin + (self.coords + 0.5) * width
+        self.order = np.argsort(self.cell_of, kind='stable')
+        self.counts = np.bincount(self.cell_of, minlength=len(self.keys))
+        self.starts = np.cumsum(self.counts) - self.counts
+
+        # базис мультиполей панели относительно центра её ячейки: 1, d, квадруполь (xx, yy, zz, xy, xz, yz)
+        d = centers - self.cell_centers[self.cell_of]
+        d2 = np.einsum('ij,ij->i', d, d)
+        self.basis = np.column_stack([
+            np.ones(len(d)), d,
+            3 * d[:, 0] ** 2 - d2, 3 * d[:, 1] ** 2 - d2, 3 * d[:, 2] ** 2 - d2,
+            3 * d[:, 0] * d[:, 1], 3 * d[:, 0] * d[:, 2], 3 * d[:, 1] * d[:, 2],
+        ])
+
+    def encode(self, coords: np.ndarray) -> np.ndarray:
+        c = coords + TREECODE_SEPARATION
+        return (c[..., 0] * self.span + c[..., 1]) * self.span + c[..., 2]
+
+    def decode(self, keys: np.ndarray) -> np.ndarray:
+        return np.stack([keys // self.span ** 2, keys // self.span % self.span, keys % self.span], axis=-1) - TREECODE_SEPARATION
+
+    def find(self, coords: np.ndarray) -> np.ndarray:
+        """Индексы ячеек с данными координатами (−1 — ячейки нет или она пуста)"""
+        inside = np.all((coords >= -TREECODE_SEPARATION) & (coords < self.span - TREECODE_SEPARATION), axis=-1)
+        keys = self.encode(coords)
+        idx = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(inside & (self.keys[idx] == keys), idx, -1)
+
+    def moments(self, x: np.ndarray) -> np.ndarray:
+        """Заряд, диполь и квадруполь каждой ячейки для зарядов панелей x, shape (ячейки, 10)"""
+        weighted = self.basis * x[:, None]
+        return np.stack([np.bincount(self.cell_of, weighted[:, c], minlength=len(self.keys))
+                         for c in range(weighted.shape[1])], axis=1)
+
+
+class TreecodeOperator(LinearOperator):
+    """Умножение на матрицу потенциалов без хранения N×N (treecode в духе Барнса–Хата).
+
+    Панели раскладываются по уровням равномерной сетки (ячейка нижнего уровня — около TREECODE_LEAF_SIZE
+    панелей, каждый следующий уровень вдвое крупнее). Соседние ячейки нижнего уровня взаимодействуют точно
+    (разреженная матрица ближнего поля), дальние — через мультипольное разложение ячейки (заряд, диполь,
+    квадруполь) на самом крупном уровне, где ячейки ещё не соседи. Память и время умножения ~ N log N.
+    Ядро безразмерное по 1/(4πε0): матрица из calculate_potential_matrix равна этому оператору,
+    умноженному на 1/(4πε0) (иначе элементы ~1e10 и невязка GMRES упирается в округление).
+    """
+
+    def __init__(self, mesh: BEMMesh, leaf_size: Optional[int] = None):
+        n = len(mesh)
+        super().__init__(dtype=np.float64, shape=(n, n))
+        leaf_size = leaf_size or TREECODE_LEAF_SIZE
+        self.centers = mesh.centers
+        self.areas = mesh.areas
+
+        width = float(np.sqrt(leaf_size * mesh.areas.mean()))
+        origin = self.centers.min(axis=0) - 0.5 * width
+        coords = np.floor((self.centers - origin) / width).astype(np.int64)
+
+        # уровни до тех пор, пока все ячейки не станут соседями друг друга
+        self.levels: List[_GridLevel] = []
+        level = 0
+        while True:
+            self.levels.append(_GridLevel(coords >> level, origin, width * 2 ** level, self.centers))
+            if int((coords >> level).max()) <= TREECODE_SEPARATION:
+                break
+            level += 1
+
+        self.order = self.levels[0].order
+        self.near = self._near_field()
+        self.diagonal = np.empty(n)
+        self.diagonal[self.order] = self.near.diagonal()
+
+        # списки взаимодействий: (панель-приёмник, ячейка-источник) на каждом уровне
+        self.far_pairs = []
+        for level in self.levels[:-1]:
+            cand = ((level.coords >> 1)[:, None, None, :] + _NEIGHBOR_OFFSETS[None, :, None, :]) * 2 \
+                + _CHILD_OFFSETS[None, None, :, :]
+            cand = cand.reshape(len(level.keys), -1, 3)
+            found = level.find(cand)
+            far = (found >= 0) & (np.abs(cand - level.coords[:, None, :]).max(axis=-1) > TREECODE_SEPARATION)
+            cells, slots = np.nonzero(far)
+            sources = found[cells, slots]
+            pos, src = _expand_ranges(level.starts[cells], level.counts[cells], sources, np.ones_like(sources))
+            self.far_pairs.append((level.order[pos].astype(np.int32), src.astype(np.int32)))
+
+    def _near_field(self) -> csr_matrix:
+        """Точные взаимодействия соседних ячеек нижнего уровня. Строки и столбцы — в порядке leaf.order
+        (панели одной ячейки подряд), поэтому CSR собирается сразу, по частям не больше TREECODE_CHUNK"""
+        leaf = self.levels[0]
+        nb = leaf.find(leaf.coords[:, None, :] + _NEIGHBOR_OFFSETS[None, :, :])
+        nb = np.sort(np.where(nb >= 0, nb, len(leaf.keys)), axis=1)
+        degree = (nb < len(leaf.keys)).sum(axis=1)
+        starts = np.append(leaf.starts, 0)[nb]
+        counts = np.append(leaf.counts, 0)[nb]
+
+        # тройки (строка, начало, длина диапазона столбцов); строки идут по возрастанию
+        cell_of_row = leaf.cell_of[leaf.order]
+        row_nnz = (counts * (nb < len(leaf.keys))).sum(axis=1)[cell_of_row]
+        indptr = np.concatenate([[0], np.cumsum(row_nnz)])
+        row_ids = np.repeat(np.arange(len(cell_of_row)), degree[cell_of_row])
+        slot = np.arange(len(row_ids)) - np.repeat(np.cumsum(degree[cell_of_row]) - degree[cell_of_row], degree[cell_of_row])
+        range_start = starts[cell_of_row[row_ids], slot]
+        range_count = counts[cell_of_row[row_ids], slot]
+
+        data = np.empty(int(indptr[-1]))
+        indices = np.empty(int(indptr[-1]), dtype=np.int32)
+        sorted_centers = self.centers[leaf.order]
+        sorted_self = 1.0 / np.sqrt(self.areas[leaf.order] / np.pi)
+        bounds = np.cumsum(range_count)
+        begin = 0
+        while begin < len(row_ids):
+            end = max(begin + 1, int(np.searchsorted(bounds, bounds[begin] - range_count[begin] + TREECODE_CHUNK)))
+            i, j = _expand_ranges(row_ids[begin:end], np.ones(end - begin, dtype=np.int64),
+                                  range_start[begin:end], range_count[begin:end])
+            diff = sorted_centers[i] - sorted_centers[j]
+            r = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            with np.errstate(divide='ignore'):
+                values = np.where(r > 0, 1.0 / r, 0.0)
+            values[i == j] = sorted_self[i[i == j]]
+            offset = int(bounds[begin] - range_count[begin])
+            data[offset:offset + len(values)] = values
+            indices[offset:offset + len(values)] = j
+            begin = end
+        return csr_matrix((data, indices, indptr), shape=self.shape)
+
+    def _matvec(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float64).ravel()
+        out = np.empty_like(x)
+        out[self.order] = self.near @ x[self.order]
+        far = np.zeros_like(out)
+        for level, (targets, sources) in zip(self.levels, self.far_pairs):
+            moments = level.moments(x)
+            for start in range(0, len(targets), TREECODE_CHUNK):
+                t = targets[start:start + TREECODE_CHUNK]
+                c = sources[start:start + TREECODE_CHUNK]
+                R = self.centers[t] - level.cell_centers[c]
+                m = moments[c]
+                inv_r2 = 1.0 / np.einsum('ij,ij->i', R, R)
+                inv_r = np.sqrt(inv_r2)
+                inv_r3 = inv_r * inv_r2
+                inv_r5 = 0.5 * inv_r3 * inv_r2
+                phi = m[:, 0] * inv_r + np.einsum('ij,ij->i', m[:, 1:4], R) * inv_r3
+                quad = (m[:, 4] * R[:, 0] ** 2 + m[:, 5] * R[:, 1] ** 2 + m[:, 6] * R[:, 2] ** 2
+                        + 2 * (m[:, 7] * R[:, 0] * R[:, 1] + m[:, 8] * R[:, 0] * R[:, 2] + m[:, 9] * R[:, 1] * R[:, 2]))
+                phi += quad * inv_r5
+                far += np.bincount(t, phi, minlength=len(far))
+        return out + far
+
+
+def evaluate_field(points: np.ndarray, centers: np.ndarray, charges: np.ndarray,
+                   memory_budget: Optional[int] = None, dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """Поле (P, 3) и потенциал (P,) точечных зарядов панелей в точках points.
+
+    Панели обрабатываются блоками так, чтобы промежуточные массивы «точки × панели блока»
+    укладывались в memory_budget байт (по умолчанию FIELD_MEMORY_BUDGET); dtype=np.float32 — вдвое меньше
+    памяти и быстрее, точности хватает для картинки. Точки, совпадающие с панелью, её вклад не получают.
+    """
+    dtype = np.dtype(dtype)
+    memory_budget = memory_budget or FIELD_MEMORY_BUDGET
+    # одновременно живут около 6 массивов размера (точки × блок)
+    block = max(1, int(memory_budget // (6 * dtype.itemsize * max(len(points), 1))))
+
+    pts = points.astype(dtype)
+    src = centers.astype(dtype)
+    k = (np.asarray(charges, dtype=np.float64) / (4 * np.pi * EPSILON_0)).astype(dtype)
+    E = np.zeros((len(points), 3))
+    phi = np.zeros(len(points))
+    for start in range(0, len(src), block):
+        r = pts[:, None, :] - src[None, start:start + block, :]
+        r2 = np.einsum('pbk,pbk->pb', r, r)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.where(r2 > 1e-20, k[None, start:start + block] / np.sqrt(r2), 0.0).astype(dtype)
+        phi += w.sum(axis=1)
+        w /= np.where(r2 > 1e-20, r2, 1.0)
+        E += np.einsum('pb,pbk->pk', w, r)
+    return E, phi
+
+
+def evaluate_field_multipole(points: np.ndarray, mesh: BEMMesh, charges: np.ndarray,
+                             leaf_size: int = FIELD_LEAF_SIZE, dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """Поле с мультипольным приближением: панели группируются в ячейки равномерной сетки (~leaf_size панелей),
+    точки дальше FIELD_MULTIPOLE_RATIO радиусов ячейки получают поле её заряда, диполя и квадруполя,
+    ближние — точную сумму по панелям ячейки. Время ~ точки × (ячейки + ближние панели)."""
+    width = float(np.sqrt(leaf_size * mesh.areas.mean()))
+    origin = mesh.centers.min(axis=0) - 0.5 * width
+    coords = np.floor((mesh.centers - origin) / width).astype(np.int64)
+    grid = _GridLevel(coords, origin, width, mesh.centers)
+    moments = grid.moments(np.asarray(charges, dtype=np.float64)) / (4 * np.pi * EPSILON_0)
+    radius = np.zeros(len(grid.keys))
+    np.maximum.at(radius, grid.cell_of, np.linalg.norm(mesh.centers - grid.cell_centers[grid.cell_of], axis=1))
+
+    E = np.zeros((len(points), 3))
+    phi = np.zeros(len(points))
+    for cell in range(len(grid.keys)):
+        R = points - grid.cell_centers[cell]
+        r2 = np.einsum('ij,ij->i', R, R)
+        near = r2 <= (FIELD_MULTIPOLE_RATIO * radius[cell]) ** 2
+        if near.any():
+            members = grid.order[grid.starts[cell]:grid.starts[cell] + grid.counts[cell]]
+            E_near, phi_near = evaluate_field(points[near], mesh.centers[members], charges[members], dtype=dtype)
+            E[near] += E_near
+            phi[near] += phi_near
+        far = ~near
+        R, r2 = R[far], r2[far]
+        m = moments[cell]
+        inv_r2 = 1.0 / r2
+        inv_r3 = np.sqrt(inv_r2) * inv_r2
+        inv_r5 = inv_r3 * inv_r2
+        D = m[1:4]
+        # квадруполь в полной форме: Θ·R и Rᵀ·Θ·R
+        theta = np.array([[m[4], m[7], m[8]], [m[7], m[5], m[9]], [m[8], m[9], m[6]]])
+        theta_R = R @ theta
+        RtR = np.einsum('ij,ij->i', R, theta_R)
+        DR = R @ D
+        E[far] += (R * (m[0] * inv_r3 + 3 * DR * inv_r5 + 2.5 * RtR * inv_r5 * inv_r2)[:, None]
+                   - D[None, :] * inv_r3[:, None] - theta_R * inv_r5[:, None])
+        phi[far] += m[0] * np.sqrt(inv_r2) + DR * inv_r3 + 0.5 * RtR * inv_r5
+    return E, phi
+
+
 def calculate_field_on_plane(
     result: Dict,
     plane: str = 'xy',
     z_coord: float = 0.0,
     grid_size: int = 50,
-    extent: float = None
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-
-    elements = result['elements']
-    charges = result['charges']
+    extent: float = None,
+    memory_budget: Optional[int] = None,
+    dtype=np.float64,
+    multipole: Optional[bool] = None,
+    return_potential: bool = False
+) -> Tuple[np.ndarray, ...]:
+    """Поле на сетке grid_size×grid_size в плоскости; память ограничена memory_budget (байт),
+    multipole=None — мультипольное приближение дальних ячеек, если панелей не меньше FIELD_MULTIPOLE_THRESHOLD.
+    return_potential — пятым элементом вернуть потенциал на той же сетке."""
+
+    mesh: BEMMesh = result['mesh']
+    q = np.asarray(result['charges'])
     mode = result.get('mode', 'separated')
 
     if extent is None:
@@ -156,25 +483,17 @@ def calculate_field_on_plane(
         Y, Z = np.meshgrid(ys, zs)
         X = np.full_like(Y, z_coord)
 
-    centers = np.array([e.center for e in elements])
-    q = np.array(charges)
-
-    center_by_id = {}
-    for sid in (0, 1):
-        pts = np.array([e.center for e in elements if e.sphere_id == sid])
-        center_by_id[sid] = pts.mean(axis=0) if pts.size else np.array([0.0, 0.0, 0.0])
-
-    rx = X[None] - centers[:, 0, None, None]
-    ry = Y[None] - centers[:, 1, None, None]
-    rz = Z[None] - centers[:, 2, None, None]
-    r3 = (rx ** 2 + ry ** 2 + rz ** 2) ** 1.5
-
-    mask = r3 > 1e-30
-    k = q[:, None, None] / (4 * np.pi * EPSILON_0)
+    center_by_id = {sid: mesh.body_center(sid) for sid in (0, 1)}
 
-    Ex = np.sum(np.where(mask, k * rx / r3, 0.0), axis=0)
-    Ey = np.sum(np.where(mask, k * ry / r3, 0.0), axis=0)
-    Ez = np.sum(np.where(mask, k * rz / r3, 0.0), axis=0)
+    points = np.column_stack([X.ravel(), Y.ravel(), Z.ravel()])
+    if multipole is None:
+        multipole = len(mesh) >= FIELD_MULTIPOLE_THRESHOLD
+    if multipole:
+        E, phi = evaluate_field_multipole(points, mesh, q, dtype=dtype)
+    else:
+        E, phi = evaluate_field(points, mesh.centers, q, memory_budget=memory_budget, dtype=dtype)
+    Ex, Ey, Ez = (E[:, k].reshape(X.shape) for k in range(3))
+    phi = phi.reshape(X.shape)
 
     if mode == 'separated':
         c0 = center_by_id.get(0, np.array([0.0, 0.0, 0.0]))
@@ -232,26 +551,23 @@ def calculate_field_on_plane(
             Ez = np.where(mask_zero, 0.0, Ez)
 
     if plane == 'xy':
-        return X, Y, Ex, Ey
+        fields = X, Y, Ex, Ey
     elif plane == 'xz':
-        return X, Z, Ex, Ez
+        fields = X, Z, Ex, Ez
     else:
-        return Y, Z, Ey, Ez
+        fields = Y, Z, Ey, Ez
+    return (*fields, phi) if return_potential else fields
 
 
-def solve_electrostatics(
-    R1: float, R2: float, d: float, V: float, n_divisions: int = 10, mode: str = 'separated'
-) -> Dict:
-    logger.info(f"Расчёт: mode={mode}, R1={R1}, R2={R2}, d={d}, V={V}, n={n_divisions}")
-
+def build_mesh(mode: str, R1: float, R2: float, d: float, n_divisions: int) -> BEMMesh:
     if mode == 'separated':
         if d <= R1 + R2:
             raise ValueError("Сферы пересекаются! Увеличьте расстояние d")
 
         center1 = np.array([0.0, 0.0, 0.0])
         center2 = np.array([d,   0.0, 0.0])
-        elements1 = generate_sphere_mesh(R1, center1, n_divisions, sphere_id=0)
-        elements2 = generate_sphere_mesh(R2, center2, n_divisions, sphere_id=1)
+        mesh1 = generate_sphere_mesh(R1, center1, n_divisions, sphere_id=0)
+        mesh2 = generate_sphere_mesh(R2, center2, n_divisions, sphere_id=1)
 
     elif mode == 'concentric':
         if abs(R1 - R2) < 1e-6:
@@ -259,59 +575,408 @@ def solve_electrostatics(
 
         center1 = np.array([0.0, 0.0, 0.0])
         center2 = np.array([d,   0.0, 0.0])
-        elements1 = generate_sphere_mesh(R1, center1, n_divisions, sphere_id=0)
-        elements2 = generate_sphere_mesh(R2, center2, n_divisions, sphere_id=1)
+        mesh1 = generate_sphere_mesh(R1, center1, n_divisions, sphere_id=0)
+        mesh2 = generate_sphere_mesh(R2, center2, n_divisions, sphere_id=1)
 
     elif mode == 'plates':
         if d <= 0:
             raise ValueError("Расстояние между пластинами d должно быть > 0")
-        elements1 = generate_plate_mesh(R1, -d / 2, n_divisions, sphere_id=0)
-        elements2 = generate_plate_mesh(R2,  d / 2, n_divisions, sphere_id=1)
+        mesh1 = generate_plate_mesh(R1, -d / 2, n_divisions, sphere_id=0)
+        mesh2 = generate_plate_mesh(R2,  d / 2, n_divisions, sphere_id=1)
 
     else:
         raise ValueError(f"Неизвестный режим: {mode}")
 
-    all_elements = elements1 + elements2
-    n_total = len(all_elements)
-    logger.info(f"Элементов: {len(elements1)} + {len(elements2)} = {n_total}")
+    logger.info(f"Элементов: {len(mesh1)} + {len(mesh2)} = {len(mesh1) + len(mesh2)}")
+    return BEMMesh.concat(mesh1, mesh2)
+
+
+class Factorization:
+    """Решение системы для одной геометрии при V = 1 В (и LU-разложение, если решали прямым методом).
+    Система линейна по V, поэтому заряды для любого напряжения — unit_charges * V."""
+
+    __slots__ = ('mesh', 'lu', 'piv', 'unit_charges', 'solver', 'n_unknowns')
+
+    def __init__(self, mesh: BEMMesh, lu: Optional[np.ndarray], piv: Optional[np.ndarray],
+                 unit_charges: np.ndarray, solver: str = 'direct', n_unknowns: Optional[int] = None):
+        self.mesh = mesh
+        self.lu = lu
+        self.piv = piv
+        self.unit_charges = unit_charges
+        self.solver = solver
+        # число неизвестных системы (в осесимметричной постановке — колец, а не панелей mesh)
+        self.n_unknowns = len(mesh) if n_unknowns is None else n_unknowns
+
+    @property
+    def nbytes(self) -> int:
+        factor = self.lu.nbytes + self.piv.nbytes if self.lu is not None else 0
+        return (factor + self.unit_charges.nbytes
+                + self.mesh.centers.nbytes + self.mesh.areas.nbytes + self.mesh.body_ids.nbytes)
 
-    A = calculate_potential_matrix(all_elements)
+    def solve(self, potentials: np.ndarray) -> np.ndarray:
+        """Обратная подстановка для произвольных потенциалов панелей"""
+        rhs = np.append(potentials, 0.0)
+        return linalg.lu_solve((self.lu, self.piv), rhs, check_finite=False)[:-1]
 
-    n = len(all_elements)
+
+def factorize_system(mesh: BEMMesh) -> Factorization:
+    A = calculate_potential_matrix(mesh)
+
+    n = len(mesh)
     M = np.zeros((n + 1, n + 1))
     M[:n, :n] = A
     M[:n, n] = -1.0
     M[n, :n] = 1.0
 
-    b = np.zeros(n + 1)
-    b[:n] = np.array([V / 2.0 if e.sphere_id == 0 else -V / 2.0 for e in all_elements])
-    b[n] = 0.0
-
     try:
-        cond = np.linalg.cond(M[:n, :n])
+        cond = np.linalg.cond(A)
     except Exception:
         cond = np.linalg.cond(M)
-    M_reg = M.copy()
     if cond > 1e12:
         diag_mean = np.mean(np.abs(np.diag(A))) if np.any(np.diag(A)) else 1.0
         reg = max(1e-16, 1e-9 * diag_mean)
         logger.warning(f"Матрица плохо обусловлена (cond={cond:.3e}), добавляю регуляризацию {reg:.3e}")
-        M_reg[:n, :n] += np.eye(n) * reg
+        M[:n, :n] += np.eye(n) * reg
+    del A
 
     try:
         with warnings.catch_warnings():
             warnings.simplefilter('ignore', category=linalg.LinAlgWarning)
-            sol = linalg.solve(M_reg, b)
-        q = sol[:n]
+            lu, piv = linalg.lu_factor(M, overwrite_a=True, check_finite=False)
+    except (linalg.LinAlgError, ValueError) as e:
+        logger.error(f"Ошибка СЛАУ: {e}")
+        raise ValueError("Не удалось решить систему уравнений. Попробуйте другие параметры.")
+
+    factorization = Factorization(mesh, lu, piv, np.empty(0))
+    # потенциалы ±1/2 В: первое тело +V/2, второе −V/2
+    unit_charges = factorization.solve(np.where(mesh.body_ids == 0, 0.5, -0.5))
+    if not np.all(np.isfinite(unit_charges)):
+        logger.error("Ошибка СЛАУ: вырожденная матрица")
+        raise ValueError("Не удалось решить систему уравнений. Попробуйте другие параметры.")
+    factorization.unit_charges = unit_charges
+    return factorization
+
+
+class PlateFFTOperator(LinearOperator):
+    """Оператор плоского конденсатора с одинаковыми пластинами на равномерной сетке n×n.
+
+    Ядро зависит только от разности индексов панелей (блочно-тёплицево), поэтому собственное и взаимное
+    взаимодействие пластин — двумерные свёртки, которые считаются через FFT с дополнением нулями до 2n×2n.
+    Память O(N), умножение O(N log N). Порядок панелей — как в generate_plate_mesh (i по x, j по y),
+    сначала пластина 0, затем 1. Ядро безразмерное по 1/(4πε0), как у TreecodeOperator.
+    """
+
+    def __init__(self, half_size: float, d: float, n_divisions: int):
+        n = n_divisions
+        super().__init__(dtype=np.float64, shape=(2 * n * n, 2 * n * n))
+        self.n = n
+        self.size = 2 * n
+        h = 2 * half_size / n
+
+        offsets = np.arange(-(n - 1), n)
+        di, dj = np.meshgrid(offsets, offsets, indexing='ij')
+        rho2 = (di ** 2 + dj ** 2) * h ** 2
+        with np.errstate(divide='ignore'):
+            self_kernel = 1.0 / np.sqrt(rho2)
+        self_kernel[n - 1, n - 1] = 1.0 / np.sqrt(h ** 2 / np.pi)
+        mutual_kernel = 1.0 / np.sqrt(rho2 + d ** 2)
+
+        self.self_hat = self._spectrum(self_kernel)
+        self.mutual_hat = self._spectrum(mutual_kernel)
+        self.diagonal = np.full(self.shape[0], self_kernel[n - 1, n - 1])
+
+    def _spectrum(self, kernel: np.ndarray) -> np.ndarray:
+        # смещение k кладётся в ячейку k mod 2n: циклическая свёртка совпадает с линейной на n×n
+        circulant = np.zeros((self.size, self.size))
+        n = self.n
+        idx = np.arange(-(n - 1), n) % self.size
+        circulant[np.ix_(idx, idx)] = kernel
+        return np.fft.rfft2(circulant)
+
+    def _matvec(self, x: np.ndarray) -> np.ndarray:
+        n = self.n
+        x = np.asarray(x, dtype=np.float64).ravel()
+        bottom = np.fft.rfft2(x[:n * n].reshape(n, n), s=(self.size, self.size))
+        top = np.fft.rfft2(x[n * n:].reshape(n, n), s=(self.size, self.size))
+        out = np.empty_like(x)
+        out[:n * n] = np.fft.irfft2(bottom * self.self_hat + top * self.mutual_hat, s=(self.size, self.size))[:n, :n].ravel()
+        out[n * n:] = np.fft.irfft2(top * self.self_hat + bottom * self.mutual_hat, s=(self.size, self.size))[:n, :n].ravel()
+        return out
+
+
+def solve_iterative(mesh: BEMMesh, op: Optional[LinearOperator] = None, solver: str = 'iterative',
+                    tol: float = GMRES_TOL) -> Factorization:
+    """GMRES без плотной матрицы: с treecode-оператором или переданным op (например, PlateFFTOperator).
+    У op должен быть атрибут diagonal, ядро — безразмерное по 1/(4πε0).
+
+    Предобуславливание — симметричное масштабирование диагональю (Якоби): S = D^-1/2 A D^-1/2.
+    Блочный Якоби не годится: на сферах блоки у полюсов знаконеопределённы.
+    Условие Q1 + Q2 = 0 исключается через два решения с одной матрицей: A x1 = φ(±1/2), A x2 = 1,
+    тогда q = x1 + c·x2, где c подбирается так, чтобы сумма зарядов была нулевой.
+    """
+    if op is None:
+        op = TreecodeOperator(mesh)
+    scale = 1.0 / np.sqrt(op.diagonal)
+    scaled = LinearOperator(op.shape, matvec=lambda y: scale * op.matvec(scale * np.ravel(y)), dtype=np.float64)
+
+    solutions = []
+    for rhs in (np.where(mesh.body_ids == 0, 0.5, -0.5), np.ones(len(mesh))):
+        y, info = gmres(scaled, scale * rhs, tol=tol, atol=0.0,
+                        restart=GMRES_RESTART, maxiter=GMRES_MAXITER)
+        if info < 0 or not np.all(np.isfinite(y)):
+            logger.error(f"Ошибка GMRES: info={info}")
+            raise ValueError("Не удалось решить систему уравнений. Попробуйте другие параметры.")
+        if info > 0:
+            logger.warning(f"GMRES не сошёлся за {info} итераций, результат приближённый")
+        solutions.append(scale * y)
+
+    x1, x2 = solutions
+    unit_charges = (x1 - x1.sum() / x2.sum() * x2) * (4 * np.pi * EPSILON_0)
+    return Factorization(mesh, None, None, unit_charges, solver=solver)
+
+
+class RingMesh:
+    """Осесимметричная сетка сфер: кольца-пояса между полярными углами theta_lo..theta_hi,
+    отсчитанными от оси x (ось симметрии — прямая через центры сфер)"""
+
+    __slots__ = ('radius', 'axis_center', 'theta_lo', 'theta_hi', 'body_ids')
+
+    def __init__(self, radius, axis_center, theta_lo, theta_hi, body_ids):
+        self.radius = np.asarray(radius, dtype=np.float64)
+        self.axis_center = np.asarray(axis_center, dtype=np.float64)
+        self.theta_lo = np.asarray(theta_lo, dtype=np.float64)
+        self.theta_hi = np.asarray(theta_hi, dtype=np.float64)
+        self.body_ids = np.asarray(body_ids, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return self.radius.shape[0]
+
+    @classmethod
+    def sphere(cls, radius: float, axis_center: float, n_rings: int, body_id: int) -> 'RingMesh':
+        edges = np.linspace(0, np.pi, n_rings + 1)
+        return cls(np.full(n_rings, radius), np.full(n_rings, axis_center), edges[:-1], edges[1:],
+                   np.full(n_rings, body_id))
+
+    @classmethod
+    def concat(cls, *meshes: 'RingMesh') -> 'RingMesh':
+        return cls(*(np.concatenate([getattr(m, name) for m in meshes]) for name in cls.__slots__))
+
+    def point(self, theta: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(координата вдоль оси, расстояние до оси) точек колец при полярных углах theta"""
+        return self.axis_center + self.radius * np.cos(theta), self.radius * np.sin(theta)
+
+    @property
+    def areas(self) -> np.ndarray:
+        return 2 * np.pi * self.radius ** 2 * (np.cos(self.theta_lo) - np.cos(self.theta_hi))
+
+    def to_mesh(self, n_azimuth: int) -> BEMMesh:
+        """3D-сетка из колец (n_azimuth панелей на кольцо) — для расчёта поля по готовым зарядам"""
+        phi = (np.arange(n_azimuth) + 0.5) * 2 * np.pi / n_azimuth
+        axial, rho = self.point((self.theta_lo + self.theta_hi) / 2)
+        centers = np.empty((len(self), n_azimuth, 3))
+        centers[..., 0] = axial[:, None]
+        centers[..., 1] = rho[:, None] * np.cos(phi)
+        centers[..., 2] = rho[:, None] * np.sin(phi)
+        return BEMMesh(centers, np.repeat(self.areas / n_azimuth, n_azimuth),
+                       np.repeat(self.body_ids, n_azimuth))
+
+
+def ring_kernel(axial_x: np.ndarray, rho_x: np.ndarray, axial_y: np.ndarray, rho_y: np.ndarray) -> np.ndarray:
+    """Потенциал в точке (axial_x, rho_x) от кольца с единичным зарядом (axial_y, rho_y), без множителя 1/(4πε0):
+    2 K(m) / (π √((ρx + ρy)² + Δa²)), m = 4 ρx ρy / ((ρx + ρy)² + Δa²)"""
+    dist2 = (rho_x + rho_y) ** 2 + (axial_x - axial_y) ** 2
+    m = 4 * rho_x * rho_y / dist2
+    return 2 * ellipk(np.minimum(m, 1.0 - 1e-16)) / (np.pi * np.sqrt(dist2))
+
+
+def calculate_ring_matrix(rings: RingMesh) -> np.ndarray:
+    """Матрица потенциалов осесимметричной задачи: A[i, j] — потенциал в середине пояса i
+    от единичного заряда, равномерно распределённого по поясу j.
+
+    Интеграл по поясу — Гаусс–Лежандр по полярному углу с весом sin θ (равномерная плотность на сфере).
+    На собственном поясе ядро логарифмически особое: пояс делится в точке коллокации, и на половинах
+    делается замена θ = θ_mid ± h t², которая убирает особенность под квадратурой.
+    """
+    n = len(rings)
+    theta_mid = (rings.theta_lo + rings.theta_hi) / 2
+    half = (rings.theta_hi - rings.theta_lo) / 2
+    band = np.cos(rings.theta_lo) - np.cos(rings.theta_hi)
+    axial_x, rho_x = rings.point(theta_mid)
+
+    nodes, weights = np.polynomial.legendre.leggauss(RING_QUADRATURE)
+    A = np.zeros((n, n))
+    for t, w in zip(nodes, weights):
+        theta = theta_mid + half * t
+        axial_y, rho_y = rings.point(theta)
+        weight = w * half * np.sin(theta) / band
+        A += ring_kernel(axial_x[:, None], rho_x[:, None], axial_y[None, :], rho_y[None, :]) * weight[None, :]
+
+    # собственный пояс: θ = θ_mid ± h t², dθ = 2 h t dt, t ∈ [0, 1]
+    nodes01, weights01 = (nodes + 1) / 2, weights / 2
+    self_term = np.zeros(n)
+    for sign in (-1.0, 1.0):
+        for t, w in zip(nodes01, weights01):
+            theta = theta_mid + sign * half * t ** 2
+            axial_y, rho_y = rings.point(theta)
+            self_term += ring_kernel(axial_x, rho_x, axial_y, rho_y) * (w * 2 * half * t) * np.sin(theta) / band
+    A[np.arange(n), np.arange(n)] = self_term
+    return A / (4 * np.pi * EPSILON_0)
+
+
+def solve_axisymmetric(mode: str, R1: float, R2: float, d: float, n_divisions: int) -> Factorization:
+    """Сферы (separated / concentric) в осесимметричной постановке: n_divisions колец на сферу вместо
+    n_divisions² панелей. Для расчёта поля заряды колец раскладываются на 3D-сетку (RingMesh.to_mesh)."""
+    if mode not in ('separated', 'concentric'):
+        raise ValueError(f"Осесимметричная постановка доступна только для сфер, а не для режима {mode}")
+    if mode == 'separated' and d <= R1 + R2:
+        raise ValueError("Сферы пересекаются! Увеличьте расстояние d")
+    if mode == 'concentric' and abs(R1 - R2) < 1e-6:
+        raise ValueError("Радиусы вложенных сфер должны различаться")
+
+    rings = RingMesh.concat(RingMesh.sphere(R1, 0.0, n_divisions, 0), RingMesh.sphere(R2, d, n_divisions, 1))
+    n = len(rings)
+    M = np.zeros((n + 1, n + 1))
+    # решаем в единицах 4πε0, иначе элементы ~1e10 рядом с ±1 строки ограничения портят обусловленность
+    M[:n, :n] = calculate_ring_matrix(rings) * (4 * np.pi * EPSILON_0)
+    M[:n, n] = -1.0
+    M[n, :n] = 1.0
+    rhs = np.append(np.where(rings.body_ids == 0, 0.5, -0.5), 0.0)
+    try:
+        ring_charges = linalg.solve(M, rhs, check_finite=False)[:n] * (4 * np.pi * EPSILON_0)
     except linalg.LinAlgError as e:
         logger.error(f"Ошибка СЛАУ: {e}")
         raise ValueError("Не удалось решить систему уравнений. Попробуйте другие параметры.")
 
-    for i, elem in enumerate(all_elements):
-        elem.charge_density = q[i] / elem.area
+    mesh = rings.to_mesh(n_divisions)
+    unit_charges = np.repeat(ring_charges / n_divisions, n_divisions)
+    return Factorization(mesh, None, None, unit_charges, solver='axisym', n_unknowns=n)
+
+
+class FactorizationCache:
+    """LRU, ограниченный суммарным объёмом в байтах: разложения по геометрии (mode, R1, R2, d, n_divisions)
+    и готовые PNG полей. sizeof — размер элемента (по умолчанию атрибут nbytes)"""
+
+    def __init__(self, max_bytes: int, sizeof=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda item: item.nbytes)
+        self._data: 'OrderedDict[tuple, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key: tuple, item: Any):
+        size = self.sizeof(item)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= self.sizeof(old)
+            self._data[key] = item
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+factorization_cache = FactorizationCache(FACTORIZATION_CACHE_BYTES)
+
+
+def resolve_solver(solver: str, mode: str, R1: float, R2: float, n_divisions: int) -> str:
+    """auto — для сфер осесимметричная постановка (axisym); для одинаковых пластин — GMRES с FFT-свёрткой
+    (fft) на любой сетке; для разных пластин прямой метод на небольших сетках, начиная с
+    ITERATIVE_SOLVER_THRESHOLD панелей — GMRES с treecode (iterative). direct и iterative для сфер —
+    полная 3D-сетка (для проверки)."""
+    plates_fft = mode == 'plates' and R1 == R2
+    spheres = mode in ('separated', 'concentric')
+    if solver == 'auto':
+        if spheres:
+            solver = 'axisym'
+        elif plates_fft:
+            solver = 'fft'
+        elif 2 * n_divisions ** 2 < ITERATIVE_SOLVER_THRESHOLD:
+            solver = 'direct'
+        else:
+            solver = 'iterative'
+    if solver not in ('direct', 'iterative', 'fft', 'axisym'):
+        raise ValueError(f"Неизвестный метод решения: {solver}")
+    if solver == 'axisym' and not spheres:
+        raise ValueError("Метод axisym доступен только для сфер (separated, concentric)")
+    if solver in ('direct', 'iterative') and n_divisions > MAX_DIVISIONS_3D:
+        raise ValueError(f"Для 3D-сетки (метод {solver}) n_divisions не больше {MAX_DIVISIONS_3D}")
+    if solver == 'direct' and 2 * n_divisions ** 2 > DIRECT_SOLVER_MAX_ELEMENTS:
+        raise ValueError(f"Прямой метод — не больше {DIRECT_SOLVER_MAX_ELEMENTS} панелей, используйте iterative")
+    if solver == 'fft' and not plates_fft:
+        raise ValueError("Метод fft доступен только для пластин одинакового размера (R1 = R2)")
+    return solver
+
+
+def get_factorization(mode: str, R1: float, R2: float, d: float, n_divisions: int,
+                      solver: str = 'auto') -> Tuple[Factorization, bool]:
+    """Решение для геометрии из кеша или новое; второй элемент — было ли оно в кеше"""
+    solver = resolve_solver(solver, mode, R1, R2, n_divisions)
+    key = (mode, float(R1), float(R2), float(d), int(n_divisions), solver)
+    cached = factorization_cache.get(key)
+    if cached is not None:
+        return cached, True
+    if solver == 'axisym':
+        factorization = solve_axisymmetric(mode, R1, R2, d, n_divisions)
+        factorization_cache.put(key, factorization)
+        return factorization, False
+
+    mesh = build_mesh(mode, R1, R2, d, n_divisions)
+    if solver == 'fft':
+        factorization = solve_iterative(mesh, PlateFFTOperator(R1, d, n_divisions), solver='fft', tol=FFT_GMRES_TOL)
+    elif solver == 'iterative':
+        factorization = solve_iterative(mesh)
+    else:
+        factorization = factorize_system(mesh)
+    factorization_cache.put(key, factorization)
+    return factorization, False
 
-    Q1 = float(np.sum(q[[e.sphere_id == 0 for e in all_elements]]))
-    Q2 = float(np.sum(q[[e.sphere_id == 1 for e in all_elements]]))
+
+def solve_electrostatics(
+    R1: float, R2: float, d: float, V: float, n_divisions: int = 10, mode: str = 'separated',
+    solver: str = 'auto'
+) -> Dict:
+    logger.info(f"Расчёт: mode={mode}, R1={R1}, R2={R2}, d={d}, V={V}, n={n_divisions}, solver={solver}")
+
+    factorization, cache_hit = get_factorization(mode, R1, R2, d, n_divisions, solver)
+    mesh = factorization.mesh
+    n_total = factorization.n_unknowns
+    q = factorization.unit_charges * V
+
+    Q1 = float(np.sum(q[mesh.body_mask(0)]))
+    Q2 = float(np.sum(q[mesh.body_mask(1)]))
 
     C_numerical = abs(Q1) / V
 
@@ -329,12 +994,15 @@ def solve_electrostatics(
 
     return {
         'mode': mode,
-        'elements': all_elements,
-        'charges': q.tolist(),
+        'mesh': mesh,
+        'charges': q,
+        'charge_density': q / mesh.areas,
         'Q1': Q1, 'Q2': Q2,
         'C_numerical': C_numerical,
         'C_isolated':  C_spherical,
         'n_elements': n_total,
+        'cache_hit': cache_hit,
+        'solver': factorization.solver,
         'R1': R1, 'R2': R2, 'd': d, 'V': V,
     }
 
@@ -347,13 +1015,10 @@ def calculate_capacitance_theoretical(R1: float, R2: float) -> Dict[str, float]:
     return {'C_isolated_1': C_isolated_1, 'C_isolated_2': C_isolated_2, 'C_spherical': C_spherical}
 
 
-def create_field_visualization(result: Dict) -> str:
+def field_plot_data(result: Dict, dtype=np.float64, multipole: Optional[bool] = None) -> Dict:
+    """Всё, что нужно для картинки поля: сетка сечения, поле, потенциал и параметры тел (без сетки панелей,
+    чтобы данные можно было дёшево передать в процесс отрисовки или клиенту)"""
     mode = result.get('mode', 'separated')
-    R1, R2, d = result['R1'], result['R2'], result['d']
-
-    fig, ax = plt.subplots(figsize=(14, 8))
-    ax.set_facecolor('#0d0d1a')
-
     if mode == 'plates':
         plane = 'xz'
         grid_size = 60
@@ -364,7 +1029,34 @@ def create_field_visualization(result: Dict) -> str:
         plane = 'xy'
         grid_size = 60
 
-    X, Y, Ex, Ey = calculate_field_on_plane(result, plane=plane, z_coord=0.0, grid_size=grid_size)
+    X, Y, Ex, Ey, phi = calculate_field_on_plane(result, plane=plane, z_coord=0.0, grid_size=grid_size,
+                                                 dtype=dtype, multipole=multipole, return_potential=True)
+
+    mesh = result.get('mesh')
+    if mesh is not None and len(mesh):
+        c0 = mesh.body_center(0)
+        c1 = mesh.body_center(1)
+    else:
+        c0 = np.array([0.0, 0.0, 0.0]); c1 = np.array([0.0, 0.0, 0.0])
+
+    return {
+        'mode': mode, 'plane': plane, 'grid_size': grid_size,
+        'X': X, 'Y': Y, 'Ex': Ex, 'Ey': Ey, 'potential': phi,
+        'c0': c0, 'c1': c1,
+        'R1': result['R1'], 'R2': result['R2'], 'd': result['d'],
+        'V': result['V'], 'Q1': result['Q1'], 'Q2': result['Q2'],
+    }
+
+
+def render_field_png(data: Dict) -> str:
+    """PNG (base64) по данным field_plot_data; выполняется в процессе отрисовки"""
+    mode, plane, grid_size = data['mode'], data['plane'], data['grid_size']
+    R1, R2, d = data['R1'], data['R2'], data['d']
+    X, Y, Ex, Ey = data['X'], data['Y'], data['Ex'], data['Ey']
+    c0, c1 = data['c0'], data['c1']
+
+    fig, ax = plt.subplots(figsize=(14, 8))
+    ax.set_facecolor('#0d0d1a')
 
     E_magnitude = np.sqrt(Ex ** 2 + Ey ** 2)
 
@@ -374,13 +1066,6 @@ def create_field_visualization(result: Dict) -> str:
     except Exception:
         contour = ax.pcolormesh(X, Y, E_plot, cmap='plasma', shading='auto')
 
-    elts = result.get('elements', [])
-    if elts:
-        c0 = np.mean([e.center for e in elts if e.sphere_id == 0], axis=0)
-        c1 = np.mean([e.center for e in elts if e.sphere_id == 1], axis=0)
-    else:
-        c0 = np.array([0.0, 0.0, 0.0]); c1 = np.array([0.0, 0.0, 0.0])
-
     if mode == 'concentric':
         if R1 <= R2:
             inner_r, outer_r = R1, R2; inner_c, outer_c = c0, c1
@@ -462,13 +1147,6 @@ def create_field_visualization(result: Dict) -> str:
         ax.add_patch(ring2_top)
 
     if mode == 'concentric':
-        elts = result.get('elements', [])
-        if elts:
-            c0 = np.mean([e.center for e in elts if e.sphere_id == 0], axis=0)
-            c1 = np.mean([e.center for e in elts if e.sphere_id == 1], axis=0)
-        else:
-            c0 = np.array([0.0, 0.0, 0.0]); c1 = np.array([0.0, 0.0, 0.0])
-
         if R1 <= R2:
             inner_center, outer_center = c0, c1
             inner_r, outer_r = R1, R2
@@ -513,25 +1191,20 @@ def create_field_visualization(result: Dict) -> str:
         ax.add_patch(ring1)
         ax.add_patch(ring2)
 
-    try:
-        _ = result.get('elements', [])
-    except Exception as e:
-        logger.warning(f"charge overlay warning: {e}")
-
     ax.set_xlabel('X (м)', fontsize=12)
     ax.set_ylabel('Y (м)', fontsize=12)
     if mode == 'plates':
         title = (f'Поле плоского конденсатора (сечение XZ)\n'
-                 f'V={result["V"]:.1f} В,  d={d:.3f} м,  '
-                 f'Q₁={result["Q1"]:.3e} Кл')
+                 f'V={data["V"]:.1f} В,  d={d:.3f} м,  '
+                 f'Q₁={data["Q1"]:.3e} Кл')
     elif mode == 'concentric':
         title = (f'Поле концентрических сфер (сечение XZ)\n'
-                 f'V={result["V"]:.1f} В,  R₁={R1:.3f} м,  R₂={R2:.3f} м,  '
-                 f'Q₁={result["Q1"]:.3e} Кл')
+                 f'V={data["V"]:.1f} В,  R₁={R1:.3f} м,  R₂={R2:.3f} м,  '
+                 f'Q₁={data["Q1"]:.3e} Кл')
     else:
         title = (f'Силовые линии электрического поля (сечение XY)\n'
-                 f'V={result["V"]:.1f} В,  d={d:.3f} м,  '
-                 f'Q₁={result["Q1"]:.3e} Кл,  Q₂={result["Q2"]:.3e} Кл')
+                 f'V={data["V"]:.1f} В,  d={d:.3f} м,  '
+                 f'Q₁={data["Q1"]:.3e} Кл,  Q₂={data["Q2"]:.3e} Кл')
 
     ax.set_title(title, fontsize=13, pad=12, color='white')
     ax.tick_params(colors='white')
@@ -560,22 +1233,96 @@ def create_field_visualization(result: Dict) -> str:
     return img
 
 
+def create_field_visualization(result: Dict, dtype=np.float64, multipole: Optional[bool] = None) -> str:
+    return render_field_png(field_plot_data(result, dtype=dtype, multipole=multipole))
+
+
 @router.get("/")
 async def render_m21_page(request: Request):
     return templates.TemplateResponse("physics/M21.html", {"request": request})
 
 
+image_cache = FactorizationCache(IMAGE_CACHE_BYTES, sizeof=len)
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return _render_pool
+
+
+async def render_field_png_async(data: Dict) -> str:
+    """render_field_png в процессе отрисовки; если пул сломан (процесс упал) — пересоздаём его и рисуем в потоке"""
+    global _render_pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_render_pool(), render_field_png, data)
+    except BrokenProcessPool:
+        logger.warning("Пул отрисовки M21 сломан, пересоздаю")
+        _render_pool = None
+        return await asyncio.to_thread(render_field_png, data)
+
+
+def _encode_array(values: np.ndarray) -> str:
+    """float32 little-endian в base64 (на клиенте — Float32Array)"""
+    return base64.b64encode(np.ascontiguousarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def field_payload(data: Dict, result: Dict) -> Dict[str, Any]:
+    """Массивы для отрисовки в браузере: оси сетки, потенциал и поле (строки — ось Y сечения),
+    плотность заряда панелей, лежащих в плоскости сечения (u, v — координаты в ней)"""
+    mesh: BEMMesh = result['mesh']
+    axes = (0, 2, 1) if data['plane'] == 'xz' else (0, 1, 2)
+    # панели не дальше ~ своего размера от плоскости сечения
+    in_plane = np.abs(mesh.centers[:, axes[2]]) <= 0.75 * np.sqrt(mesh.areas)
+    density = np.asarray(result['charge_density'])[in_plane]
+    return {
+        'plane': data['plane'],
+        'shape': list(data['X'].shape),
+        'x': _encode_array(data['X'][0, :]),
+        'y': _encode_array(data['Y'][:, 0]),
+        'potential': _encode_array(data['potential']),
+        'Ex': _encode_array(data['Ex']),
+        'Ey': _encode_array(data['Ey']),
+        'centers': [[float(data['c0'][a]) for a in axes[:2]], [float(data['c1'][a]) for a in axes[:2]]],
+        'charges': {
+            'u': _encode_array(mesh.centers[in_plane, axes[0]]),
+            'v': _encode_array(mesh.centers[in_plane, axes[1]]),
+            'sigma': _encode_array(density),
+            'body': _encode_array(mesh.body_ids[in_plane]),
+        },
+    }
+
+
 @router.post("/calculate", response_model=ElectrostaticsResponse)
 async def calculate_electrostatics(params: ElectrostaticsRequest):
     try:
         logger.info(f"Запрос: {params.model_dump()}")
 
-        result = solve_electrostatics(
+        if params.render not in ('png', 'data'):
+            raise ValueError(f"Неизвестный формат ответа: {params.render}")
+
+        result = await asyncio.to_thread(
+            solve_electrostatics,
             R1=params.R1, R2=params.R2, d=params.d, V=params.V,
-            n_divisions=params.n_divisions, mode=params.mode
+            n_divisions=params.n_divisions, mode=params.mode, solver=params.solver
         )
 
-        field_viz = create_field_visualization(result)
+        dtype = np.float32 if params.field_dtype == 'float32' else np.float64
+        image_key = (result['mode'], params.R1, params.R2, params.d, params.V, params.n_divisions,
+                     result['solver'], params.field_dtype, params.field_multipole)
+        field_img, field_data = "", None
+        if params.render == 'data':
+            data = await asyncio.to_thread(field_plot_data, result, dtype, params.field_multipole)
+            field_data = field_payload(data, result)
+        else:
+            field_img = image_cache.get(image_key)
+            if field_img is None:
+                data = await asyncio.to_thread(field_plot_data, result, dtype, params.field_multipole)
+                field_img = await render_field_png_async(data)
+                image_cache.put(image_key, field_img)
 
         return ElectrostaticsResponse(
             success=True,
@@ -584,7 +1331,10 @@ async def calculate_electrostatics(params: ElectrostaticsRequest):
             C_numerical=result['C_numerical'],
             C_analytical=result['C_isolated'],
             n_elements=result['n_elements'],
-            field_img=field_viz
+            cache_hit=result['cache_hit'],
+            solver=result['solver'],
+            field_img=field_img,
+            field_data=field_data
         )
 
     except ValueError as e:
@@ -595,6 +1345,11 @@ async def calculate_electrostatics(params: ElectrostaticsRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка расчёта: {str(e)}")
 
 
+@router.get("/cache")
+async def get_factorization_cache_stats():
+    return {"success": True, **factorization_cache.stats(), "images": image_cache.stats()}
+
+
 @router.get("/theory")
 async def get_theoretical_values(R1: float, R2: float):
     try:
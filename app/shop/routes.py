@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.tasks.database import get_db
 from app.auth.dependencies import require_user
@@ -82,6 +82,11 @@ async def get_quest_templates(active_only: bool = False, db: Session = Depends(g
     return QuestTemplateService.get_templates(db, current_user.id, active_only)
 
 
+@router.get("/api/quest-templates/preview", response_model=List[schemas.QuestTemplatePreview])
+async def preview_quest_templates(ids: Optional[List[int]] = Query(None), count: int = Query(5, ge=1, le=50), db: Session = Depends(get_db), current_user: User = Depends(require_user)):
+    return QuestTemplateService.preview_runs(db, current_user.id, ids, count)
+
+
 @router.get("/api/quest-templates/{template_id}", response_model=schemas.QuestTemplateResponse)
 async def get_quest_template(template_id: int, db: Session = Depends(get_db), current_user: User = Depends(require_user)):
     template = QuestTemplateService.get_template(db, template_id, current_user.id)
@@ -109,5 +114,5 @@ async def trigger_quest_generation(template_id: int, db: Session = Depends(get_d
 
 @router.post("/api/quest-templates/generate-due")
 async def generate_due_quests(db: Session = Depends(get_db), current_user: User = Depends(require_user)):
-    quests = QuestTemplateService.generate_due_quests(db, current_user.id)
-    return {"message": f"Создано квестов: {len(quests)}", "quest_ids": [q.id for q in quests]}
+    quest_ids = QuestTemplateService.generate_due_quests(db, current_user.id)
+    return {"message": f"Создано квестов: {len(quest_ids)}", "quest_ids": quest_ids}
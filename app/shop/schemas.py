@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional, Union
 from datetime import datetime
 
 
@@ -97,11 +97,17 @@ class QuestTemplateUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class QuestTemplatePreview(BaseModel):
+    template_id: Union[int, str]
+    next_runs: List[datetime]
+
+
 class QuestTemplateResponse(QuestTemplateBase):
     id: int
     user_id: int
     is_active: bool
     last_generated: Optional[datetime]
+    next_run_at: Optional[datetime] = None
     created_at: Optional[datetime]
     start_at: Optional[datetime]
     end_at: Optional[datetime]
@@ -6,6 +6,7 @@ from fastapi import HTTPException
 
 from app.tasks.database import ShopItem, Inventory, QuestTemplate, Quest
 from app.auth.models import User
+from app.auth.identity import change_currency
 from app.shop.schemas import (
     ShopItemCreate, ShopItemUpdate,
     QuestTemplateCreate, QuestTemplateUpdate
@@ -23,8 +24,10 @@ from app.tasks.firestore_service import (
     get_template as fs_get_template,
     update_template as fs_update_template,
     delete_template as fs_delete_template,
-    create_quest as fs_create_quest
+    generate_quest_from_template as fs_generate_quest_from_template
 )
+from app.tasks.recurrence import combine_date_time, upcoming
+from app.tasks.generator import generate_due_templates, notify_template
 from app.tasks.rarity_utils import normalize_to_item_rarity, display_label_from_item_rarity, display_label_from_quest_rarity, key_from_item_rarity, normalize_to_quest_rarity
 
 class ShopService:
@@ -161,7 +164,8 @@ class InventoryService:
                 return inv[-1]
             return None
 
-        user = db.query(User).filter(User.id == user_id).first()
+        # populate_existing: в сессии может лежать снимок из кеша (attach) с устаревшим балансом
+        user = db.query(User).populate_existing().filter(User.id == user_id).first()
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
@@ -179,7 +183,11 @@ class InventoryService:
         if user.currency < total_price:
             raise HTTPException(status_code=400, detail=f"Недостаточно валюты. Нужно: {total_price}, у вас: {user.currency}")
 
-        user.currency -= total_price
+        # Списание одним UPDATE с проверкой баланса: параллельная покупка не уведёт его в минус
+        if not change_currency(db, user_id, -total_price, minimum=0):
+            db.rollback()
+            db.refresh(user)
+            raise HTTPException(status_code=400, detail=f"Недостаточно валюты. Нужно: {total_price}, у вас: {user.currency}")
         if shop_item.stock is not None:
             shop_item.stock -= quantity
 
@@ -230,37 +238,25 @@ class QuestTemplateService:
 
     @staticmethod
     def create_template(db: Session, user_id: int, template_data: QuestTemplateCreate) -> QuestTemplate:
-        if db is None:
-            # Firestore mode
-            payload = template_data.model_dump()
-            # ensure readable label
-            payload['rarity'] = display_label_from_quest_rarity(template_data.rarity)
-            created = fs_create_template(user_id, payload)
-            return created
-
         if template_data.recurrence_type == "weekly" and not template_data.weekdays:
             raise HTTPException(status_code=400, detail="Для weekly типа необходимо указать weekdays")
 
         if template_data.recurrence_type == "interval" and not template_data.interval_hours:
             raise HTTPException(status_code=400, detail="Для interval типа необходимо указать interval_hours")
 
-        start_at = None
-        if template_data.start_date or template_data.start_time:
-            try:
-                date_part = template_data.start_date or datetime.now().date().isoformat()
-                time_part = template_data.start_time or "00:00"
-                start_at = datetime.strptime(f"{date_part} {time_part}", "%Y-%m-%d %H:%M")
-            except Exception:
-                start_at = None
+        start_at = combine_date_time(template_data.start_date, template_data.start_time, "00:00")
+        end_at = combine_date_time(template_data.end_date, template_data.end_time, "23:59")
 
-        end_at = None
-        if template_data.end_date or template_data.end_time:
-            try:
-                date_part = template_data.end_date or datetime.now().date().isoformat()
-                time_part = template_data.end_time or "23:59"
-                end_at = datetime.strptime(f"{date_part} {time_part}", "%Y-%m-%d %H:%M")
-            except Exception:
-                end_at = None
+        if db is None:
+            # Firestore mode
+            payload = template_data.model_dump()
+            # ensure readable label
+            payload['rarity'] = display_label_from_quest_rarity(template_data.rarity)
+            payload['start_at'] = start_at.isoformat() if start_at else None
+            payload['end_at'] = end_at.isoformat() if end_at else None
+            created = fs_create_template(user_id, payload)
+            notify_template(getattr(created, 'next_run_at', None), getattr(created, 'id', None))
+            return created
 
         # Нормализуем rarity в читабельную метку
         try:
@@ -284,9 +280,11 @@ class QuestTemplateService:
             start_at=start_at,
             end_at=end_at
         )
+        template.schedule_next()
         db.add(template)
         db.commit()
         db.refresh(template)
+        notify_template(template.next_run_at, template.id)
         return template
 
     @staticmethod
@@ -313,6 +311,7 @@ class QuestTemplateService:
             updated = fs_update_template(template_id, update_data.model_dump(exclude_unset=True))
             if not updated:
                 raise HTTPException(status_code=404, detail='Шаблон не найден')
+            notify_template(getattr(updated, 'next_run_at', None), template_id)
             return updated
 
         template = QuestTemplateService.get_template(db, template_id, user_id)
@@ -322,9 +321,11 @@ class QuestTemplateService:
         update_dict = update_data.model_dump(exclude_unset=True)
         for key, value in update_dict.items():
             setattr(template, key, value)
+        template.schedule_next()
 
         db.commit()
         db.refresh(template)
+        notify_template(template.next_run_at, template.id)
         return template
 
     @staticmethod
@@ -339,33 +340,29 @@ class QuestTemplateService:
         return True
 
     @staticmethod
-    def generate_due_quests(db: Session, user_id: int) -> List[Quest]:
+    def preview_runs(db: Session, user_id: int, template_ids: Optional[List] = None, count: int = 5) -> List[dict]:
+        """Ближайшие count запусков для шаблонов пользователя (всех или выбранных) одним запросом"""
         if db is None:
-            # Firestore mode: for simplicity, iterate templates and call create_quest
             templates = fs_list_templates(str(user_id))
-            generated = []
-            now = datetime.now()
-            for t in templates:
-                try:
-                    # naive check if should generate using existing fields
-                    # if t has 'recurrence_type' and it's active, just create one
-                    created = fs_create_quest(user_id, t.__dict__)
-                    generated.append(created)
-                except Exception:
-                    continue
-            return generated
+            if template_ids:
+                wanted = {str(i) for i in template_ids}
+                templates = [t for t in templates if str(t.id) in wanted]
+        else:
+            query = db.query(QuestTemplate).filter(QuestTemplate.user_id == user_id)
+            if template_ids:
+                query = query.filter(QuestTemplate.id.in_(template_ids))
+            templates = query.all()
 
-        templates = QuestTemplateService.get_templates(db, user_id, active_only=True)
-        generated = []
         now = datetime.now()
-        for t in templates:
-            try:
-                if t.should_generate(now):
-                    q = t.generate_quest(db)
-                    generated.append(q)
-            except Exception:
-                continue
-        return generated
+        return [
+            {"template_id": t.id, "next_runs": upcoming(t, count, now)}
+            for t in templates
+        ]
+
+    @staticmethod
+    def generate_due_quests(db: Session, user_id: int) -> List[int]:
+        """Квесты по наступившим шаблонам пользователя (пачкой, см. app/tasks/generator.py); возвращает их id"""
+        return generate_due_templates(db, user_id=user_id)
 
     @staticmethod
     def trigger_generation(db: Session, template_id: int, user_id: int) -> Quest:
@@ -373,7 +370,7 @@ class QuestTemplateService:
             tpl = fs_get_template(template_id)
             if not tpl:
                 raise HTTPException(status_code=404, detail='Шаблон не найден')
-            return fs_create_quest(user_id, tpl.__dict__)
+            return fs_generate_quest_from_template(tpl.__dict__, str(user_id))
         template = QuestTemplateService.get_template(db, template_id, user_id)
         if not template:
             raise HTTPException(status_code=404, detail="Шаблон не найден")
@@ -1,16 +1,22 @@
+from collections import defaultdict
 from datetime import datetime, timedelta as dl
 
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session, aliased
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy import create_engine, Boolean, Float, ForeignKey
-from sqlalchemy import Column, Integer, String, DateTime, Text, Table
+from sqlalchemy import select, insert, update, delete, func, case
+from sqlalchemy import Column, Integer, String, DateTime, Text, Table, Index
 import enum
 import os
 from dotenv import load_dotenv
 
+from app.tasks.recurrence import next_run_at, is_due
+
 load_dotenv()
 
 USE_FIRESTORE = os.environ.get('FIRESTORE_ENABLED', '0') in ('1', 'true', 'True')
+USE_ASYNC_DB = os.environ.get('ASYNC_DB_ENABLED', '0') in ('1', 'true', 'True')
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
@@ -18,10 +24,26 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 
 Base = declarative_base()
 
+_ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def _async_driver_name(drivername: str) -> str:
+    """Подбирает асинхронный драйвер для URL синхронного engine (sqlite -> aiosqlite, postgresql -> asyncpg)"""
+    dialect = drivername.split('+', 1)[0]
+    if dialect not in _ASYNC_DRIVERS:
+        raise ValueError(f'Нет асинхронного драйвера для {drivername}')
+    return _ASYNC_DRIVERS[dialect]
+
+
 if USE_FIRESTORE:
     print('ℹ️ FIRESTORE_ENABLED detected in environment — пропускаем инициализацию SQLAlchemy (используется Firestore в проде)')
     engine = None
     SessionLocal = None
+    async_engine = None
+    AsyncSessionLocal = None
 
 else:
     if not DATABASE_URL:
@@ -53,6 +75,20 @@ else:
 
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+    async_engine = None
+    AsyncSessionLocal = None
+    # in-memory SQLite у async engine была бы отдельной базой, поэтому для неё остаёмся в sync режиме
+    if USE_ASYNC_DB and engine.url.database not in (None, '', ':memory:'):
+        try:
+            _async_url = engine.url.set(drivername=_async_driver_name(engine.url.drivername))
+            async_engine = create_async_engine(_async_url, pool_pre_ping=True, echo=False)
+            # expire_on_commit=False: после commit объекты отдаются в шаблоны без повторной подгрузки
+            AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        except Exception as e:
+            print('⚠️ Не удалось создать async engine, используется синхронный режим:', e)
+            async_engine = None
+            AsyncSessionLocal = None
+
 
 def get_db():
     if USE_FIRESTORE:
@@ -66,6 +102,15 @@ def get_db():
             db.close()
 
 
+async def get_async_db():
+    """Асинхронная сессия (ASYNC_DB_ENABLED=1). В Firestore режиме или без async engine возвращает None."""
+    if USE_FIRESTORE or AsyncSessionLocal is None:
+        yield None
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 class QuestRarity(str, enum.Enum):
     common = "Обычный"
     uncommon = "Необычный"
@@ -113,6 +158,11 @@ class CheckboxSubtask(SubtaskBase):
         'polymorphic_identity': SubtaskType.checkbox
     }
 
+    @property
+    def completed_weight(self) -> float:
+        """Вклад подзадачи в выполненный вес квеста"""
+        return float(self.weight) if self.completed else 0.0
+
 
 class NumericSubtask(SubtaskBase):
     __tablename__ = "numeric_subtasks"
@@ -122,6 +172,23 @@ class NumericSubtask(SubtaskBase):
         'polymorphic_identity': SubtaskType.numeric
     }
 
+    @property
+    def completed_weight(self) -> float:
+        """Вклад подзадачи в выполненный вес квеста (пропорционально current/target)"""
+        current = self.current or 0
+        if current >= self.target:
+            return float(self.weight)
+        if self.target <= 0:
+            return 0.0
+        return self.weight * (current / self.target)
+
+
+def calc_progress(total_weight, completed_weight) -> int:
+    """Процент выполнения по сохранённым весам"""
+    if not total_weight or total_weight <= 0:
+        return 0
+    return min(100, max(0, round((completed_weight or 0) / total_weight * 100)))
+
 
 quest_relationship = Table(
     'quest_relationships', Base.metadata,
@@ -129,9 +196,25 @@ quest_relationship = Table(
     Column('child_id', Integer, ForeignKey('quests.id'), primary_key=True)
 )
 
+# Транзитивное замыкание графа квестов: пара (предок, потомок) и число различных путей между ними.
+# Счётчик путей позволяет корректно удалять вершины графа без полного пересчёта.
+quest_closure = Table(
+    'quest_closure', Base.metadata,
+    Column('ancestor_id', Integer, ForeignKey('quests.id'), primary_key=True),
+    Column('descendant_id', Integer, ForeignKey('quests.id'), primary_key=True, index=True),
+    Column('paths', Integer, nullable=False, default=1)
+)
+
 
 class Quest(Base):
     __tablename__ = "quests"
+    __table_args__ = (
+        # диапазонный поиск по дате (app/tasks/search.py)
+        Index('ix_quests_user_deadline', 'user_id', 'deadline'),
+        Index('ix_quests_user_created', 'user_id', 'created'),
+        # ближайший дедлайн активных квестов для воркера истечения (app/tasks/expiry.py)
+        Index('ix_quests_status_deadline', 'status', 'deadline'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     author = Column(String, default="???")
@@ -144,6 +227,14 @@ class Quest(Base):
     scope = Column(String)
     is_new = Column(Boolean, default=True)
 
+    # Прогресс хранится в строке квеста и обновляется вместе с подзадачами (SubtaskService),
+    # поэтому спискам квестов не нужно подгружать подзадачи
+    progress = Column(Integer, default=0, nullable=False)
+    total_weight = Column(Integer, default=0, nullable=False)
+    completed_weight = Column(Float, default=0.0, nullable=False)
+    # Число непосредственных родителей, ещё не завершённых; квест разблокируется при 0
+    unfinished_parents = Column(Integer, default=0, nullable=False)
+
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     user = relationship("User", back_populates="quests")
 
@@ -153,21 +244,21 @@ class Quest(Base):
         primaryjoin=(id == quest_relationship.c.parent_id),
         secondaryjoin=(id == quest_relationship.c.child_id),
         backref="parents",
-        lazy='selectin'
+        lazy='select'
     )
 
     checkbox_subtasks = relationship(
         "CheckboxSubtask",
         backref="quest",
         cascade="all, delete-orphan",
-        lazy='selectin'
+        lazy='select'
     )
 
     numeric_subtasks = relationship(
         "NumericSubtask",
         backref="quest",
         cascade="all, delete-orphan",
-        lazy='selectin'
+        lazy='select'
     )
 
     @property
@@ -175,41 +266,25 @@ class Quest(Base):
         """Объединяем подзадачи в одном списке для удобства"""
         return self.checkbox_subtasks + self.numeric_subtasks
 
-    @property
-    def progress(self):
-        total_weight = 0
-        completed_weight = 0
-
-        for subtask in self.checkbox_subtasks:
-            total_weight += subtask.weight
-            if subtask.completed:
-                completed_weight += subtask.weight
-
-        for subtask in self.numeric_subtasks:
-            total_weight += subtask.weight
-            if subtask.current >= subtask.target:
-                completed_weight += subtask.weight
-            else:
-                completed_weight += subtask.weight * (subtask.current / subtask.target)
-
-        if total_weight > 0:
-            return round((completed_weight / total_weight) * 100)
-        return 0
+    def set_weights(self, total_weight: int, completed_weight: float):
+        """Записывает веса подзадач и пересчитывает сохранённый процент выполнения"""
+        self.total_weight = total_weight
+        self.completed_weight = completed_weight
+        self.progress = calc_progress(total_weight, completed_weight)
+
+    def recalculate_progress(self) -> int:
+        """Полный пересчёт прогресса по подзадачам (загружает их)"""
+        subtasks = self.subtasks
+        self.set_weights(
+            sum(s.weight for s in subtasks),
+            sum(s.completed_weight for s in subtasks)
+        )
+        return self.progress
 
     @property
     def is_active(self):
-        """Проверяет, должен ли квест быть активным"""
-        if not self.parents:
-            return True
-
-        return all(parent.status == QuestStatus.finished for parent in self.parents)
-
-    def update_children_status(self):
-        """Обновляет статусы дочерних квестов при изменении статуса родителя"""
-        if self.status == QuestStatus.finished:
-            for child in self.children:
-                if child.status == QuestStatus.inactive and child.is_active:
-                    child.status = QuestStatus.active
+        """Проверяет, должен ли квест быть активным (все родители завершены)"""
+        return not self.unfinished_parents
 
     def __str__(self):
         return f"<Quest {self.id}: {self.title} by {self.author}>"
@@ -251,70 +326,22 @@ class QuestTemplate(Base):
     start_at = Column(DateTime, nullable=True)
     end_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+    # Следующий запуск генерации (None — шаблон выключен или закончился); по нему планировщик
+    # выбирает готовые шаблоны всех пользователей одним запросом (app/tasks/generator.py).
+    # Пересчёт через schedule_next никогда не даёт момент в прошлом (новый или снова включённый шаблон
+    # не «догоняет» старые запуски)
+    next_run_at = Column(DateTime, nullable=True, index=True)
 
     user = relationship("User", back_populates="quest_templates")
 
     def should_generate(self, now: datetime = None) -> bool:
         """Проверяет, нужно ли создать новый квест по этому шаблону"""
-        if not self.is_active:
-            return False
-
-        if now is None:
-            now = datetime.now()
-
-        if self.start_at and now < self.start_at:
-            return False
-
-        # Если указан end_at — больше не генерируем
-        if self.end_at and now > self.end_at:
-            return False
-
-        start_time = self.start_at.time() if self.start_at else None
-
-        # DAILY
-        if self.recurrence_type == RecurrenceType.daily.value:
-            # не генерировать раньше времени запуска в день
-            if start_time and now.time() < start_time:
-                return False
-            if self.last_generated is None:
-                return True
-            return now.date() > self.last_generated.date()
-
-        # WEEKLY
-        elif self.recurrence_type == RecurrenceType.weekly.value:
-            if not self.weekdays:
-                return False
-
-            current_weekday = now.weekday()  # 0=пн, 6=вс
-            target_weekdays = [int(d) for d in self.weekdays.split(',')]
-
-            if current_weekday not in target_weekdays:
-                return False
+        return is_due(self, now)
 
-            if start_time and now.time() < start_time:
-                return False
-
-            if self.last_generated is None:
-                return True
-
-            # если уже генерили сегодня — не генерируем снова
-            if self.last_generated.date() == now.date():
-                return False
-
-            return True
-
-        # INTERVAL
-        elif self.recurrence_type == RecurrenceType.interval.value:
-            if not self.interval_hours:
-                return False
-
-            if self.last_generated is None:
-                # Если ещё не генерировали, разрешим генерацию (при условии start_at уже проверено выше)
-                return True
-            elapsed = (now - self.last_generated).total_seconds() / 3600
-            return elapsed >= self.interval_hours
-
-        return False
+    def schedule_next(self, now: datetime = None):
+        """Пересчитывает момент следующей генерации (после изменения шаблона или генерации); не раньше now"""
+        self.next_run_at = next_run_at(self, now)
+        return self.next_run_at
 
     def generate_quest(self, db: Session) -> Quest:
         """Создаёт новый квест на основе шаблона"""
@@ -337,6 +364,7 @@ class QuestTemplate(Base):
 
         db.add(new_quest)
         self.last_generated = now
+        self.schedule_next(now)
         db.commit()
         db.refresh(new_quest)
 
@@ -442,11 +470,221 @@ class QuestGenerator(Base):
         db.commit()
 
 
+def ensure_indexes(conn):
+    """Создаёт объявленные в моделях индексы, которых нет в уже существующих таблицах (create_all их не добавляет)"""
+    for table in (Quest.__table__, QuestTemplate.__table__):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def recalculate_quest_progress(db: Session, quest_ids=None) -> int:
+    """Массовый пересчёт сохранённого прогресса квестов по подзадачам (ремонт после ручных правок/миграции).
+
+    Веса считаются одним UPDATE с коррелированными подзапросами, проценты записываются bulk-обновлением по id.
+    """
+    def _sum(expr, model, *where):
+        return (select(func.coalesce(func.sum(expr), 0))
+                .where(model.quest_id == Quest.id, *where)
+                .scalar_subquery())
+
+    numeric_done = case(
+        (NumericSubtask.current >= NumericSubtask.target, NumericSubtask.weight),
+        (NumericSubtask.target > 0, NumericSubtask.weight * func.coalesce(NumericSubtask.current, 0) / NumericSubtask.target),
+        else_=0.0
+    )
+
+    stmt = update(Quest).values(
+        total_weight=_sum(CheckboxSubtask.weight, CheckboxSubtask) + _sum(NumericSubtask.weight, NumericSubtask),
+        completed_weight=(_sum(CheckboxSubtask.weight, CheckboxSubtask, CheckboxSubtask.completed.is_(True))
+                          + _sum(numeric_done, NumericSubtask)),
+    )
+    rows_query = select(Quest.id, Quest.total_weight, Quest.completed_weight)
+    if quest_ids is not None:
+        stmt = stmt.where(Quest.id.in_(quest_ids))
+        rows_query = rows_query.where(Quest.id.in_(quest_ids))
+
+    db.execute(stmt.execution_options(synchronize_session=False))
+    rows = db.execute(rows_query).all()
+    if rows:
+        db.execute(update(Quest), [
+            {'id': qid, 'progress': calc_progress(total, completed)}
+            for qid, total, completed in rows
+        ])
+    db.commit()
+    return len(rows)
+
+
+def rebuild_quest_dag(db: Session) -> int:
+    """Полная перестройка quest_closure и счётчиков unfinished_parents по таблице quest_relationships"""
+    edges = db.execute(select(quest_relationship.c.parent_id, quest_relationship.c.child_id)).all()
+
+    parents_of = defaultdict(list)
+    children_of = defaultdict(list)
+    indegree = defaultdict(int)
+    nodes = set()
+    for parent_id, child_id in edges:
+        parents_of[child_id].append(parent_id)
+        children_of[parent_id].append(child_id)
+        indegree[child_id] += 1
+        nodes.update((parent_id, child_id))
+
+    # обход в топологическом порядке: предки вершины = её родители + предки родителей (с числом путей)
+    ancestors = {}
+    queue = [n for n in nodes if indegree[n] == 0]
+    while queue:
+        node = queue.pop()
+        paths = defaultdict(int)
+        for parent_id in parents_of[node]:
+            paths[parent_id] += 1
+            for ancestor_id, count in ancestors[parent_id].items():
+                paths[ancestor_id] += count
+        ancestors[node] = paths
+        for child_id in children_of[node]:
+            indegree[child_id] -= 1
+            if indegree[child_id] == 0:
+                queue.append(child_id)
+
+    skipped = nodes - ancestors.keys()
+    if skipped:
+        print(f'⚠️ В графе квестов найдены циклы, квесты пропущены: {sorted(skipped)}')
+
+    rows = [
+        {'ancestor_id': ancestor_id, 'descendant_id': node, 'paths': count}
+        for node, paths in ancestors.items()
+        for ancestor_id, count in paths.items()
+    ]
+    db.execute(delete(quest_closure))
+    if rows:
+        db.execute(insert(quest_closure), rows)
+
+    parent = aliased(Quest)
+    unfinished = (select(func.count())
+                  .select_from(quest_relationship)
+                  .join(parent, parent.id == quest_relationship.c.parent_id)
+                  .where(quest_relationship.c.child_id == Quest.id, parent.status != QuestStatus.finished)
+                  .scalar_subquery())
+    db.execute(update(Quest).values(unfinished_parents=unfinished).execution_options(synchronize_session=False))
+    db.commit()
+    return len(rows)
+
+
+def schedule_templates(db: Session, template_ids=None) -> int:
+    """Пересчёт next_run_at у шаблонов (всех или выбранных) bulk-обновлением по id"""
+    query = select(QuestTemplate)
+    if template_ids is not None:
+        query = query.where(QuestTemplate.id.in_(template_ids))
+    templates = db.execute(query).scalars().all()
+    if templates:
+        db.execute(update(QuestTemplate), [
+            {'id': t.id, 'next_run_at': next_run_at(t)}
+            for t in templates
+        ])
+    db.commit()
+    return len(templates)
+
+
+def _migrate_server_db() -> dict:
+    """Миграции серверной БД (Postgres): create_all не меняет существующие таблицы, поэтому колонки,
+    появившиеся в моделях позже, добавляются через ALTER TABLE. Возвращает флаги для _apply_data_migrations."""
+    from sqlalchemy import inspect, text
+    flags = {}
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    if 'quests' in tables:
+        cols = {c['name'] for c in inspector.get_columns('quests')}
+
+        # сохранённый прогресс квестов
+        if 'progress' not in cols:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE quests ADD COLUMN progress INTEGER NOT NULL DEFAULT 0"))
+                    conn.execute(text("ALTER TABLE quests ADD COLUMN total_weight INTEGER NOT NULL DEFAULT 0"))
+                    conn.execute(text("ALTER TABLE quests ADD COLUMN completed_weight FLOAT NOT NULL DEFAULT 0"))
+                flags['progress_added'] = True
+            except Exception as e:
+                print('⚠️ Не удалось добавить колонки прогресса в quests:', e)
+
+        # граф квестов: счётчик незавершённых родителей и транзитивное замыкание
+        if 'unfinished_parents' not in cols:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE quests ADD COLUMN unfinished_parents INTEGER NOT NULL DEFAULT 0"))
+                flags['dag_rebuild'] = True
+            except Exception as e:
+                print('⚠️ Не удалось добавить колонку unfinished_parents в quests:', e)
+
+        if 'quest_closure' not in tables:
+            try:
+                quest_closure.create(engine, checkfirst=True)
+                flags['dag_rebuild'] = True
+            except Exception as e:
+                print('⚠️ Не удалось создать таблицу quest_closure:', e)
+
+    # момент следующей генерации для планировщика шаблонов
+    if 'quest_templates' in tables:
+        cols = {c['name'] for c in inspector.get_columns('quest_templates')}
+        if 'next_run_at' not in cols:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE quest_templates ADD COLUMN next_run_at TIMESTAMP"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_quest_templates_next_run_at ON quest_templates (next_run_at)"))
+                flags['templates_rescheduled'] = True
+            except Exception as e:
+                print('⚠️ Не удалось добавить колонку next_run_at в quest_templates:', e)
+
+    return flags
+
+
+def _apply_data_migrations(progress_added=False, dag_rebuild=False, templates_rescheduled=False):
+    """Заполнение данных после добавления колонок/таблиц: прогресс, граф квестов, расписание шаблонов"""
+    if SessionLocal is None:
+        return
+
+    if progress_added:
+        db = SessionLocal()
+        try:
+            count = recalculate_quest_progress(db)
+            print(f'✅ Прогресс пересчитан для {count} квестов')
+        except Exception as e:
+            print('⚠️ Не удалось пересчитать прогресс квестов:', e)
+        finally:
+            db.close()
+
+    if dag_rebuild:
+        db = SessionLocal()
+        try:
+            count = rebuild_quest_dag(db)
+            print(f'✅ Граф квестов перестроен ({count} связей предок-потомок)')
+        except Exception as e:
+            print('⚠️ Не удалось перестроить граф квестов:', e)
+        finally:
+            db.close()
+
+    if templates_rescheduled:
+        db = SessionLocal()
+        try:
+            count = schedule_templates(db)
+            print(f'✅ Расписание пересчитано для {count} шаблонов квестов')
+        except Exception as e:
+            print('⚠️ Не удалось пересчитать расписание шаблонов:', e)
+        finally:
+            db.close()
+
+
 def ensure_db_migrations():
-    """Простейшие миграции для sqlite базы: добавляет колонку `currency` в users и создаёт таблицы магазина/инвентаря/шаблонов при необходимости."""
+    """Простейшие миграции: для sqlite добавляет колонку `currency` в users, колонки прогресса и графа в quests, расписание шаблонов и создаёт таблицы магазина/инвентаря/шаблонов при необходимости; для серверной БД (Postgres) — недостающие колонки существующих таблиц (см. _migrate_server_db)."""
     from pathlib import Path
     import sqlite3
+    if USE_FIRESTORE or engine is None:
+        return
     if not DATABASE_URL.startswith('sqlite'):
+        try:
+            flags = _migrate_server_db()
+        except Exception as e:
+            print('⚠️ Не удалось проверить схему БД:', e)
+            return
+        _apply_data_migrations(**flags)
         return
 
     db_path = DATABASE_URL.replace('sqlite:///', '')
@@ -456,6 +694,9 @@ def ensure_db_migrations():
 
     conn = sqlite3.connect(str(db_file))
     cur = conn.cursor()
+    progress_added = False
+    dag_rebuild = False
+    templates_rescheduled = False
 
     try:
         try:
@@ -470,6 +711,45 @@ def ensure_db_migrations():
             except Exception:
                 pass
 
+        # сохранённый прогресс квестов
+        try:
+            cols = [c[1] for c in cur.execute("PRAGMA table_info('quests')").fetchall()]
+        except Exception:
+            cols = []
+
+        if cols and 'progress' not in cols:
+            try:
+                cur.execute("ALTER TABLE quests ADD COLUMN progress INTEGER NOT NULL DEFAULT 0")
+                cur.execute("ALTER TABLE quests ADD COLUMN total_weight INTEGER NOT NULL DEFAULT 0")
+                cur.execute("ALTER TABLE quests ADD COLUMN completed_weight FLOAT NOT NULL DEFAULT 0")
+                conn.commit()
+                progress_added = True
+            except Exception as e:
+                print('⚠️ Не удалось добавить колонки прогресса в quests:', e)
+
+        # граф квестов: счётчик незавершённых родителей и транзитивное замыкание
+        if cols and 'unfinished_parents' not in cols:
+            try:
+                cur.execute("ALTER TABLE quests ADD COLUMN unfinished_parents INTEGER NOT NULL DEFAULT 0")
+                conn.commit()
+                dag_rebuild = True
+            except Exception as e:
+                print('⚠️ Не удалось добавить колонку unfinished_parents в quests:', e)
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='quest_closure'")
+        if cols and not cur.fetchone():
+            cur.execute('''
+                CREATE TABLE quest_closure (
+                    ancestor_id INTEGER NOT NULL REFERENCES quests (id),
+                    descendant_id INTEGER NOT NULL REFERENCES quests (id),
+                    paths INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (ancestor_id, descendant_id)
+                );
+            ''')
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_quest_closure_descendant_id ON quest_closure (descendant_id);")
+            conn.commit()
+            dag_rebuild = True
+
         # shop_items
         cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='shop_items'")
         if not cur.fetchone():
@@ -526,10 +806,13 @@ def ensure_db_migrations():
                     is_active INTEGER DEFAULT 1,
                     last_generated TEXT,
                     start_at TEXT,
-                    created_at TEXT DEFAULT (datetime('now'))
+                    end_at TEXT,
+                    created_at TEXT DEFAULT (datetime('now')),
+                    next_run_at TEXT
                 );
             ''')
             cur.execute("CREATE INDEX IF NOT EXISTS ix_quest_templates_user_id ON quest_templates (user_id);")
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_quest_templates_next_run_at ON quest_templates (next_run_at);")
             conn.commit()
         else:
             # добавляем колонку start_at/end_at, если нет
@@ -549,10 +832,21 @@ def ensure_db_migrations():
                     conn.commit()
                 except Exception:
                     pass
+            # момент следующей генерации для планировщика шаблонов
+            if 'next_run_at' not in cols:
+                try:
+                    cur.execute("ALTER TABLE quest_templates ADD COLUMN next_run_at TEXT")
+                    cur.execute("CREATE INDEX IF NOT EXISTS ix_quest_templates_next_run_at ON quest_templates (next_run_at);")
+                    conn.commit()
+                    templates_rescheduled = True
+                except Exception as e:
+                    print('⚠️ Не удалось добавить колонку next_run_at в quest_templates:', e)
 
     finally:
         conn.close()
 
+    _apply_data_migrations(progress_added, dag_rebuild, templates_rescheduled)
+
 
 try:
     import app.auth.models  # noqa: F401
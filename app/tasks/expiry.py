@@ -0,0 +1,84 @@
+"""
+Фоновое истечение дедлайнов: просроченные активные квесты переводятся в "Проваленный".
+
+Воркер запускается из lifespan приложения и спит до ближайшего дедлайна (min-heap известных дедлайнов +
+MIN(deadline) по индексу ix_quests_status_deadline), а не опрашивает базу на каждом запросе страницы.
+Истечение — один set-based UPDATE для всех пользователей.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import update, select, func
+
+from app.tasks.database import SessionLocal, Quest, QuestStatus
+from app.tasks.workers import TimerWorker
+
+
+def expire_overdue_quests(db, now: Optional[datetime] = None) -> Tuple[int, Optional[datetime]]:
+    """Провалить все активные квесты с прошедшим дедлайном.
+
+    Возвращает (число проваленных квестов, ближайший будущий дедлайн активных квестов или None).
+    """
+    if now is None:
+        now = datetime.now()
+
+    result = db.execute(
+        update(Quest)
+        .where(Quest.status == QuestStatus.active, Quest.deadline.isnot(None), Quest.deadline <= now)
+        .values(status=QuestStatus.failed)
+        .execution_options(synchronize_session=False)
+    )
+    next_deadline = db.execute(
+        select(func.min(Quest.deadline)).where(Quest.status == QuestStatus.active, Quest.deadline > now)
+    ).scalar()
+    db.commit()
+    return result.rowcount or 0, next_deadline
+
+
+class DeadlineExpiryWorker(TimerWorker):
+    """Таймер до ближайшего дедлайна; сервис квестов сообщает о новых дедлайнах через notify()"""
+
+    name = 'при истечении дедлайнов квестов'
+
+    def __init__(self, session_factory=SessionLocal, max_sleep: float = 300.0):
+        super().__init__(max_sleep)
+        self.session_factory = session_factory
+        self.expired_total = 0
+
+    def tick(self) -> Optional[datetime]:
+        db = self.session_factory()
+        try:
+            expired, next_deadline = expire_overdue_quests(db)
+        finally:
+            db.close()
+        if expired:
+            self.expired_total += expired
+            print(f'⏰ Просрочено квестов: {expired}')
+        return next_deadline
+
+
+# Запущенный воркер (None — воркер выключен или Firestore режим)
+expiry_worker: Optional[DeadlineExpiryWorker] = None
+
+
+def notify_deadline(deadline: Optional[datetime], quest_id=None):
+    """Сообщить воркеру о дедлайне активного квеста (безопасно вызывать, если воркер не запущен);
+    с quest_id новый дедлайн заменяет прежний дедлайн этого квеста"""
+    if expiry_worker is not None:
+        expiry_worker.notify(deadline, quest_id)
+
+
+async def start_expiry_worker(max_sleep: float) -> Optional[DeadlineExpiryWorker]:
+    global expiry_worker
+    if SessionLocal is None:
+        return None
+    expiry_worker = DeadlineExpiryWorker(max_sleep=max_sleep)
+    expiry_worker.start()
+    return expiry_worker
+
+
+async def stop_expiry_worker():
+    global expiry_worker
+    if expiry_worker is not None:
+        await expiry_worker.stop()
+        expiry_worker = None
@@ -6,6 +6,12 @@ from datetime import datetime
 from types import SimpleNamespace
 from typing import List, Optional, Dict, Any
 from app.auth.firebase_admin import get_firestore_client
+from app.auth.identity import invalidate_user
+from app.tasks.search import prefix_tokens
+from app.tasks.recurrence import next_run_at, is_due, quest_fields, missed_runs
+
+# Поля квеста, из которых строится индекс поиска search_tokens
+SEARCH_FIELDS = ('title', 'author', 'description', 'rarity')
 
 
 def _doc_to_quest_obj(doc) -> SimpleNamespace:
@@ -22,7 +28,18 @@ def _doc_to_quest_obj(doc) -> SimpleNamespace:
     return SimpleNamespace(**data)
 
 
-def list_quests(user_id: str, status: Optional[str] = None) -> List[SimpleNamespace]:
+def list_quests(
+    user_id: str,
+    status: Optional[str] = None,
+    status_in: Optional[List[str]] = None,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+    start_after: Optional[str] = None,
+    token: Optional[str] = None
+) -> List[SimpleNamespace]:
+    """Квесты пользователя; с order_by/limit/start_after (id последнего документа) — постраничная выборка,
+    token — отбор по индексу поиска search_tokens"""
     client = get_firestore_client()
     if not client:
         return []
@@ -30,10 +47,54 @@ def list_quests(user_id: str, status: Optional[str] = None) -> List[SimpleNamesp
     q = col.where('user_id', '==', str(user_id))
     if status is not None:
         q = q.where('status', '==', status)
+    if status_in:
+        q = q.where('status', 'in', list(status_in))
+    if token:
+        q = q.where('search_tokens', 'array_contains', token)
+    if order_by:
+        from firebase_admin import firestore
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        q = q.order_by(order_by, direction=direction)
+    if start_after:
+        last_doc = col.document(str(start_after)).get()
+        if last_doc.exists:
+            q = q.start_after(last_doc)
+    if limit:
+        q = q.limit(limit)
     docs = list(q.stream())
     return [_doc_to_quest_obj(d) for d in docs]
 
 
+def search_quests_by_date(
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    status: Optional[str] = None,
+    status_in: Optional[List[str]] = None
+) -> List[SimpleNamespace]:
+    """Квесты с дедлайном или датой создания в полуинтервале [start, end) (даты хранятся ISO-строками)"""
+    client = get_firestore_client()
+    if not client:
+        return []
+    col = client.collection('quests')
+    found = {}
+    for field in ('deadline', 'created'):
+        q = col.where('user_id', '==', str(user_id))
+        if status is not None:
+            q = q.where('status', '==', status)
+        if status_in:
+            q = q.where('status', 'in', list(status_in))
+        q = q.where(field, '>=', start.isoformat()).where(field, '<', end.isoformat())
+        for d in q.stream():
+            found.setdefault(d.id, d)
+    return [_doc_to_quest_obj(d) for d in found.values()]
+
+
+def search_tokens_for(data: Dict[str, Any]) -> List[str]:
+    """Токены индекса поиска для документа квеста"""
+    return prefix_tokens(*(data.get(f) for f in SEARCH_FIELDS))
+
+
 def get_quest(quest_id: str) -> Optional[SimpleNamespace]:
     client = get_firestore_client()
     if not client:
@@ -44,25 +105,27 @@ def get_quest(quest_id: str) -> Optional[SimpleNamespace]:
     return _doc_to_quest_obj(doc)
 
 
-def create_quest(user_id: str, payload: Dict[str, Any]) -> SimpleNamespace:
-    client = get_firestore_client()
-    if not client:
-        raise RuntimeError('Firestore not initialized')
-    col = client.collection('quests')
-    data = payload.copy()
+def _quest_document(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Данные нового документа квеста: даты в ISO, значения по умолчанию, индекс поиска"""
+    data = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in payload.items()}
     data['user_id'] = str(user_id)
     data.setdefault('created', datetime.utcnow().isoformat())
-    # store deadline as ISO
-    if 'deadline' in data and isinstance(data['deadline'], datetime):
-        data['deadline'] = data['deadline'].isoformat()
     # ensure subtasks
     data.setdefault('subtasks', [])
     # parents as list
     data.setdefault('parents', [])
     data.setdefault('status', 'active')
+    data['search_tokens'] = search_tokens_for(data)
+    return data
+
 
+def create_quest(user_id: str, payload: Dict[str, Any]) -> SimpleNamespace:
+    client = get_firestore_client()
+    if not client:
+        raise RuntimeError('Firestore not initialized')
+    col = client.collection('quests')
     doc_ref = col.document()
-    doc_ref.set(data)
+    doc_ref.set(_quest_document(user_id, payload))
     doc = doc_ref.get()
     return _doc_to_quest_obj(doc)
 
@@ -72,11 +135,36 @@ def update_quest(quest_id: str, fields: Dict[str, Any]) -> Optional[SimpleNamesp
     if not client:
         return None
     doc_ref = client.collection('quests').document(str(quest_id))
+    if any(f in fields for f in SEARCH_FIELDS):
+        current = doc_ref.get()
+        merged = {**(current.to_dict() or {}), **fields} if current.exists else dict(fields)
+        fields = {**fields, 'search_tokens': search_tokens_for(merged)}
     doc_ref.update(fields)
     doc = doc_ref.get()
     return _doc_to_quest_obj(doc)
 
 
+def reindex_search_tokens(user_id: Optional[str] = None) -> int:
+    """Пересобирает search_tokens у квестов (всех или одного пользователя), например для документов до появления индекса"""
+    client = get_firestore_client()
+    if not client:
+        return 0
+    q = client.collection('quests')
+    if user_id is not None:
+        q = q.where('user_id', '==', str(user_id))
+    batch = client.batch()
+    count = 0
+    for d in q.stream():
+        batch.update(d.reference, {'search_tokens': search_tokens_for(d.to_dict() or {})})
+        count += 1
+        # ограничение Firestore: не больше 500 операций в batch
+        if count % 400 == 0:
+            batch.commit()
+            batch = client.batch()
+    batch.commit()
+    return count
+
+
 def delete_quest(quest_id: str) -> bool:
     client = get_firestore_client()
     if not client:
@@ -210,6 +298,7 @@ def update_user_currency(user_id: str, delta: int) -> Optional[SimpleNamespace]:
         client.transaction()(txn_update)
     except Exception as e:
         raise
+    invalidate_user(user_id)
 
     doc = user_ref.get()
     return SimpleNamespace(**{**doc.to_dict(), 'id': doc.id})
@@ -271,6 +360,7 @@ def purchase_shop_item(user_id: str, shop_item_id: str, quantity: int = 1) -> Si
         txn(txn_purchase)
     except Exception as e:
         raise
+    invalidate_user(user_id)
 
     # return newly created inventory item(s) and updated user
     user_doc = user_ref.get()
@@ -296,6 +386,7 @@ def create_template(user_id: str, data: Dict[str, Any]) -> SimpleNamespace:
     payload = data.copy()
     payload['user_id'] = str(user_id)
     payload.setdefault('created_at', datetime.utcnow().isoformat())
+    payload['next_run_at'] = _iso(next_run_at(payload))
     doc_ref = col.document()
     doc_ref.set(payload)
     doc = doc_ref.get()
@@ -318,7 +409,11 @@ def update_template(template_id: str, fields: Dict[str, Any]) -> Optional[Simple
     if not client:
         return None
     doc_ref = client.collection('quest_templates').document(str(template_id))
-    doc_ref.update(fields)
+    current = doc_ref.get()
+    if not current.exists:
+        return None
+    merged = {**(current.to_dict() or {}), **fields}
+    doc_ref.update({**fields, 'next_run_at': _iso(next_run_at(merged))})
     doc = doc_ref.get()
     return SimpleNamespace(**{**doc.to_dict(), 'id': doc.id})
 
@@ -341,95 +436,111 @@ def _parse_iso(dt_str: Optional[str]):
         return None
 
 
-def should_generate_template(tpl_doc: Dict[str, Any], now: Optional[datetime] = None) -> bool:
-    """Проверяет, нужно ли сгенерировать квест по шаблону (данные документа как dict)."""
-    if now is None:
-        now = datetime.utcnow()
-
-    if not tpl_doc.get('is_active', True):
-        return False
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
 
-    start_at = _parse_iso(tpl_doc.get('start_at'))
-    end_at = _parse_iso(tpl_doc.get('end_at'))
-    last_generated = _parse_iso(tpl_doc.get('last_generated'))
 
-    if start_at and now < start_at:
-        return False
-    if end_at and now > end_at:
-        return False
+def should_generate_template(tpl_doc: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """Проверяет, нужно ли сгенерировать квест по шаблону (данные документа как dict)."""
+    return is_due(tpl_doc, now)
 
-    rtype = tpl_doc.get('recurrence_type')
-    if rtype == 'daily':
-        # if never generated -> generate; if last_generated is before today -> generate
-        if last_generated is None:
-            return True
-        return last_generated.date() < now.date()
-
-    if rtype == 'weekly':
-        weekdays = tpl_doc.get('weekdays')
-        if not weekdays:
-            return False
-        try:
-            target = [int(x) for x in str(weekdays).split(',') if x != '']
-        except Exception:
-            return False
-        wd = now.weekday()  # 0=Monday
-        if wd not in target:
-            return False
-        if last_generated is None:
-            return True
-        return last_generated.date() < now.date()
-
-    if rtype == 'interval':
-        interval = tpl_doc.get('interval_hours')
-        if not interval:
-            return False
-        try:
-            interval = float(interval)
-        except Exception:
-            return False
-        if last_generated is None:
-            return True
-        elapsed = (now - last_generated).total_seconds() / 3600.0
-        return elapsed >= interval
 
-    return False
+def _template_quest_payload(tpl: Dict[str, Any], run_at: datetime) -> Dict[str, Any]:
+    payload = quest_fields(tpl, run_at)
+    payload['rarity'] = payload['rarity'] or 'Обычный'
+    payload['parents'] = tpl.get('parents', [])
+    payload['subtasks'] = tpl.get('subtasks', [])
+    payload['status'] = 'active'
+    return payload
 
 
 def generate_quest_from_template(template_doc: Dict[str, Any], user_id: str) -> Optional[SimpleNamespace]:
-    """Создает квест в коллекции quests на основе шаблона doc (dict) и помечает last_generated."""
+    """Создает квест в коллекции quests на основе шаблона doc (dict) и сдвигает last_generated/next_run_at."""
     client = get_firestore_client()
     if not client:
         return None
 
     tpl = template_doc.copy()
-    payload = {
-        'title': tpl.get('title'),
-        'author': tpl.get('author', '???'),
-        'description': tpl.get('description', ''),
-        'cost': int(tpl.get('cost', 0)),
-        'rarity': tpl.get('rarity', 'Обычный'),
-        'scope': tpl.get('scope'),
-        'parents': tpl.get('parents', []),
-        'subtasks': tpl.get('subtasks', []),
-        'status': 'active'
-    }
-
-    # duration_hours -> deadline
-    try:
-        duration = int(tpl.get('duration_hours', 24))
-    except Exception:
-        duration = 24
-    deadline = datetime.utcnow() + __import__('datetime').timedelta(hours=duration)
-    payload['deadline'] = deadline.isoformat()
-
-    created = create_quest(user_id, payload)
+    now = datetime.now()
+    created = create_quest(user_id, _template_quest_payload(tpl, now))
 
     # update last_generated on template doc
     try:
+        tpl['last_generated'] = now.isoformat()
         t_ref = client.collection('quest_templates').document(str(tpl.get('id')))
-        t_ref.update({'last_generated': datetime.utcnow().isoformat()})
+        t_ref.update({'last_generated': tpl['last_generated'], 'next_run_at': _iso(next_run_at(tpl, now))})
     except Exception:
         pass
 
     return created
+
+
+def generate_due_templates(now: Optional[datetime] = None, user_id: Optional[str] = None) -> List[str]:
+    """Квесты по всем шаблонам с next_run_at <= now (один запрос на всех пользователей).
+
+    Пропущенные запуски догенерируются сразу (см. recurrence.missed_runs). Каждый шаблон обрабатывается
+    в своей транзакции: документ перечитывается, и квесты создаются, только если next_run_at не изменился
+    с момента выборки. Параллельный запуск (планировщик, ручная генерация, другой инстанс) увидит уже
+    сдвинутое расписание и пропустит шаблон — как with_for_update(skip_locked=True) в SQL.
+    Возвращает id созданных квестов.
+    """
+    client = get_firestore_client()
+    if not client:
+        return []
+    from firebase_admin import firestore
+    if now is None:
+        now = datetime.now()
+
+    col = client.collection('quest_templates')
+    due_before = now.isoformat()
+    if user_id is not None:
+        # шаблонов у пользователя немного: без составного индекса user_id + next_run_at
+        docs = col.where('user_id', '==', str(user_id)).stream()
+    else:
+        docs = col.where('next_run_at', '<=', due_before).stream()
+
+    quests = client.collection('quests')
+
+    @firestore.transactional
+    def generate_one(txn, ref, expected_run: str) -> List[str]:
+        snap = ref.get(transaction=txn)
+        tpl = snap.to_dict() or {}
+        if not snap.exists or tpl.get('next_run_at') != expected_run or not tpl.get('is_active', True):
+            return []
+        runs = missed_runs(tpl, now)
+        # запуски, чей срок уже вышел, не создаются (last_generated всё равно сдвигается за них);
+        # запусков не больше MAX_CATCH_UP — транзакция укладывается в лимит Firestore на записи
+        payloads = [p for p in (_template_quest_payload(tpl, run) for run in runs) if p['deadline'] > now]
+        ids = []
+        for payload in payloads:
+            quest_ref = quests.document()
+            txn.set(quest_ref, _quest_document(tpl.get('user_id'), payload))
+            ids.append(quest_ref.id)
+        if runs:
+            tpl['last_generated'] = runs[-1].isoformat()
+        txn.update(ref, {'last_generated': tpl.get('last_generated'), 'next_run_at': _iso(next_run_at(tpl, now))})
+        return ids
+
+    created = []
+    for d in docs:
+        tpl = d.to_dict() or {}
+        if not tpl.get('next_run_at') or tpl['next_run_at'] > due_before or not tpl.get('is_active', True):
+            continue
+        created.extend(generate_one(client.transaction(), d.reference, tpl['next_run_at']))
+    return created
+
+
+def next_template_run() -> Optional[datetime]:
+    """Ближайший next_run_at среди шаблонов"""
+    client = get_firestore_client()
+    if not client:
+        return None
+    from firebase_admin import firestore
+    # фильтр по диапазону строк отбрасывает шаблоны без расписания (next_run_at = null)
+    q = (client.collection('quest_templates')
+         .where('next_run_at', '>', '')
+         .order_by('next_run_at', direction=firestore.Query.ASCENDING)
+         .limit(1))
+    for d in q.stream():
+        return _parse_iso(d.to_dict().get('next_run_at'))
+    return None
@@ -0,0 +1,135 @@
+"""
+Планировщик шаблонов квестов (QuestTemplate).
+
+У каждого шаблона хранится next_run_at (индекс ix_quest_templates_next_run_at), поэтому готовые шаблоны
+всех пользователей выбираются одним запросом. Запуски, пропущенные с прошлой проверки, догенерируются
+сразу (не больше MAX_CATCH_UP на шаблон, только те, чей срок ещё не вышел); квесты вставляются пачками, а last_generated/next_run_at
+шаблонов сдвигаются в той же транзакции. Воркер спит до ближайшего next_run_at, но не дольше
+Settings.generator_check_interval. Правила повторения — app/tasks/recurrence.py (общие с Firestore).
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import select, insert, func
+
+from app.tasks.database import SessionLocal, Quest, QuestStatus, QuestTemplate
+from app.tasks.expiry import notify_deadline
+from app.tasks.recurrence import quest_fields, missed_runs
+from app.tasks.workers import TimerWorker
+from app.tasks.firestore_service import (
+    generate_due_templates as fs_generate_due_templates,
+    next_template_run as fs_next_template_run
+)
+
+# Квестов в одном INSERT
+GENERATION_BATCH = 500
+
+
+def generate_due_templates(db, now: Optional[datetime] = None, user_id: Optional[int] = None) -> List[int]:
+    """Создать квесты по всем шаблонам с next_run_at <= now (или только шаблонам пользователя).
+
+    Возвращает id созданных квестов; db=None — Firestore.
+    """
+    if now is None:
+        now = datetime.now()
+    if db is None:
+        return fs_generate_due_templates(now, None if user_id is None else str(user_id))
+
+    query = (select(QuestTemplate)
+             .where(QuestTemplate.is_active.is_(True),
+                    QuestTemplate.next_run_at.isnot(None),
+                    QuestTemplate.next_run_at <= now)
+             .order_by(QuestTemplate.next_run_at)
+             # несколько процессов приложения не сгенерируют один шаблон дважды (PostgreSQL)
+             .with_for_update(skip_locked=True))
+    if user_id is not None:
+        query = query.where(QuestTemplate.user_id == user_id)
+    templates = db.execute(query).scalars().all()
+    if not templates:
+        db.rollback()
+        return []
+
+    rows = []
+    for template in templates:
+        # пропущенные запуски догенерируются пачкой; запуски, чей срок уже вышел, пропускаются
+        runs = missed_runs(template, now)
+        for run in runs:
+            row = quest_fields(template, run)
+            if row['deadline'] <= now:
+                continue
+            row.update(user_id=template.user_id, status=QuestStatus.active)
+            rows.append(row)
+        if runs:
+            template.last_generated = runs[-1]
+        template.schedule_next(now)
+
+    quest_ids = []
+    for i in range(0, len(rows), GENERATION_BATCH):
+        quest_ids.extend(db.execute(
+            insert(Quest).returning(Quest.id, sort_by_parameter_order=True), rows[i:i + GENERATION_BATCH]
+        ).scalars().all())
+    db.commit()
+
+    notify_deadline(min((row['deadline'] for row in rows), default=None))
+    return quest_ids
+
+
+def next_template_run(db) -> Optional[datetime]:
+    """Ближайший next_run_at среди активных шаблонов"""
+    if db is None:
+        return fs_next_template_run()
+    return db.execute(
+        select(func.min(QuestTemplate.next_run_at)).where(QuestTemplate.is_active.is_(True))
+    ).scalar()
+
+
+class TemplateScheduler(TimerWorker):
+    """Таймер до ближайшего next_run_at; сервис шаблонов сообщает о новом расписании через notify()"""
+
+    name = 'при генерации квестов по шаблонам'
+
+    def __init__(self, session_factory=SessionLocal, max_sleep: float = 300.0):
+        super().__init__(max_sleep)
+        self.session_factory = session_factory
+        self.generated_total = 0
+
+    def tick(self) -> Optional[datetime]:
+        db = self.session_factory() if self.session_factory is not None else None
+        try:
+            generated = generate_due_templates(db)
+            next_run = next_template_run(db)
+        finally:
+            if db is not None:
+                db.close()
+        if generated:
+            self.generated_total += len(generated)
+            print(f'🔁 Создано квестов по шаблонам: {len(generated)}')
+        return next_run
+
+
+# Запущенный планировщик (None — выключен)
+template_scheduler: Optional[TemplateScheduler] = None
+
+
+def notify_template(next_run, template_id=None):
+    """Сообщить планировщику о новом next_run_at шаблона (datetime или ISO-строка из Firestore;
+    безопасно вызывать, если планировщик не запущен). С template_id новый момент заменяет прежний
+    момент шаблона, None вместе с id снимает его"""
+    if isinstance(next_run, str):
+        next_run = datetime.fromisoformat(next_run)
+    if template_scheduler is not None:
+        template_scheduler.notify(next_run, template_id)
+
+
+async def start_template_scheduler(max_sleep: float) -> TemplateScheduler:
+    global template_scheduler
+    template_scheduler = TemplateScheduler(max_sleep=max_sleep)
+    template_scheduler.start()
+    return template_scheduler
+
+
+async def stop_template_scheduler():
+    global template_scheduler
+    if template_scheduler is not None:
+        await template_scheduler.stop()
+        template_scheduler = None
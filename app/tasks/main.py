@@ -1,15 +1,17 @@
-from fastapi import Request, Form, status, Depends, APIRouter
+from fastapi import Request, Form, status, Depends, APIRouter, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
 from datetime import datetime, timedelta
 from typing import Optional
+import inspect
 import json
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.fastapi_config import templates
 from app.tasks.utils import rarity_class
-from app.tasks.database import QuestStatus, QuestRarity, Quest, get_db
-from app.tasks.service import QuestService, SubtaskService
+from app.tasks.database import QuestRarity, get_db, get_async_db, AsyncSessionLocal
+from app.tasks.service import QuestService, SubtaskService, AsyncQuestService, AsyncSubtaskService
 from app.auth.dependencies import require_user
 from app.auth.models import User
 from app.shop.service import QuestTemplateService
@@ -19,31 +21,42 @@ from app.tasks.rarity_utils import normalize_to_quest_rarity, display_label_from
 BASE_URL = '/quest-app'
 router = APIRouter(prefix=BASE_URL)
 
+# При ASYNC_DB_ENABLED=1 квестовые роуты работают через AsyncSession и не блокируют event loop
+get_service_db = get_async_db if AsyncSessionLocal is not None else get_db
+
 
 def get_quest_service(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_service_db),
     current_user: User = Depends(require_user)
 ) -> QuestService:
     """Внедрение зависимости для сервиса квестов с user_id"""
+    if isinstance(db, AsyncSession):
+        return AsyncQuestService(db, user_id=current_user.id)
     return QuestService(db, user_id=current_user.id)
 
 
-def get_subtask_service(db: Session = Depends(get_db)) -> SubtaskService:
+def get_subtask_service(db: Session = Depends(get_service_db)) -> SubtaskService:
     """Внедрение зависимости для сервиса подзадач"""
+    if isinstance(db, AsyncSession):
+        return AsyncSubtaskService(db)
     return SubtaskService(db)
 
 
+async def _resolve(result):
+    """Единообразный вызов sync и async сервисов: дожидаемся корутины, обычный результат возвращаем как есть"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
 @router.get("/", response_class=HTMLResponse)
 async def read_quests(
     request: Request,
-    service: QuestService = Depends(get_quest_service),
     current_user: User = Depends(require_user)
 ):
-    """Главная страница с активными квестами"""
-    quests = service.get_active_quests()
+    """Главная страница с активными квестами (карточки подгружаются постранично через filter-quests)"""
     return templates.TemplateResponse("index.html", {
         "request": request,
-        "quests": quests,
         "post_url": f"{BASE_URL}/filter-quests",
         "get_class": rarity_class,
         "main_text": "Активные квесты",
@@ -74,7 +87,7 @@ async def show_quest_detail(
     current_user: User = Depends(require_user)
 ):
     """Детальная страница квеста"""
-    quest = service.mark_quest_read(quest_id)
+    quest = await _resolve(service.mark_quest_read(quest_id))
     if not quest:
         return RedirectResponse(url=BASE_URL, status_code=status.HTTP_303_SEE_OTHER)
 
@@ -94,7 +107,7 @@ async def create_quest_form(
     current_user: User = Depends(require_user)
 ):
     """Форма создания нового квеста"""
-    available_quests = service.get_all_quests()
+    available_quests = await _resolve(service.get_all_quests())
 
     return templates.TemplateResponse("create.html", {
         "request": request,
@@ -152,7 +165,7 @@ async def create_quest(
                 is_active=True
             )
 
-            QuestTemplateService.create_template(service.db, current_user.id, template_data)
+            await _resolve(service.run_sync(QuestTemplateService.create_template, current_user.id, template_data))
 
             return RedirectResponse(url="/quest-templates", status_code=status.HTTP_303_SEE_OTHER)
         except Exception as e:
@@ -189,16 +202,19 @@ async def create_quest(
     except Exception:
         rarity_enum = QuestRarity.common
 
-    service.create_quest(
-        title=title,
-        author=author,
-        description=description,
-        deadline=parsed_deadline,
-        rarity=rarity_enum,
-        cost=cost,
-        parent_ids=[int(pid) for pid in parent_quests] if parent_quests else None,
-        subtasks_data=subtasks_data
-    )
+    try:
+        await _resolve(service.create_quest(
+            title=title,
+            author=author,
+            description=description,
+            deadline=parsed_deadline,
+            rarity=rarity_enum,
+            cost=cost,
+            parent_ids=[int(pid) for pid in parent_quests] if parent_quests else None,
+            subtasks_data=subtasks_data
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return RedirectResponse(url=BASE_URL, status_code=status.HTTP_303_SEE_OTHER)
 
@@ -210,8 +226,8 @@ async def show_today(
     current_user: User = Depends(require_user)
 ):
     """Страница с квестами на сегодня"""
-    todays_candidates = service.get_todays_candidates()
-    todays_quests = service.get_today_quests()
+    todays_candidates = await _resolve(service.get_todays_candidates())
+    todays_quests = await _resolve(service.get_today_quests())
 
     return templates.TemplateResponse("today.html", {
         "request": request,
@@ -237,22 +253,18 @@ async def mark_today(
     else:
         scope = "today"
 
-    service.set_quest_scope(quest_id, scope)
+    await _resolve(service.set_quest_scope(quest_id, scope))
     return RedirectResponse(f"{BASE_URL}/today", status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.get("/archive", response_class=HTMLResponse)
 async def show_archive(
     request: Request,
-    service: QuestService = Depends(get_quest_service),
     current_user: User = Depends(require_user)
 ):
-    """Страница с завершенными квестами"""
-    quests = service.get_archived_quests()
-
+    """Страница с завершенными квестами (карточки подгружаются постранично через filter-quests)"""
     return templates.TemplateResponse("index.html", {
         "request": request,
-        "quests": quests,
         "get_class": rarity_class,
         "post_url": f"{BASE_URL}/archive/filter-quests",
         "main_text": "Завершённые квесты",
@@ -261,90 +273,30 @@ async def show_archive(
     })
 
 
-@router.post("/filter-quests")
-async def filter_active_quests(
-    request: Request,
-    service: QuestService = Depends(get_quest_service),
-    sort_type: Optional[str] = Form(None),
-    find: Optional[str] = Form(None),
-):
-    """Фильтрация и сортировка активных квестов"""
-    # Разбираем параметры сортировки
+def _parse_sort_type(sort_type: Optional[str]):
+    """Разбирает значение вида 'created-desc' в (sort_by, sort_order)"""
     sort_by = None
     sort_order = 'asc'
     if sort_type:
         parts = sort_type.split('-')
         if len(parts) == 2:
             sort_by, sort_order = parts
+    return sort_by, sort_order
 
-    # Firestore режим: service.db == None
-    if service.db is None:
-        from app.tasks.firestore_service import list_quests as fs_list_quests
-        from app.tasks.database import QuestRarity as DBQuestRarity
-
-        quests_list = fs_list_quests(str(service.user_id), status='active')
-
-        # Поиск (case-insensitive) по основным полям
-        if find:
-            f_lower = find.lower()
-            def matches(q):
-                for field in ('title', 'author', 'description', 'rarity', 'status'):
-                    val = getattr(q, field, None)
-                    if val and f_lower in str(val).lower():
-                        return True
-                return False
-            quests_list = [q for q in quests_list if matches(q)]
-
-            # Попытка найти по дате YYYY-MM-DD (deadline/created)
-            try:
-                date_search = datetime.strptime(find, "%Y-%m-%d").date()
-                def date_match(q):
-                    d = getattr(q, 'deadline', None)
-                    c = getattr(q, 'created', None)
-                    if hasattr(d, 'date') and d.date() == date_search:
-                        return True
-                    if hasattr(c, 'date') and c.date() == date_search:
-                        return True
-                    return False
-                filtered = [q for q in quests_list if date_match(q)]
-                if filtered:
-                    quests_list = filtered
-            except Exception:
-                pass
-
-        # Сортировка
-        if sort_by:
-            reverse = (sort_order != 'asc')
-            if sort_by in ('created', 'deadline'):
-                # None-safe sort: absent dates go to the end
-                quests_list.sort(key=lambda q: getattr(q, sort_by) or datetime.max, reverse=reverse)
-            elif sort_by == 'title':
-                quests_list.sort(key=lambda q: (getattr(q, 'title') or '').lower(), reverse=reverse)
-            elif sort_by == 'cost':
-                quests_list.sort(key=lambda q: int(getattr(q, 'cost', 0) or 0), reverse=reverse)
-            elif sort_by == 'rarity':
-                # Сопоставляем строковые значения редкости с порядком из DB enum
-                order_map = {
-                    DBQuestRarity.common.value: 1,
-                    DBQuestRarity.uncommon.value: 2,
-                    DBQuestRarity.rare.value: 3,
-                    DBQuestRarity.epic.value: 4,
-                    DBQuestRarity.legendary.value: 5,
-                }
-                quests_list.sort(key=lambda q: order_map.get(getattr(q, 'rarity', DBQuestRarity.common.value), 0), reverse=reverse)
-
-        quests = quests_list
 
-    else:
-        db = service.db
-        base_query = db.query(Quest).filter(Quest.status == QuestStatus.active)
-
-        quests = service.filter_quests(
-            base_query=base_query,
+async def _render_quest_page(request: Request, service, active: bool, sort_type, find, cursor):
+    """Страница карточек квестов для filter-quests: HTML карточек и курсор следующей страницы"""
+    sort_by, sort_order = _parse_sort_type(sort_type)
+    try:
+        quests, next_cursor = await _resolve(service.filter_user_quests(
+            active=active,
             search=find,
             sort_by=sort_by,
-            sort_order=sort_order
-        )
+            sort_order=sort_order,
+            cursor=cursor or None
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     cards_html = templates.get_template("_quest_cards.html").render(
         request=request,
@@ -352,125 +304,58 @@ async def filter_active_quests(
         get_class=rarity_class
     )
 
-    return JSONResponse({"cards_html": cards_html})
+    return JSONResponse({"cards_html": cards_html, "next_cursor": next_cursor})
 
 
-@router.post("/archive/filter-quests")
-async def filter_archive_quests(
+@router.post("/filter-quests")
+async def filter_active_quests(
     request: Request,
     service: QuestService = Depends(get_quest_service),
     sort_type: Optional[str] = Form(None),
     find: Optional[str] = Form(None),
+    cursor: Optional[str] = Form(None),
 ):
-    """Фильтрация и сортировка архивных квестов"""
-    # Разбираем параметры сортировки
-    sort_by = None
-    sort_order = 'asc'
-    if sort_type:
-        parts = sort_type.split('-')
-        if len(parts) == 2:
-            sort_by, sort_order = parts
-
-    if service.db is None:
-        from app.tasks.firestore_service import list_quests as fs_list_quests
-        from app.tasks.database import QuestRarity as DBQuestRarity
-
-        quests_list = fs_list_quests(str(service.user_id))
-        # Оставляем только неактивные
-        quests_list = [q for q in quests_list if getattr(q, 'status', None) != 'active']
-
-        if find:
-            f_lower = find.lower()
-            def matches(q):
-                for field in ('title', 'author', 'description', 'rarity', 'status'):
-                    val = getattr(q, field, None)
-                    if val and f_lower in str(val).lower():
-                        return True
-                return False
-            quests_list = [q for q in quests_list if matches(q)]
-
-            try:
-                date_search = datetime.strptime(find, "%Y-%m-%d").date()
-                def date_match(q):
-                    d = getattr(q, 'deadline', None)
-                    c = getattr(q, 'created', None)
-                    if hasattr(d, 'date') and d.date() == date_search:
-                        return True
-                    if hasattr(c, 'date') and c.date() == date_search:
-                        return True
-                    return False
-                filtered = [q for q in quests_list if date_match(q)]
-                if filtered:
-                    quests_list = filtered
-            except Exception:
-                pass
-
-        # Сортировка аналогично
-        if sort_by:
-            reverse = (sort_order != 'asc')
-            if sort_by in ('created', 'deadline'):
-                quests_list.sort(key=lambda q: getattr(q, sort_by) or datetime.max, reverse=reverse)
-            elif sort_by == 'title':
-                quests_list.sort(key=lambda q: (getattr(q, 'title') or '').lower(), reverse=reverse)
-            elif sort_by == 'cost':
-                quests_list.sort(key=lambda q: int(getattr(q, 'cost', 0) or 0), reverse=reverse)
-            elif sort_by == 'rarity':
-                order_map = {
-                    DBQuestRarity.common.value: 1,
-                    DBQuestRarity.uncommon.value: 2,
-                    DBQuestRarity.rare.value: 3,
-                    DBQuestRarity.epic.value: 4,
-                    DBQuestRarity.legendary.value: 5,
-                }
-                quests_list.sort(key=lambda q: order_map.get(getattr(q, 'rarity', DBQuestRarity.common.value), 0), reverse=reverse)
-
-        quests = quests_list
+    """Фильтрация и сортировка активных квестов (постранично)"""
+    return await _render_quest_page(request, service, True, sort_type, find, cursor)
 
-    else:
-        db = service.db
-        base_query = db.query(Quest).filter(Quest.status != QuestStatus.active)
-
-        quests = service.filter_quests(
-            base_query=base_query,
-            search=find,
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
 
-    cards_html = templates.get_template("_quest_cards.html").render(
-        request=request,
-        quests=quests,
-        get_class=rarity_class
-    )
-
-    return JSONResponse({"cards_html": cards_html})
+@router.post("/archive/filter-quests")
+async def filter_archive_quests(
+    request: Request,
+    service: QuestService = Depends(get_quest_service),
+    sort_type: Optional[str] = Form(None),
+    find: Optional[str] = Form(None),
+    cursor: Optional[str] = Form(None),
+):
+    """Фильтрация и сортировка архивных квестов (постранично)"""
+    return await _render_quest_page(request, service, False, sort_type, find, cursor)
 
 
 @router.post("/complete/{quest_id}")
 async def mark_complete(quest_id: int, service: QuestService = Depends(get_quest_service)):
     """Завершить квест успешно"""
-    service.complete_quest(quest_id)
+    await _resolve(service.complete_quest(quest_id))
     return RedirectResponse(BASE_URL, status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.post("/fail/{quest_id}")
 async def mark_fail(quest_id: int, service: QuestService = Depends(get_quest_service)):
     """Провалить квест"""
-    service.fail_quest(quest_id)
+    await _resolve(service.fail_quest(quest_id))
     return RedirectResponse(BASE_URL, status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.post("/uncomplete/{quest_id}")
 async def return_to_active(quest_id: int, service: QuestService = Depends(get_quest_service)):
     """Вернуть квест в активное состояние"""
-    service.return_to_active(quest_id)
+    await _resolve(service.return_to_active(quest_id))
     return RedirectResponse(f"{BASE_URL}/archive", status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.post("/delete/{quest_id}")
 async def delete_quest(quest_id: int, service: QuestService = Depends(get_quest_service)):
     """Удалить квест"""
-    service.delete_quest(quest_id)
+    await _resolve(service.delete_quest(quest_id))
     return RedirectResponse(BASE_URL, status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -481,7 +366,7 @@ async def update_checkbox_subtask(
     service: SubtaskService = Depends(get_subtask_service)
 ):
     """Обновить чекбокс подзадачу"""
-    subtask = service.update_checkbox_subtask(subtask_id, data.get('completed', False))
+    subtask = await _resolve(service.update_checkbox_subtask(subtask_id, data.get('completed', False)))
     if subtask:
         return {"status": "success"}
     return {"status": "error", "message": "Subtask not found"}
@@ -494,7 +379,7 @@ async def update_numeric_subtask(
     service: SubtaskService = Depends(get_subtask_service)
 ):
     """Обновить числовую подзадачу"""
-    subtask = service.update_numeric_subtask(subtask_id, data.get('current', 0))
+    subtask = await _resolve(service.update_numeric_subtask(subtask_id, data.get('current', 0)))
     if subtask:
         return {"status": "success"}
     return {"status": "error", "message": "Subtask not found"}
@@ -506,4 +391,4 @@ async def get_quest_progress(
     service: SubtaskService = Depends(get_subtask_service)
 ):
     """Получить прогресс квеста"""
-    return service.get_quest_progress(quest_id)
+    return await _resolve(service.get_quest_progress(quest_id))
@@ -0,0 +1,259 @@
+"""
+Правила повторения шаблонов квестов (общие для SQL и Firestore).
+
+Шаблон — ORM-объект QuestTemplate или dict документа Firestore (даты там хранятся ISO-строками).
+Вместо проверки «пора ли генерировать» на каждом опросе вычисляется момент следующего запуска
+next_run_at, который хранится в шаблоне и индексируется — планировщик выбирает просто next_run_at <= now.
+Поля расписания компилируются в Recurrence (маска дней недели / интервал + время запуска) один раз
+на набор значений, следующий запуск считается за O(1).
+"""
+from collections import deque
+from datetime import datetime, timedelta, time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+INTERVAL = 'interval'
+
+# Сколько пропущенных запусков шаблона (например, пока приложение было выключено) догенерировать за раз
+MAX_CATCH_UP = 10
+
+
+def _field(template, name: str, default=None):
+    if isinstance(template, dict):
+        value = template.get(name, default)
+    else:
+        value = getattr(template, name, default)
+    return default if value is None else value
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def combine_date_time(date_part: Optional[str], time_part: Optional[str], default_time: str) -> Optional[datetime]:
+    """Дата и время из полей формы шаблона (start_date/start_time, end_date/end_time)"""
+    if not date_part and not time_part:
+        return None
+    try:
+        date_part = date_part or datetime.now().date().isoformat()
+        return datetime.strptime(f"{date_part} {time_part or default_time}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return None
+
+
+def weekday_mask(weekdays) -> int:
+    """Битовая маска дней недели из CSV-строки "0,2,4" (бит 0 — понедельник, бит 6 — воскресенье)"""
+    mask = 0
+    for part in str(weekdays or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) < 7:
+            mask |= 1 << int(part)
+    return mask
+
+
+# _DAYS_UNTIL[mask][weekday] — через сколько дней (0..6) ближайший день недели из маски
+_DAYS_UNTIL = [
+    [next((k for k in range(7) if mask >> ((weekday + k) % 7) & 1), None) for weekday in range(7)]
+    for mask in range(128)
+]
+_EVERY_DAY = 0b1111111
+
+
+class Recurrence:
+    """Скомпилированное правило повторения: маска дней недели и время запуска (daily/weekly)
+    или интервал с опорной точкой start_at (interval). next_occurrence() считается за O(1)."""
+
+    __slots__ = ('kind', 'mask', 'anchor', 'interval', 'start_at', 'end_at')
+
+    def __init__(self, kind: str, mask: int = _EVERY_DAY, anchor: time = time.min,
+                 interval: Optional[timedelta] = None, start_at: Optional[datetime] = None,
+                 end_at: Optional[datetime] = None):
+        self.kind = kind
+        self.mask = mask
+        self.anchor = anchor
+        self.interval = interval
+        self.start_at = start_at
+        self.end_at = end_at
+
+    def next_occurrence(self, after: datetime, inclusive: bool = False) -> Optional[datetime]:
+        """Ближайший запуск позже after (inclusive — не раньше after); None — правило закончилось"""
+        if self.start_at and after < self.start_at:
+            after, inclusive = self.start_at, True
+
+        if self.kind == INTERVAL:
+            if self.start_at is None:
+                # без start_at сетки нет: отсчёт от предыдущего запуска
+                run = after if inclusive else after + self.interval
+            else:
+                run = self.start_at + (after - self.start_at) // self.interval * self.interval
+                if run < after or (run == after and not inclusive):
+                    run += self.interval
+        else:
+            day = after.date()
+            run = datetime.combine(day, self.anchor)
+            if run < after or (run == after and not inclusive):
+                day += timedelta(days=1)
+            run = datetime.combine(day + timedelta(days=_DAYS_UNTIL[self.mask][day.weekday()]), self.anchor)
+
+        if self.end_at and run > self.end_at:
+            return None
+        return run
+
+    def occurrences(self, first: Optional[datetime], count: int) -> List[datetime]:
+        """count запусков начиная с first (first — уже запуск правила, например next_run_at)"""
+        runs = []
+        run = first
+        while run is not None and len(runs) < count:
+            runs.append(run)
+            run = self.next_occurrence(run)
+        return runs
+
+    def missed(self, first: Optional[datetime], now: datetime, limit: int) -> List[datetime]:
+        """Наступившие запуски в [first, now]; если их больше limit — только limit последних"""
+        if first is None or first > now or limit <= 0:
+            return []
+        # перематываем к окну из limit последних запусков, не перебирая пропущенные по одному
+        if self.kind == INTERVAL:
+            skip = (now - first) // self.interval + 1 - limit
+            if skip > 0:
+                first = self.next_occurrence(first + (skip - 1) * self.interval)
+        else:
+            weeks = -(-limit // bin(self.mask).count('1'))
+            floor = datetime.combine(now.date() - timedelta(weeks=weeks), self.anchor)
+            if first < floor:
+                first = self.next_occurrence(floor, inclusive=True)
+
+        runs = deque(maxlen=limit)
+        run = first
+        while run is not None and run <= now:
+            runs.append(run)
+            run = self.next_occurrence(run)
+        return list(runs)
+
+
+@lru_cache(maxsize=4096)
+def _compile(kind, weekdays, interval_hours, start_at, end_at) -> Optional[Recurrence]:
+    anchor = start_at.time() if start_at else time.min
+    if kind == DAILY:
+        return Recurrence(DAILY, _EVERY_DAY, anchor, start_at=start_at, end_at=end_at)
+    if kind == WEEKLY:
+        mask = weekday_mask(weekdays)
+        if not mask:
+            return None
+        return Recurrence(WEEKLY, mask, anchor, start_at=start_at, end_at=end_at)
+    if kind == INTERVAL:
+        try:
+            hours = float(interval_hours or 0)
+        except (TypeError, ValueError):
+            return None
+        if hours <= 0:
+            return None
+        return Recurrence(INTERVAL, interval=timedelta(hours=hours), start_at=start_at, end_at=end_at)
+    return None
+
+
+def compile_recurrence(template) -> Optional[Recurrence]:
+    """Правило повторения шаблона (кешируется по полям расписания); None — шаблон настроен некорректно"""
+    kind = _field(template, 'recurrence_type')
+    if hasattr(kind, 'value'):
+        kind = kind.value
+    return _compile(
+        kind,
+        _field(template, 'weekdays'),
+        _field(template, 'interval_hours'),
+        _as_datetime(_field(template, 'start_at')),
+        _as_datetime(_field(template, 'end_at')),
+    )
+
+
+def next_run_at(template, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Момент следующей генерации по шаблону или None (шаблон выключен, закончился или настроен некорректно).
+
+    Отсчёт идёт от last_generated; до первой генерации — ближайший запуск не раньше max(start_at, now):
+    запуски до создания шаблона не догоняются. Результат никогда не раньше now — после паузы
+    шаблон продолжает с ближайшего будущего запуска (догоняются только запуски после сохранённого
+    next_run_at, см. missed_runs). Для daily/weekly квест создаётся раз в день не раньше времени из start_at.
+    """
+    if not _field(template, 'is_active', True):
+        return None
+    recurrence = compile_recurrence(template)
+    if recurrence is None:
+        return None
+    if now is None:
+        now = datetime.now()
+
+    last_generated = _as_datetime(_field(template, 'last_generated'))
+    if last_generated is None:
+        # next_occurrence сам сдвигает отсчёт на start_at, если он позже now
+        return recurrence.next_occurrence(now, inclusive=True)
+    if recurrence.kind == INTERVAL:
+        run = recurrence.next_occurrence(last_generated)
+    else:
+        day = last_generated.date() + timedelta(days=1)
+        run = recurrence.next_occurrence(datetime.combine(day, time.min), inclusive=True)
+    if run is not None and run < now:
+        run = recurrence.next_occurrence(now, inclusive=True)
+    return run
+
+
+def upcoming(template, count: int, now: Optional[datetime] = None) -> List[datetime]:
+    """Ближайшие count запусков шаблона не раньше now (для предпросмотра расписания)"""
+    recurrence = compile_recurrence(template)
+    if recurrence is None:
+        return []
+    if now is None:
+        now = datetime.now()
+    first = next_run_at(template, now)
+    if first is not None and first < now:
+        first = recurrence.next_occurrence(now, inclusive=True)
+    return recurrence.occurrences(first, count)
+
+
+def missed_runs(template, now: Optional[datetime] = None, limit: int = MAX_CATCH_UP) -> List[datetime]:
+    """Наступившие, но ещё не сгенерированные запуски шаблона: от сохранённого next_run_at до now
+    (например, пока планировщик был выключен), не больше limit последних. Без сохранённого
+    next_run_at догонять нечего"""
+    recurrence = compile_recurrence(template)
+    if recurrence is None:
+        return []
+    if now is None:
+        now = datetime.now()
+    return recurrence.missed(_as_datetime(_field(template, 'next_run_at')), now, limit)
+
+
+def is_due(template, now: Optional[datetime] = None) -> bool:
+    """Пора ли создать квест по шаблону: по сохранённому next_run_at, если расписание уже посчитано"""
+    if now is None:
+        now = datetime.now()
+    if not _field(template, 'is_active', True):
+        return False
+    run = _as_datetime(_field(template, 'next_run_at')) or next_run_at(template, now)
+    return run is not None and run <= now
+
+
+def quest_fields(template, run_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Поля нового квеста по шаблону для запуска run_at (без user_id и статуса)"""
+    if run_at is None:
+        run_at = datetime.now()
+    try:
+        duration = int(_field(template, 'duration_hours', 24))
+    except (TypeError, ValueError):
+        duration = 24
+    return {
+        'title': _field(template, 'title'),
+        'author': _field(template, 'author', '???'),
+        'description': _field(template, 'description', ''),
+        'cost': int(_field(template, 'cost', 0)),
+        'rarity': _field(template, 'rarity'),
+        'scope': _field(template, 'scope'),
+        'created': run_at,
+        'deadline': run_at + timedelta(hours=duration),
+        'is_new': True,
+    }
@@ -0,0 +1,193 @@
+"""
+Полнотекстовый поиск по квестам.
+
+SQLite: виртуальная таблица FTS5 `quests_fts` (external content на quests), поддерживается триггерами, ранжирование bm25.
+PostgreSQL: GIN-индекс по выражению to_tsvector(...), ранжирование ts_rank.
+Оба варианта поддерживают поиск по префиксу слова. Строка вида YYYY-MM-DD / DD.MM.YYYY ищется
+диапазонным запросом по deadline/created (индексы ix_quests_user_deadline / ix_quests_user_created в модели Quest).
+Firestore: в документе квеста хранится массив префиксов слов `search_tokens` (см. firestore_service).
+"""
+import re
+from datetime import datetime, timedelta, date
+from typing import List, Optional
+
+from sqlalchemy import text, func, literal_column, select, or_, and_, table, column
+from sqlalchemy.engine import Connection
+
+from app.tasks.database import Quest, QuestRarity, QuestStatus
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Ограничения на префиксы для токен-индекса Firestore
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+
+_PG_CONFIG = 'simple'
+# Выражение должно совпадать с индексом ix_quests_search, иначе PostgreSQL не сможет его использовать
+_PG_DOCUMENT = (
+    f"to_tsvector('{_PG_CONFIG}', coalesce(quests.title, '') || ' ' || "
+    "coalesce(quests.author, '') || ' ' || coalesce(quests.description, ''))"
+)
+
+_quests_fts = table('quests_fts', column('rowid'), column('rank'))
+
+_SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE quests_fts USING fts5(
+        title, author, description,
+        content='quests', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS quests_fts_ai AFTER INSERT ON quests BEGIN
+        INSERT INTO quests_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS quests_fts_ad AFTER DELETE ON quests BEGIN
+        INSERT INTO quests_fts(quests_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS quests_fts_au AFTER UPDATE OF title, author, description ON quests BEGIN
+        INSERT INTO quests_fts(quests_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO quests_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    "INSERT INTO quests_fts(quests_fts) VALUES ('rebuild')",
+]
+
+# Диалекты, для которых индекс поиска создан (для SQLite без FTS5 остаётся поиск через ilike)
+_fts_ready = {}
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Слова строки в нижнем регистре"""
+    if not value:
+        return []
+    return [w.lower() for w in _WORD_RE.findall(str(value))]
+
+
+def prefix_tokens(*values: Optional[str]) -> List[str]:
+    """Все префиксы слов (MIN_PREFIX..MAX_PREFIX символов) — токены для индекса Firestore"""
+    tokens = set()
+    for value in values:
+        for word in tokenize(value):
+            word = word[:MAX_PREFIX]
+            if len(word) < MIN_PREFIX:
+                tokens.add(word)
+                continue
+            for i in range(MIN_PREFIX, len(word) + 1):
+                tokens.add(word[:i])
+    return sorted(tokens)
+
+
+def parse_date_query(search: Optional[str]) -> Optional[date]:
+    """Дата из поисковой строки (YYYY-MM-DD или DD.MM.YYYY)"""
+    if not search:
+        return None
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(search.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def day_range(day: date):
+    """Полуинтервал [начало дня, начало следующего дня)"""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def ensure_search_index(conn: Connection):
+    """Создаёт индекс полнотекстового поиска (FTS5 / GIN). Вызывается при старте после create_all."""
+    dialect = conn.dialect.name
+
+    if dialect == 'sqlite':
+        exists = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='quests_fts'"
+        )).first()
+        if not exists:
+            try:
+                for ddl in _SQLITE_SETUP:
+                    conn.execute(text(ddl))
+            except Exception as e:
+                print('⚠️ FTS5 недоступен, поиск квестов работает без индекса:', e)
+                return
+        _fts_ready[dialect] = True
+
+    elif dialect == 'postgresql':
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_quests_search ON quests USING GIN ({_PG_DOCUMENT})"))
+        _fts_ready[dialect] = True
+
+
+def _fts_available(session) -> Optional[str]:
+    """Диалект с готовым полнотекстовым индексом или None"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return dialect
+    if dialect == 'sqlite' and dialect not in _fts_ready:
+        # индекс мог быть создан другим процессом (например, при старте приложения)
+        _fts_ready[dialect] = session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='quests_fts'"
+        )).first() is not None
+    return dialect if _fts_ready.get(dialect) else None
+
+
+def _enum_matches(enum_cls, search: str) -> list:
+    """Значения enum, подпись или имя которых начинается с поисковой строки"""
+    needle = search.strip().lower()
+    if len(needle) < 3:
+        return []
+    return [m for m in enum_cls if m.value.lower().startswith(needle) or m.name.startswith(needle)]
+
+
+def apply_search(query, search: Optional[str]):
+    """Добавляет к запросу квестов условия поиска.
+
+    Возвращает (запрос, выражение релевантности или None); меньшее значение релевантности — лучшее совпадение.
+    """
+    if not search or not search.strip():
+        return query, None
+
+    day = parse_date_query(search)
+    if day is not None:
+        start, end = day_range(day)
+        return query.filter(or_(
+            and_(Quest.deadline >= start, Quest.deadline < end),
+            and_(Quest.created >= start, Quest.created < end),
+        )), None
+
+    words = tokenize(search)
+    enum_conditions = []
+    rarities = _enum_matches(QuestRarity, search)
+    if rarities:
+        enum_conditions.append(Quest.rarity.in_(rarities))
+    statuses = _enum_matches(QuestStatus, search)
+    if statuses:
+        enum_conditions.append(Quest.status.in_(statuses))
+
+    dialect = _fts_available(query.session) if words else None
+    if dialect is None:
+        pattern = f"%{search}%"
+        return query.filter(or_(
+            Quest.title.ilike(pattern),
+            Quest.author.ilike(pattern),
+            Quest.description.ilike(pattern),
+            *enum_conditions
+        )), None
+
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{w}"*' for w in words)
+        hits = (select(_quests_fts.c.rowid.label('quest_id'), _quests_fts.c.rank.label('score'))
+                .select_from(_quests_fts)
+                .where(literal_column('quests_fts').op('MATCH')(match))
+                .subquery('search_hits'))
+    else:
+        ts_query = func.to_tsquery(_PG_CONFIG, ' & '.join(f'{w}:*' for w in words))
+        document = literal_column(_PG_DOCUMENT)
+        hits = (select(Quest.id.label('quest_id'), (-func.ts_rank(document, ts_query)).label('score'))
+                .where(document.op('@@')(ts_query))
+                .subquery('search_hits'))
+
+    query = query.outerjoin(hits, hits.c.quest_id == Quest.id).filter(
+        or_(hits.c.quest_id.isnot(None), *enum_conditions)
+    )
+    return query, func.coalesce(hits.c.score, 0.0)
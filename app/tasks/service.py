@@ -1,21 +1,69 @@
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, case
+from typing import List, Optional, Dict, Any, Callable, Tuple
+import base64
+import json
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, case, select, insert, update, delete, func, literal, union_all
 from fastapi import HTTPException
 
 from app.tasks.database import (
     Quest, QuestStatus, QuestRarity, CheckboxSubtask,
-    NumericSubtask
+    NumericSubtask, calc_progress, quest_relationship, quest_closure
 )
 from app.tasks.firestore_service import (
     list_quests as fs_list_quests,
     get_quest as fs_get_quest,
     create_quest as fs_create_quest,
     update_quest as fs_update_quest,
-    delete_quest as fs_delete_quest
+    delete_quest as fs_delete_quest,
+    search_quests_by_date as fs_search_quests_by_date
 )
+from app.tasks.expiry import notify_deadline
+from app.tasks.search import apply_search, parse_date_query, day_range, tokenize, prefix_tokens, MAX_PREFIX
 from app.shop.service import QuestTemplateService
+from app.auth.identity import change_currency
+
+# Размер страницы списков квестов (active/archive, filter-quests)
+PAGE_SIZE = 30
+# Заглушка для сортировки квестов без даты (в SQL NULL нельзя сравнивать в keyset-условии)
+_NO_DATE = datetime(9999, 12, 31)
+_FS_ARCHIVE_STATUSES = ['finished', 'failed', 'inactive', 'abstract']
+
+
+def _encode_cursor(state: Dict[str, Any]) -> str:
+    """Непрозрачный курсор страницы (base64 от JSON)"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор страницы")
+    if not isinstance(state, dict):
+        raise ValueError("Некорректный курсор страницы")
+    return state
+
+
+def _subtask_dicts_weights(subtasks: List[Dict[str, Any]]) -> tuple:
+    """Суммарный и выполненный вес подзадач, заданных словарями (Firestore / данные формы)"""
+    total = 0
+    completed = 0.0
+    for s in subtasks or []:
+        w = s.get('weight', 1)
+        total += w
+        if s.get('type') == 'checkbox':
+            if s.get('completed'):
+                completed += w
+        elif s.get('type') == 'numeric':
+            current = s.get('current', 0) or 0
+            target = s.get('target', 0) or 0
+            if current >= target:
+                completed += w
+            elif target > 0:
+                completed += w * (current / target)
+    return total, completed
 
 class QuestService:
     """Сервис для работы с квестами"""
@@ -30,11 +78,19 @@ class QuestService:
             return Quest.id.is_(None)
         return Quest.user_id == self.user_id
 
+    def run_sync(self, fn: Callable, *args, **kwargs):
+        """Вызвать функцию, принимающую Session первым аргументом (например, QuestTemplateService)"""
+        return fn(self.db, *args, **kwargs)
+
     def get_quest_by_id(self, quest_id: int) -> Optional[Quest]:
         """Получить квест по ID (только для текущего пользователя)"""
         if self.db is None:
             return fs_get_quest(str(quest_id))
-        return self.db.query(Quest).filter(
+        # цепочка квестов и подзадачи нужны странице квеста, подгружаем их сразу, а не ленивыми запросами из шаблона
+        return self.db.query(Quest).options(
+            selectinload(Quest.parents), selectinload(Quest.children),
+            selectinload(Quest.checkbox_subtasks), selectinload(Quest.numeric_subtasks)
+        ).filter(
             Quest.id == quest_id,
             self._get_user_filter()
         ).first()
@@ -80,6 +136,7 @@ class QuestService:
             raise ValueError("User ID is required to create a quest")
 
         if self.db is None:
+            total_weight, completed_weight = _subtask_dicts_weights(subtasks_data)
             payload = {
                 'title': title,
                 'author': author,
@@ -90,6 +147,9 @@ class QuestService:
                 'cost': cost,
                 'parents': parent_ids or [],
                 'subtasks': subtasks_data or [],
+                'total_weight': total_weight,
+                'completed_weight': completed_weight,
+                'progress': calc_progress(total_weight, completed_weight),
                 'status': 'active'
             }
             return fs_create_quest(str(self.user_id), payload)
@@ -108,31 +168,26 @@ class QuestService:
         self.db.flush()
 
         if parent_ids:
-            parents = self.db.query(Quest).filter(
-                Quest.id.in_(parent_ids),
-                self._get_user_filter()
-            ).all()
-            quest.parents.extend(parents)
-
-            # Если все родители завершены - квест активен
-            if all(p.status == QuestStatus.finished for p in parents):
-                quest.status = QuestStatus.active
-            else:
-                quest.status = QuestStatus.inactive
-        else:
-            quest.status = QuestStatus.active
+            self._attach_parents(quest, parent_ids)
+
+        # Если все родители завершены - квест активен
+        quest.status = QuestStatus.active if quest.is_active else QuestStatus.inactive
 
         if subtasks_data:
-            self._create_subtasks(quest.id, subtasks_data)
+            quest.set_weights(*self._create_subtasks(quest.id, subtasks_data))
 
         self.db.commit()
+        if quest.status == QuestStatus.active:
+            notify_deadline(deadline, quest.id)
         return quest
 
-    def _create_subtasks(self, quest_id: int, subtasks_data: List[Dict[str, Any]]):
-        """Создать подзадачи для квеста"""
+    def _create_subtasks(self, quest_id: int, subtasks_data: List[Dict[str, Any]]) -> tuple:
+        """Создать подзадачи для квеста. Возвращает (суммарный вес, выполненный вес) для прогресса квеста"""
         if self.db is None:
             # Firestore mode: subtasks are saved inside quest document during create
-            return
+            return _subtask_dicts_weights(subtasks_data)
+        total_weight = 0
+        completed_weight = 0.0
         for subtask_info in subtasks_data:
             if subtask_info['type'] == 'checkbox':
                 subtask = CheckboxSubtask(
@@ -153,6 +208,9 @@ class QuestService:
                 continue
 
             self.db.add(subtask)
+            total_weight += subtask.weight
+            completed_weight += subtask.completed_weight
+        return total_weight, completed_weight
 
     def mark_quest_read(self, quest_id: int) -> Optional[Quest]:
         """Отметить квест как прочитанный"""
@@ -186,11 +244,11 @@ class QuestService:
 
         quest = self.get_quest_by_id(quest_id)
         if quest:
-            quest.status = QuestStatus.finished
-            self._update_children_status(quest)
+            self._set_status(quest, QuestStatus.finished)
 
-            if quest.user:
-                quest.user.currency += quest.cost
+            if quest.user_id and quest.cost:
+                # Атомарное начисление: quest.user может быть снимком из кеша с устаревшим балансом
+                change_currency(self.db, quest.user_id, quest.cost)
 
             self.db.commit()
         return quest
@@ -206,8 +264,7 @@ class QuestService:
 
         quest = self.get_quest_by_id(quest_id)
         if quest:
-            quest.status = QuestStatus.failed
-            self._update_children_status(quest)
+            self._set_status(quest, QuestStatus.failed)
             self.db.commit()
         return quest
 
@@ -218,9 +275,9 @@ class QuestService:
             return fs_get_quest(str(quest_id))
         quest = self.get_quest_by_id(quest_id)
         if quest:
-            quest.status = QuestStatus.active
-            self._update_children_status(quest)
+            self._set_status(quest, QuestStatus.active)
             self.db.commit()
+            notify_deadline(quest.deadline, quest.id)
         return quest
 
     def delete_quest(self, quest_id: int) -> bool:
@@ -229,18 +286,120 @@ class QuestService:
             return fs_delete_quest(str(quest_id))
         quest = self.get_quest_by_id(quest_id)
         if quest:
+            self._detach_from_graph(quest)
             self.db.delete(quest)
             self.db.commit()
             return True
         return False
 
-    @staticmethod
-    def _update_children_status(quest: Quest):
-        """Обновить статусы дочерних квестов"""
-        for child in quest.children:
-            if child.status == QuestStatus.inactive:
-                if all(p.status == QuestStatus.finished for p in child.parents):
-                    child.status = QuestStatus.active
+    def _attach_parents(self, quest: Quest, parent_ids: List[int]):
+        """Привязать родителей к новому квесту и дописать замыкание графа (квест ещё без потомков)"""
+        parents = self.db.query(Quest).filter(
+            Quest.id.in_(parent_ids),
+            self._get_user_filter()
+        ).all()
+        if not parents:
+            return
+
+        ids = [p.id for p in parents]
+        # цикл возникает, если кто-то из родителей уже является потомком квеста
+        cycle = quest.id in ids or self.db.execute(
+            select(quest_closure.c.descendant_id).where(
+                quest_closure.c.ancestor_id == quest.id,
+                quest_closure.c.descendant_id.in_(ids)
+            ).limit(1)
+        ).first()
+        if cycle:
+            raise ValueError("Связь с родительским квестом образует цикл")
+
+        quest.parents.extend(parents)
+        quest.unfinished_parents = sum(1 for p in parents if p.status != QuestStatus.finished)
+        self.db.flush()
+
+        # предки нового квеста: сами родители (1 путь) и их предки (пути через каждого родителя)
+        sources = union_all(
+            select(quest_relationship.c.parent_id.label('ancestor_id'), literal(1).label('paths'))
+            .where(quest_relationship.c.child_id == quest.id),
+            select(quest_closure.c.ancestor_id, quest_closure.c.paths)
+            .where(quest_closure.c.descendant_id.in_(ids))
+        ).subquery()
+        self.db.execute(insert(quest_closure).from_select(
+            ['ancestor_id', 'descendant_id', 'paths'],
+            select(sources.c.ancestor_id, literal(quest.id), func.sum(sources.c.paths))
+            .group_by(sources.c.ancestor_id)
+        ))
+
+    def _set_status(self, quest: Quest, status: QuestStatus):
+        """Сменить статус квеста и, если изменилась завершённость, пересчитать зависимый подграф"""
+        was_finished = quest.status == QuestStatus.finished
+        quest.status = status
+        is_finished = status == QuestStatus.finished
+        if was_finished != is_finished:
+            self._propagate_finished(quest.id, -1 if is_finished else 1)
+
+    def _propagate_finished(self, quest_id: int, delta: int):
+        """Сдвинуть счётчик незавершённых родителей у детей и переоценить статусы всех потомков.
+
+        Несколько set-based UPDATE вместо обхода графа: потомки берутся из quest_closure.
+        """
+        children = select(quest_relationship.c.child_id).where(quest_relationship.c.parent_id == quest_id)
+        self.db.execute(
+            update(Quest).where(Quest.id.in_(children))
+            .values(unfinished_parents=Quest.unfinished_parents + delta)
+            .execution_options(synchronize_session='fetch')
+        )
+        self._reevaluate_statuses(
+            select(quest_closure.c.descendant_id).where(quest_closure.c.ancestor_id == quest_id)
+        )
+
+    def _reevaluate_statuses(self, quest_ids):
+        """Разблокировать квесты без незавершённых родителей и заблокировать активные с ними"""
+        self.db.execute(
+            update(Quest).where(
+                Quest.id.in_(quest_ids),
+                Quest.status == QuestStatus.inactive,
+                Quest.unfinished_parents <= 0
+            ).values(status=QuestStatus.active).execution_options(synchronize_session='fetch')
+        )
+        self.db.execute(
+            update(Quest).where(
+                Quest.id.in_(quest_ids),
+                Quest.status == QuestStatus.active,
+                Quest.unfinished_parents > 0
+            ).values(status=QuestStatus.inactive).execution_options(synchronize_session='fetch')
+        )
+
+    def _detach_from_graph(self, quest: Quest):
+        """Убрать квест из графа перед удалением: пути через него вычитаются из замыкания"""
+        child_ids = [c.id for c in quest.children]
+
+        outer = quest_closure
+        up = quest_closure.alias('up')
+        down = quest_closure.alias('down')
+        # paths(a, d) -= paths(a, quest) * paths(quest, d) для всех предков a и потомков d квеста
+        through = (select(up.c.paths * down.c.paths)
+                   .where(up.c.ancestor_id == outer.c.ancestor_id, up.c.descendant_id == quest.id,
+                          down.c.ancestor_id == quest.id, down.c.descendant_id == outer.c.descendant_id)
+                   .scalar_subquery())
+        self.db.execute(
+            update(outer).where(
+                outer.c.ancestor_id.in_(select(up.c.ancestor_id).where(up.c.descendant_id == quest.id)),
+                outer.c.descendant_id.in_(select(down.c.descendant_id).where(down.c.ancestor_id == quest.id))
+            ).values(paths=outer.c.paths - through)
+        )
+        self.db.execute(delete(quest_closure).where(or_(
+            quest_closure.c.paths <= 0,
+            quest_closure.c.ancestor_id == quest.id,
+            quest_closure.c.descendant_id == quest.id
+        )))
+
+        if child_ids and quest.status != QuestStatus.finished:
+            self.db.execute(
+                update(Quest).where(Quest.id.in_(child_ids))
+                .values(unfinished_parents=Quest.unfinished_parents - 1)
+                .execution_options(synchronize_session='fetch')
+            )
+            self._reevaluate_statuses(child_ids)
 
     def set_quest_scope(self, quest_id: int, scope: str) -> Optional[Quest]:
         """Установить область видимости квеста (today/not_today)"""
@@ -253,61 +412,183 @@ class QuestService:
             self.db.commit()
         return quest
 
+    @staticmethod
+    def _apply_search(query, search: Optional[str]):
+        """Условия поиска по квестам: (запрос, выражение релевантности или None)"""
+        return apply_search(query, search)
+
+    @staticmethod
+    def _sort_expression(sort_by: Optional[str]):
+        """Выражение сортировки; даты без значения уходят в конец (по возрастанию)"""
+        if sort_by in ('created', 'deadline'):
+            return func.coalesce(getattr(Quest, sort_by), _NO_DATE)
+        if sort_by in ('title', 'cost'):
+            return getattr(Quest, sort_by)
+        if sort_by == 'rarity':
+            return case(
+                {
+                    QuestRarity.common: 1,
+                    QuestRarity.uncommon: 2,
+                    QuestRarity.rare: 3,
+                    QuestRarity.epic: 4,
+                    QuestRarity.legendary: 5
+                },
+                value=Quest.rarity,
+                else_=0,
+            )
+        return None
+
     @staticmethod
     def filter_quests(
-            base_query,
+        base_query,
         search: Optional[str] = None,
         sort_by: Optional[str] = None,
         sort_order: str = 'asc'
     ) -> List[Quest]:
         """Фильтрация и сортировка квестов"""
-        query = base_query
-
-        if search:
-            search_pattern = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Quest.title.ilike(search_pattern),
-                    Quest.author.ilike(search_pattern),
-                    Quest.description.ilike(search_pattern),
-                    Quest.rarity.ilike(search_pattern),
-                    Quest.status.ilike(search_pattern),
-                )
-            )
+        query, relevance = QuestService._apply_search(base_query, search)
 
-            try:
-                date_search = datetime.strptime(search, "%Y-%m-%d").date()
-                query = query.filter(
-                    or_(
-                        Quest.deadline == date_search,
-                        Quest.created == date_search,
-                    )
-                )
-            except ValueError:
-                pass
+        order_expr = QuestService._sort_expression(sort_by)
+        if order_expr is not None:
+            query = query.order_by(order_expr.asc() if sort_order == 'asc' else order_expr.desc())
+        elif relevance is not None:
+            query = query.order_by(relevance.asc())
 
-        if sort_by:
-            is_asc = sort_order == 'asc'
+        return query.all()
 
-            if sort_by in ('created', 'deadline', 'title', 'cost'):
-                sort_column = getattr(Quest, sort_by)
-                query = query.order_by(sort_column.asc() if is_asc else sort_column.desc())
+    def filter_user_quests(
+        self,
+        active: bool = True,
+        search: Optional[str] = None,
+        sort_by: Optional[str] = None,
+        sort_order: str = 'asc',
+        cursor: Optional[str] = None,
+        limit: int = PAGE_SIZE
+    ) -> Tuple[list, Optional[str]]:
+        """Страница активных (или архивных) квестов текущего пользователя.
+
+        Keyset-пагинация по (ключ сортировки или релевантность поиска, id): возвращает квесты и курсор
+        следующей страницы (None — страниц больше нет).
+        """
+        if self.db is None:
+            return self._fs_filter_user_quests(active, search, sort_by, sort_order, cursor, limit)
 
-            elif sort_by == 'rarity':
-                order_expr = case(
-                    {
-                        QuestRarity.common: 1,
-                        QuestRarity.uncommon: 2,
-                        QuestRarity.rare: 3,
-                        QuestRarity.epic: 4,
-                        QuestRarity.legendary: 5
-                    },
-                    value=Quest.rarity,
-                    else_=0,
-                )
-                query = query.order_by(order_expr.asc() if is_asc else order_expr.desc())
+        status_filter = Quest.status == QuestStatus.active if active else Quest.status != QuestStatus.active
+        query, relevance = self._apply_search(
+            self.db.query(Quest).filter(status_filter, self._get_user_filter()),
+            search
+        )
 
-        return query.all()
+        key = self._sort_expression(sort_by)
+        descending = sort_order == 'desc'
+        if key is None and relevance is not None:
+            # без явной сортировки результаты поиска идут по релевантности
+            key, descending = relevance, False
+        if key is None:
+            key = Quest.id
+
+        if cursor:
+            state = _decode_cursor(cursor)
+            try:
+                last_key = state['k']
+                last_id = int(state['id'])
+                if sort_by in ('created', 'deadline'):
+                    last_key = datetime.fromisoformat(last_key)
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Некорректный курсор страницы")
+            if descending:
+                query = query.filter(or_(key < last_key, and_(key == last_key, Quest.id < last_id)))
+            else:
+                query = query.filter(or_(key > last_key, and_(key == last_key, Quest.id > last_id)))
+
+        query = query.order_by(*(c.desc() if descending else c.asc() for c in (key, Quest.id)))
+        rows = query.add_columns(key.label('sort_key')).limit(limit + 1).all()
+
+        quests = [row[0] for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last_quest, last_key = rows[limit - 1]
+            if isinstance(last_key, datetime):
+                last_key = last_key.isoformat()
+            next_cursor = _encode_cursor({'k': last_key, 'id': last_quest.id})
+        return quests, next_cursor
+
+    def _fs_filter_user_quests(self, active, search, sort_by, sort_order, cursor, limit) -> Tuple[list, Optional[str]]:
+        """Firestore: страница квестов пользователя.
+
+        Без поиска сортировка и постраничная выборка выполняются запросом (order_by + start_after).
+        Поиск идёт по индексу префиксов search_tokens (или диапазону дат), результаты сортируются
+        в памяти и листаются курсором-смещением.
+        """
+        descending = sort_order == 'desc'
+        state = _decode_cursor(cursor) if cursor else {}
+
+        if not search and sort_by != 'rarity':
+            quests_list = fs_list_quests(
+                str(self.user_id),
+                status='active' if active else None,
+                status_in=None if active else _FS_ARCHIVE_STATUSES,
+                order_by=sort_by or 'created',
+                descending=descending,
+                limit=limit + 1,
+                start_after=state.get('after')
+            )
+            next_cursor = None
+            if len(quests_list) > limit:
+                quests_list = quests_list[:limit]
+                next_cursor = _encode_cursor({'after': quests_list[-1].id})
+            return quests_list, next_cursor
+
+        fs_status = 'active' if active else None
+        fs_status_in = None if active else _FS_ARCHIVE_STATUSES
+        day = parse_date_query(search)
+        words = tokenize(search)
+        if day is not None:
+            start, end = day_range(day)
+            quests_list = fs_search_quests_by_date(str(self.user_id), start, end, status=fs_status, status_in=fs_status_in)
+        elif words:
+            # самое длинное слово — самое избирательное: его префикс ищется по индексу search_tokens,
+            # остальные слова проверяются по токенам найденных документов
+            primary = max(words, key=len)[:MAX_PREFIX]
+            quests_list = fs_list_quests(str(self.user_id), status=fs_status, status_in=fs_status_in, token=primary)
+            quests_list = [
+                q for q in quests_list
+                if all(w[:MAX_PREFIX] in (getattr(q, 'search_tokens', None) or []) for w in words)
+            ]
+            if not sort_by:
+                # релевантность: совпадения в названии важнее совпадений в авторе/описании
+                def relevance(q):
+                    title_tokens = set(prefix_tokens(getattr(q, 'title', None)))
+                    return sum(2 if w[:MAX_PREFIX] in title_tokens else 1 for w in words)
+                quests_list.sort(key=relevance, reverse=True)
+        else:
+            quests_list = fs_list_quests(str(self.user_id), status=fs_status, status_in=fs_status_in)
+
+        # Сортировка
+        if sort_by:
+            reverse = descending
+            if sort_by in ('created', 'deadline'):
+                # None-safe sort: absent dates go to the end
+                quests_list.sort(key=lambda q: getattr(q, sort_by) or datetime.max, reverse=reverse)
+            elif sort_by == 'title':
+                quests_list.sort(key=lambda q: (getattr(q, 'title') or '').lower(), reverse=reverse)
+            elif sort_by == 'cost':
+                quests_list.sort(key=lambda q: int(getattr(q, 'cost', 0) or 0), reverse=reverse)
+            elif sort_by == 'rarity':
+                # Сопоставляем строковые значения редкости с порядком из DB enum
+                order_map = {
+                    QuestRarity.common.value: 1,
+                    QuestRarity.uncommon.value: 2,
+                    QuestRarity.rare.value: 3,
+                    QuestRarity.epic.value: 4,
+                    QuestRarity.legendary.value: 5,
+                }
+                quests_list.sort(key=lambda q: order_map.get(getattr(q, 'rarity', QuestRarity.common.value), 0), reverse=reverse)
+
+        offset = int(state.get('offset', 0))
+        page = quests_list[offset:offset + limit]
+        next_cursor = _encode_cursor({'offset': offset + limit}) if offset + limit < len(quests_list) else None
+        return page, next_cursor
 
     def get_todays_candidates(self) -> list[type[Quest]]:
         """Получить кандидатов на сегодняшние квесты"""
@@ -318,23 +599,17 @@ class QuestService:
             candidates = [q for q in all_q if getattr(q, 'deadline', None) and q.deadline <= now + timedelta(days=2)]
             return candidates
 
-        failed = self.db.query(Quest).filter(
-            Quest.status == QuestStatus.active,
-            Quest.deadline < datetime.now()
-        ).all()
-
-        for quest in failed:
-            quest.status = QuestStatus.failed
-
-        self.db.commit()
-
+        # просроченные квесты проваливает фоновый воркер (app/tasks/expiry.py), страница только читает
+        now = datetime.now()
         today_candidates = self.db.query(Quest).filter(
             Quest.status == QuestStatus.active,
+            self._get_user_filter(),
             or_(
                 Quest.scope.is_(None),
-                Quest.scope.notin_(["today", f"not_today_{datetime.now().date()}"])
+                Quest.scope.notin_(["today", f"not_today_{now.date()}"])
             ),
-            Quest.deadline <= datetime.now() + timedelta(days=2)
+            Quest.deadline > now,
+            Quest.deadline <= now + timedelta(days=2)
         ).all()
 
         return today_candidates
@@ -345,7 +620,7 @@ class QuestService:
             all_q = fs_list_quests(str(self.user_id), status='active')
             return [q for q in all_q if getattr(q, 'scope', None) == 'today']
         return (self.db.query(Quest)
-                .filter(Quest.status == QuestStatus.active)
+                .filter(Quest.status == QuestStatus.active, self._get_user_filter())
                 .filter(Quest.scope == "today")
                 .order_by(Quest.deadline.asc())
                 .all())
@@ -357,6 +632,25 @@ class SubtaskService:
     def __init__(self, db: Session):
         self.db = db
 
+    def _apply_progress_delta(self, quest_id: int, completed_delta: float):
+        """Инкрементально сдвинуть выполненный вес квеста и пересчитать сохранённый процент.
+
+        Выполняется в транзакции изменения подзадачи; инкремент делается на стороне БД,
+        поэтому параллельные отметки подзадач одного квеста не теряют друг друга.
+        """
+        if not completed_delta:
+            return
+        self.db.query(Quest).filter(Quest.id == quest_id).update(
+            {Quest.completed_weight: Quest.completed_weight + completed_delta},
+            synchronize_session=False
+        )
+        row = self.db.query(Quest.total_weight, Quest.completed_weight).filter(Quest.id == quest_id).first()
+        if row:
+            self.db.query(Quest).filter(Quest.id == quest_id).update(
+                {Quest.progress: calc_progress(row.total_weight, row.completed_weight)},
+                synchronize_session=False
+            )
+
     def update_checkbox_subtask(self, subtask_id: int, completed: bool) -> Optional[CheckboxSubtask]:
         """Обновить чекбокс подзадачу"""
         if self.db is None:
@@ -364,7 +658,9 @@ class SubtaskService:
             return None
         subtask = self.db.query(CheckboxSubtask).filter(CheckboxSubtask.id == subtask_id).first()
         if subtask:
+            before = subtask.completed_weight
             subtask.completed = completed
+            self._apply_progress_delta(subtask.quest_id, subtask.completed_weight - before)
             self.db.commit()
         return subtask
 
@@ -375,7 +671,9 @@ class SubtaskService:
             return None
         subtask = self.db.query(NumericSubtask).filter(NumericSubtask.id == subtask_id).first()
         if subtask:
+            before = subtask.completed_weight
             subtask.current = current
+            self._apply_progress_delta(subtask.quest_id, subtask.completed_weight - before)
             self.db.commit()
         return subtask
 
@@ -385,59 +683,23 @@ class SubtaskService:
             q = fs_get_quest(str(quest_id))
             if not q:
                 return {"progress": 0, "total": 0, "completed": 0}
-            # naive progress calculation from subtasks
-            subtasks = getattr(q, 'subtasks', [])
-            total = 0
-            completed = 0
-            for s in subtasks:
-                w = s.get('weight', 1)
-                total += w
-                if s.get('type') == 'checkbox' and s.get('completed'):
-                    completed += w
-                elif s.get('type') == 'numeric' and s.get('current', 0) >= s.get('target', 0):
-                    completed += w
-                else:
-                    if s.get('type') == 'numeric':
-                        completed += w * (s.get('current', 0) / max(1, s.get('target', 1)))
-            prog = round((completed / total) * 100) if total > 0 else 0
-            return {"progress": prog, "total": total, "completed": completed}
-        quest = self.db.query(Quest).filter(Quest.id == quest_id).first()
-        if not quest:
+            if getattr(q, 'progress', None) is not None:
+                return {"progress": q.progress, "total": getattr(q, 'total_weight', 0),
+                        "completed": getattr(q, 'completed_weight', 0)}
+            total, completed = _subtask_dicts_weights(getattr(q, 'subtasks', []))
+            return {"progress": calc_progress(total, completed), "total": total, "completed": completed}
+        row = self.db.query(Quest.progress, Quest.total_weight, Quest.completed_weight).filter(
+            Quest.id == quest_id
+        ).first()
+        if not row:
             return {"progress": 0, "total": 0, "completed": 0}
+        return {"progress": row.progress, "total": row.total_weight, "completed": row.completed_weight}
 
     @staticmethod
-    def generate_due_quests(db: Session, user_id: int) -> List[Quest]:
-        if db is None:
-            # Firestore mode: use robust template-generation helpers
-            from app.tasks.firestore_service import list_templates as fs_list_templates
-            from app.tasks.firestore_service import should_generate_template, generate_quest_from_template
-
-            templates = fs_list_templates(str(user_id))
-            generated = []
-            now = datetime.now()
-            for t in templates:
-                try:
-                    # convert SimpleNamespace or dict to dict
-                    tdoc = t.__dict__ if hasattr(t, '__dict__') else dict(t)
-                    if should_generate_template(tdoc, now=now):
-                        created = generate_quest_from_template(tdoc, str(user_id))
-                        if created:
-                            generated.append(created)
-                except Exception:
-                    continue
-            return generated
-
-        templates = QuestTemplateService.get_templates(db, user_id, active_only=True)
-        generated = []
-        now = datetime.now()
-        for t in templates:
-            try:
-                if t.should_generate(now):
-                    q = t.generate_quest(db)
-                    generated.append(q)
-            except Exception:
-                continue
-        return generated
+    def generate_due_quests(db: Session, user_id: int) -> List[int]:
+        """Квесты по наступившим шаблонам пользователя; возвращает id созданных квестов"""
+        from app.tasks.generator import generate_due_templates
+        return generate_due_templates(db, user_id=user_id)
 
     @staticmethod
     def trigger_generation(db: Session, template_id: int, user_id: int) -> Quest:
@@ -454,3 +716,86 @@ class SubtaskService:
         if not template:
             raise HTTPException(status_code=404, detail="Шаблон не найден")
         return template.generate_quest(db)
+
+
+class AsyncQuestService:
+    """Асинхронный вариант QuestService поверх AsyncSession.
+
+    Логика запросов общая с QuestService: каждый метод выполняется через AsyncSession.run_sync,
+    поэтому ввод-вывод идёт через async драйвер (aiosqlite/asyncpg) и не блокирует event loop.
+    """
+
+    def __init__(self, db: AsyncSession, user_id: Optional[int] = None):
+        self.db = db
+        self.user_id = user_id
+
+    async def _call(self, method: str, *args, **kwargs):
+        def _run(session: Session):
+            return getattr(QuestService(session, self.user_id), method)(*args, **kwargs)
+        return await self.db.run_sync(_run)
+
+    async def run_sync(self, fn: Callable, *args, **kwargs):
+        return await self.db.run_sync(fn, *args, **kwargs)
+
+    async def get_quest_by_id(self, quest_id: int) -> Optional[Quest]:
+        return await self._call('get_quest_by_id', quest_id)
+
+    async def get_active_quests(self) -> List[Quest]:
+        return await self._call('get_active_quests')
+
+    async def get_archived_quests(self) -> List[Quest]:
+        return await self._call('get_archived_quests')
+
+    async def get_all_quests(self) -> List[Quest]:
+        return await self._call('get_all_quests')
+
+    async def create_quest(self, **kwargs) -> Quest:
+        return await self._call('create_quest', **kwargs)
+
+    async def mark_quest_read(self, quest_id: int) -> Optional[Quest]:
+        return await self._call('mark_quest_read', quest_id)
+
+    async def complete_quest(self, quest_id: int) -> Optional[Quest]:
+        return await self._call('complete_quest', quest_id)
+
+    async def fail_quest(self, quest_id: int) -> Optional[Quest]:
+        return await self._call('fail_quest', quest_id)
+
+    async def return_to_active(self, quest_id: int) -> Optional[Quest]:
+        return await self._call('return_to_active', quest_id)
+
+    async def delete_quest(self, quest_id: int) -> bool:
+        return await self._call('delete_quest', quest_id)
+
+    async def set_quest_scope(self, quest_id: int, scope: str) -> Optional[Quest]:
+        return await self._call('set_quest_scope', quest_id, scope)
+
+    async def filter_user_quests(self, **kwargs) -> Tuple[List[Quest], Optional[str]]:
+        return await self._call('filter_user_quests', **kwargs)
+
+    async def get_todays_candidates(self) -> List[Quest]:
+        return await self._call('get_todays_candidates')
+
+    async def get_today_quests(self) -> List[Quest]:
+        return await self._call('get_today_quests')
+
+
+class AsyncSubtaskService:
+    """Асинхронный вариант SubtaskService поверх AsyncSession"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _call(self, method: str, *args, **kwargs):
+        def _run(session: Session):
+            return getattr(SubtaskService(session), method)(*args, **kwargs)
+        return await self.db.run_sync(_run)
+
+    async def update_checkbox_subtask(self, subtask_id: int, completed: bool) -> Optional[CheckboxSubtask]:
+        return await self._call('update_checkbox_subtask', subtask_id, completed)
+
+    async def update_numeric_subtask(self, subtask_id: int, current: float) -> Optional[NumericSubtask]:
+        return await self._call('update_numeric_subtask', subtask_id, current)
+
+    async def get_quest_progress(self, quest_id: int) -> Dict[str, Any]:
+        return await self._call('get_quest_progress', quest_id)
@@ -0,0 +1,131 @@
+"""
+Базовый фоновый воркер «спать до ближайшего события».
+
+Воркер держит min-heap известных моментов срабатывания; tick() выполняется в потоке и возвращает
+следующий момент по данным БД. Сервисы сообщают о новых моментах через notify() (из любого потока).
+Моменты с ключом (id шаблона, квеста) заменяют прежний момент того же ключа: вытесненные записи
+и повторы не копятся в куче, а отбрасываются при добавлении или при выходе на вершину.
+"""
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class TimerWorker:
+    """Спит до ближайшего момента из кучи (не дольше max_sleep), затем вызывает tick()"""
+
+    name = 'фоновой задачи'
+
+    def __init__(self, max_sleep: float = 300.0):
+        self.max_sleep = max_sleep
+        # записи (момент, ключ); '' — момент без ключа
+        self._heap = []
+        self._queued = set()
+        self._keys = {}
+        self._stale = 0
+        self._next_wakeup: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def tick(self) -> Optional[datetime]:
+        """Выполнить работу; вернуть момент следующего срабатывания или None"""
+        raise NotImplementedError
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self, moment: Optional[datetime], key=None):
+        """Новый момент срабатывания: будим воркер, если он раньше текущего таймера.
+        С ключом момент заменяет прежний момент этого ключа (None — ключ больше не ждёт срабатывания)"""
+        if self._loop is None or (moment is None and key is None):
+            return
+        self._loop.call_soon_threadsafe(self._push, moment, key)
+
+    def _push(self, moment: Optional[datetime], key=None):
+        if self._add(moment, key) and (self._next_wakeup is None or moment < self._next_wakeup):
+            self._wakeup.set()
+
+    def _add(self, moment: Optional[datetime], key=None) -> bool:
+        """Добавить момент в кучу; False — повтор уже известного момента или снятие ключа"""
+        if key is not None:
+            key = str(key)
+            previous = self._keys.get(key)
+            if previous == moment:
+                return False
+            if moment is None:
+                del self._keys[key]
+            else:
+                self._keys[key] = moment
+            self._drop_superseded(previous)
+            if moment is None:
+                return False
+        entry = (moment, key or '')
+        if entry in self._queued:
+            return False
+        self._queued.add(entry)
+        heapq.heappush(self._heap, entry)
+        return True
+
+    def _drop_superseded(self, previous: Optional[datetime]):
+        """Учесть вытесненную запись; когда их больше половины кучи — перестроить её без них"""
+        if previous is None:
+            return
+        self._stale += 1
+        if self._stale * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if not self._is_stale(entry)]
+            heapq.heapify(self._heap)
+            self._queued = set(self._heap)
+            self._stale = 0
+
+    def _is_stale(self, entry) -> bool:
+        moment, key = entry
+        return bool(key) and self._keys.get(key) != moment
+
+    def _prune(self, now: datetime):
+        """Снять с вершины кучи прошедшие и вытесненные записи"""
+        while self._heap and (self._heap[0][0] <= now or self._is_stale(self._heap[0])):
+            entry = heapq.heappop(self._heap)
+            self._queued.discard(entry)
+            if self._is_stale(entry):
+                self._stale = max(0, self._stale - 1)
+            elif entry[1]:
+                del self._keys[entry[1]]
+
+    async def _run(self):
+        while True:
+            # сбрасываем до чтения из БД: notify() во время tick() не потеряется
+            self._wakeup.clear()
+            try:
+                next_moment = await asyncio.to_thread(self.tick)
+            except Exception as e:
+                print(f'⚠️ Ошибка {self.name}:', e)
+                next_moment = None
+
+            now = datetime.now()
+            self._prune(now)
+            if next_moment is not None and (not self._heap or next_moment < self._heap[0][0]):
+                self._add(next_moment)
+
+            delay = self.max_sleep
+            if self._heap:
+                delay = min(delay, max(0.0, (self._heap[0][0] - now).total_seconds()))
+            self._next_wakeup = now + timedelta(seconds=delay)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -31,15 +31,30 @@ function openModal(id) {
     modal.style.display = 'flex';
 }
 
-// Общая функция для отправки фильтров
-async function applyFilters() {
+// Постраничная загрузка: курсор следующей страницы и номер запроса (ответы устаревших запросов отбрасываются)
+const loadMoreBtn = document.getElementById('loadMore');
+let nextCursor = null;
+let pageRequestId = 0;
+let pageLoading = false;
+
+// Общая функция для отправки фильтров (append = догрузить следующую страницу)
+async function applyFilters(append = false) {
+    if (append && (!nextCursor || pageLoading)) {
+        return;
+    }
+
     const formData = new FormData(fastSortForm);
 
     // Добавляем данные из расширенных фильтров
     formData.append('rarity', document.getElementById('advRarity').value);
     formData.append('deadline_filter', document.getElementById('advDeadline').value);
     formData.append('author', document.getElementById('advAuthor').value);
+    if (append) {
+        formData.append('cursor', nextCursor);
+    }
 
+    const requestId = ++pageRequestId;
+    pageLoading = true;
     try {
         const response = await fetch(postURL, {
             method: 'POST',
@@ -47,12 +62,41 @@ async function applyFilters() {
         });
 
         const data = await response.json();
-        cardsContainer.innerHTML = data.cards_html;
+        if (requestId !== pageRequestId) {
+            return;
+        }
+        if (append) {
+            cardsContainer.insertAdjacentHTML('beforeend', data.cards_html);
+        } else {
+            cardsContainer.innerHTML = data.cards_html;
+        }
+        nextCursor = data.next_cursor || null;
+        loadMoreBtn.hidden = !nextCursor;
     } catch (error) {
         console.error('Filter error:', error);
+    } finally {
+        if (requestId === pageRequestId) {
+            pageLoading = false;
+        }
     }
 }
 
+function loadMore() {
+    applyFilters(true);
+}
+
+loadMoreBtn.addEventListener('click', loadMore);
+
+// Бесконечная прокрутка: догружаем, когда кнопка "Загрузить ещё" появляется в зоне видимости
+if ('IntersectionObserver' in window) {
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMore();
+        }
+    }, { rootMargin: '200px' });
+    observer.observe(loadMoreBtn);
+}
+
 // Дебаунс для частых событий
 let filterTimeout;
 function debouncedApplyFilters() {
@@ -3,6 +3,7 @@ let isRunning = false;
 let isPaused = false;
 let stepCount = 0;
 let animationFrameId = null;
+let stream = null;
 
 function updateValueDisplay(inputId, displayId, suffix = '') {
     const input = document.getElementById(inputId);
@@ -133,24 +134,129 @@ function updateStatistics(snapshot) {
     document.getElementById('magnetizationValue').textContent = snapshot.magnetization.toFixed(3);
     document.getElementById('tempStatValue').textContent = snapshot.temperature.toFixed(1) + ' K';
     document.getElementById('fieldStatValue').textContent = snapshot.field.toFixed(2) + ' T';
+    const tau = snapshot.autocorrelation_time;
+    document.getElementById('tauValue').textContent = (tau === null || tau === undefined) ? '-' : tau.toFixed(1);
 
     updateFieldArrowByStrength(snapshot.field);
+    if (snapshot.statistics) updateAverages(snapshot.statistics);
 }
 
-async function stepSimulation() {
-    if (!isRunning) return;
-    if (isPaused) {
-        setTimeout(() => stepSimulation(), 50);
+function updateAverages(statistics) {
+    const m = statistics.abs_magnetization;
+    if (!m || !statistics.samples) {
+        document.getElementById('averageValue').textContent = '-';
         return;
     }
+    document.getElementById('averageValue').textContent =
+        `${m.mean.toFixed(3)} ± ${m.error.toFixed(3)} (${statistics.samples} шагов)`;
+}
 
-    const request = {
+function currentParams() {
+    return {
         temperature_K: parseFloat(document.getElementById('temperature').value),
         field_angle: 0.0,
         field_strength_T: parseFloat(document.getElementById('fieldStrength').value),
         cube_size: parseInt(document.getElementById('cubeSize').value) || 1,
-        num_steps: 1
+        num_steps: 1,
+        algorithm: document.getElementById('algorithm').value
     };
+}
+
+// Бинарный кадр /physics/M10/stream: заголовок 32 байта (см. FRAME_HEADER в M10.py), затем up_count
+function decodeFrame(buffer) {
+    const view = new DataView(buffer);
+    const itemSize = view.getUint8(1);
+    const size = view.getUint16(2, true);
+    const counts = itemSize === 1 ? new Uint8Array(buffer, 32) : new Uint16Array(buffer.slice(32));
+    const up_count = [], down_count = [], directions = [];
+    for (let i = 0; i < size; i++) {
+        const upRow = [], downRow = [], dirRow = [];
+        for (let j = 0; j < size; j++) {
+            const up = counts[i * size + j];
+            upRow.push(up);
+            downRow.push(size - up);
+            dirRow.push(((((up - (size - up)) / size) * 90.0) % 360.0) * Math.PI / 180.0);
+        }
+        up_count.push(upRow);
+        down_count.push(downRow);
+        directions.push(dirRow);
+    }
+    const tau = view.getFloat32(28, true);
+    return {
+        step: view.getUint32(4, true),
+        energy: view.getFloat64(8, true),
+        magnetization: view.getFloat32(16, true),
+        temperature: view.getFloat32(20, true),
+        field: view.getFloat32(24, true),
+        autocorrelation_time: isNaN(tau) ? null : tau,
+        up_count, down_count, directions
+    };
+}
+
+function sendStreamParams() {
+    if (!stream || stream.readyState !== WebSocket.OPEN) return;
+    const pauseMs = parseInt(document.getElementById('framePause').value) || 0;
+    stream.send(JSON.stringify({ type: 'params', ...currentParams(), fps: 1000 / Math.max(pauseMs, 1) }));
+}
+
+function closeStream() {
+    if (stream) {
+        stream.onclose = null;
+        stream.close();
+        stream = null;
+    }
+}
+
+// Потоковый режим: сервер сам шагает симуляцию и присылает кадры; при недоступности WebSocket —
+// опрос /step, как раньше
+function startStream() {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    let opened = false;
+    stream = new WebSocket(`${protocol}//${window.location.host}/physics/M10/stream`);
+    stream.binaryType = 'arraybuffer';
+    stream.onopen = () => {
+        opened = true;
+        sendStreamParams();
+    };
+    stream.onmessage = (event) => {
+        if (typeof event.data === 'string') {
+            const message = JSON.parse(event.data);
+            if (message.type === 'error') setStatus('❌ Ошибка: ' + message.detail, 'error');
+            if (message.type === 'statistics') updateAverages(message);
+            return;
+        }
+        currentSnapshot = decodeFrame(event.data);
+        drawVisualization(currentSnapshot);
+        updateStatistics(currentSnapshot);
+        stepCount = currentSnapshot.step;
+        updateStepCounter();
+    };
+    stream.onclose = () => {
+        stream = null;
+        if (!isRunning) return;
+        if (!opened) {
+            stepSimulation();
+            return;
+        }
+        setStatus('⚠️ Соединение закрыто', 'error');
+        isRunning = false;
+        document.getElementById('startBtn').disabled = false;
+        document.getElementById('pauseBtn').disabled = true;
+    };
+}
+
+['temperature', 'fieldStrength', 'cubeSize', 'algorithm', 'framePause'].forEach((id) => {
+    document.getElementById(id).addEventListener('change', sendStreamParams);
+});
+
+async function stepSimulation() {
+    if (!isRunning) return;
+    if (isPaused) {
+        setTimeout(() => stepSimulation(), 50);
+        return;
+    }
+
+    const request = currentParams();
 
     try {
         const response = await fetch('/physics/M10/step', {
@@ -194,7 +300,11 @@ function startSimulation() {
     isPaused = false;
     stepCount = 0;
     updateStepCounter();
-    stepSimulation();
+    if (window.WebSocket) {
+        startStream();
+    } else {
+        stepSimulation();
+    }
 }
 
 function togglePause() {
@@ -204,14 +314,20 @@ function togglePause() {
     if (isPaused) {
         setStatus('⏸️ Пауза', 'idle');
         document.getElementById('pauseBtn').textContent = '▶️ Продолжить';
+        if (stream) stream.send(JSON.stringify({ type: 'pause' }));
     } else {
         setStatus('▶️ Симуляция работает...', 'running');
         document.getElementById('pauseBtn').textContent = '⏸️ Пауза';
-        stepSimulation();
+        if (stream) {
+            sendStreamParams();
+        } else {
+            stepSimulation();
+        }
     }
 }
 
 async function resetSimulation() {
+    closeStream();
     isRunning = false;
     isPaused = false;
     stepCount = 0;
@@ -227,13 +343,7 @@ async function resetSimulation() {
     document.getElementById('pauseBtn').disabled = true;
     document.getElementById('pauseBtn').textContent = '⏸️ Пауза';
 
-    const request = {
-        temperature_K: parseFloat(document.getElementById('temperature').value),
-        field_angle: 0.0,
-        field_strength_T: parseFloat(document.getElementById('fieldStrength').value),
-        cube_size: parseInt(document.getElementById('cubeSize').value) || 1,
-        num_steps: 1
-    };
+    const request = currentParams();
 
     const response = await fetch('/physics/M10/reset', {
         method: 'POST',
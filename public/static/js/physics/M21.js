@@ -99,6 +99,8 @@ async function calculate() {
     const n_divisions = parseInt(document.getElementById('n_divisions').value);
     const V  = parseFloat(document.getElementById('V').value);
     let d    = parseFloat(document.getElementById('d').value);
+    const renderSelect = document.getElementById('render');
+    const render = renderSelect ? renderSelect.value : 'png';
 
     if (currentMode === 'separated' && d <= R1 + R2) {
         showError(`Расстояние d должно быть больше суммы радиусов (${(R1 + R2).toFixed(3)} м)`);
@@ -122,7 +124,7 @@ async function calculate() {
         const response = await fetch('/physics/M21/calculate', {
             method:  'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ mode: currentMode, R1, R2, d, V, n_divisions }),
+            body: JSON.stringify({ mode: currentMode, R1, R2, d, V, n_divisions, render }),
         });
 
         const data = await response.json();
@@ -163,12 +165,122 @@ function displayResults(data) {
     }
     document.getElementById('n-elements').textContent  = data.n_elements;
 
-    document.getElementById('field-viz').src = 'data:image/png;base64,' + data.field_img;
+    const img = document.getElementById('field-viz');
+    const canvas = document.getElementById('field-canvas');
+    if (data.field_data && canvas) {
+        img.style.display = 'none';
+        canvas.style.display = '';
+        drawField(canvas, data.field_data);
+    } else {
+        if (canvas) canvas.style.display = 'none';
+        img.style.display = '';
+        img.src = 'data:image/png;base64,' + data.field_img;
+    }
 
     document.getElementById('results').classList.add('active');
     document.getElementById('results').scrollIntoView({ behavior: 'smooth' });
 }
 
+// Массивы поля приходят как base64 от float32 little-endian
+function decodeFloat32(b64) {
+    const bin = atob(b64);
+    const bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    return new Float32Array(bytes.buffer);
+}
+
+// Цвет по t ∈ [0, 1]: синий → белый → красный
+function colorMap(t) {
+    t = Math.min(1, Math.max(0, t));
+    if (t < 0.5) {
+        const k = t * 2;
+        return [Math.round(40 + 215 * k), Math.round(80 + 175 * k), 255];
+    }
+    const k = (t - 0.5) * 2;
+    return [255, Math.round(255 - 175 * k), Math.round(255 - 215 * k)];
+}
+
+function drawField(canvas, field) {
+    const [ny, nx] = field.shape;
+    const xs = decodeFloat32(field.x);
+    const ys = decodeFloat32(field.y);
+    const phi = decodeFloat32(field.potential);
+    const Ex = decodeFloat32(field.Ex);
+    const Ey = decodeFloat32(field.Ey);
+    const ctx = canvas.getContext('2d');
+    const W = canvas.width, H = canvas.height;
+
+    const x0 = xs[0], x1 = xs[nx - 1], y0 = ys[0], y1 = ys[ny - 1];
+    const scale = Math.min(W / (x1 - x0), H / (y1 - y0));
+    const offX = (W - (x1 - x0) * scale) / 2, offY = (H - (y1 - y0) * scale) / 2;
+    const toPx = (u, v) => [offX + (u - x0) * scale, H - offY - (v - y0) * scale];
+
+    // Потенциал: тепловая карта, ячейка на узел сетки
+    let pMax = 0;
+    for (const p of phi) if (isFinite(p)) pMax = Math.max(pMax, Math.abs(p));
+    pMax = pMax || 1;
+    ctx.fillStyle = '#ffffff';
+    ctx.fillRect(0, 0, W, H);
+    const cw = (x1 - x0) / (nx - 1) * scale, ch = (y1 - y0) / (ny - 1) * scale;
+    for (let j = 0; j < ny; j++) {
+        for (let i = 0; i < nx; i++) {
+            const p = phi[j * nx + i];
+            if (!isFinite(p)) continue;
+            const [r, g, b] = colorMap(0.5 + p / (2 * pMax));
+            const [px, py] = toPx(xs[i], ys[j]);
+            ctx.fillStyle = `rgb(${r},${g},${b})`;
+            ctx.fillRect(px - cw / 2, py - ch / 2, cw + 1, ch + 1);
+        }
+    }
+
+    // Направление поля: стрелки в каждом step-м узле, длина — в логарифме |E|
+    const step = Math.max(1, Math.round(Math.max(nx, ny) / 25));
+    let eMax = 0;
+    for (let k = 0; k < Ex.length; k++) {
+        const e = Math.hypot(Ex[k], Ey[k]);
+        if (isFinite(e)) eMax = Math.max(eMax, e);
+    }
+    const arrow = 0.8 * step * Math.min(cw, ch);
+    ctx.strokeStyle = 'rgba(30, 30, 30, 0.7)';
+    ctx.lineWidth = 1;
+    for (let j = 0; j < ny; j += step) {
+        for (let i = 0; i < nx; i += step) {
+            const k = j * nx + i;
+            const e = Math.hypot(Ex[k], Ey[k]);
+            if (!isFinite(e) || e === 0 || !isFinite(phi[k])) continue;
+            const len = arrow * Math.max(0.2, 1 + Math.log10(e / eMax) / 3);
+            const [px, py] = toPx(xs[i], ys[j]);
+            const dx = Ex[k] / e * len, dy = -Ey[k] / e * len;
+            ctx.beginPath();
+            ctx.moveTo(px - dx / 2, py - dy / 2);
+            ctx.lineTo(px + dx / 2, py + dy / 2);
+            const a = Math.atan2(dy, dx);
+            ctx.lineTo(px + dx / 2 - 4 * Math.cos(a - 0.5), py + dy / 2 - 4 * Math.sin(a - 0.5));
+            ctx.moveTo(px + dx / 2, py + dy / 2);
+            ctx.lineTo(px + dx / 2 - 4 * Math.cos(a + 0.5), py + dy / 2 - 4 * Math.sin(a + 0.5));
+            ctx.stroke();
+        }
+    }
+
+    // Плотность заряда на панелях в плоскости сечения
+    const u = decodeFloat32(field.charges.u);
+    const v = decodeFloat32(field.charges.v);
+    const sigma = decodeFloat32(field.charges.sigma);
+    let sMax = 0;
+    for (const s of sigma) sMax = Math.max(sMax, Math.abs(s));
+    sMax = sMax || 1;
+    for (let k = 0; k < u.length; k++) {
+        const [r, g, b] = colorMap(0.5 + sigma[k] / (2 * sMax));
+        const [px, py] = toPx(u[k], v[k]);
+        ctx.fillStyle = `rgb(${r},${g},${b})`;
+        ctx.strokeStyle = '#222';
+        ctx.beginPath();
+        ctx.arc(px, py, 3, 0, 2 * Math.PI);
+        ctx.fill();
+        ctx.stroke();
+    }
+}
+
 function showError(message) {
     document.getElementById('error-text').textContent = message;
     document.getElementById('error').classList.add('active');
@@ -0,0 +1,67 @@
+"""
+Проверка алгоритмов M10 точным перебором: для куба 2³ (256 состояний) считаются точные
+⟨e⟩ и ⟨|m|⟩ по распределению Больцмана и сравниваются со средними по симуляции.
+Запуск: python scripts/check_m10_exact.py [T_K] [B_T] [шагов]
+"""
+import itertools
+import sys
+import os
+# Добавляем корневую папку проекта в sys.path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+
+from app.physics.models.M10 import ALGORITHMS, Spin3DSimulator
+
+SIZE = 2
+
+
+def exact_averages(T_K: float, B_T: float):
+    """Точные ⟨e⟩ и ⟨|m|⟩ на спин (e = hamiltonian()/N, как в статистике симулятора)"""
+    T_norm = Spin3DSimulator.temperature_to_normalized(T_K)
+    energies, magnetizations = [], []
+    for bits in itertools.product((-1, 1), repeat=SIZE ** 3):
+        sim = Spin3DSimulator.from_spins(np.array(bits, dtype=np.int8).reshape(SIZE, SIZE, SIZE))
+        sim.set_field(0.0, B_T)
+        energies.append(sim.hamiltonian())
+        magnetizations.append(abs(sim.magnetization))
+    energies = np.array(energies)
+    weights = np.exp(-(energies - energies.min()) / T_norm)
+    weights /= weights.sum()
+    return float(weights @ energies) / SIZE ** 3, float(weights @ np.array(magnetizations))
+
+
+def sampled_averages(algorithm: str, T_K: float, B_T: float, n_steps: int):
+    sim = Spin3DSimulator(SIZE, algorithm, seed=1)
+    sim.set_temperature(T_K)
+    sim.set_field(0.0, B_T)
+    for _ in range(n_steps // 10):
+        sim.update()
+    sim.reset_statistics()
+    for _ in range(n_steps):
+        sim.update()
+        sim.record_statistics()
+    stats = sim.statistics()
+    return stats['energy_per_spin'], stats['abs_magnetization']
+
+
+def main():
+    T_K = float(sys.argv[1]) if len(sys.argv) > 1 else 1500.0
+    B_T = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    n_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+    e_exact, m_exact = exact_averages(T_K, B_T)
+    print(f"T={T_K} K, B={B_T} T: точно ⟨e⟩={e_exact:.4f}, ⟨|m|⟩={m_exact:.4f}")
+    failed = False
+    for algorithm in ALGORITHMS:
+        e, m = sampled_averages(algorithm, T_K, B_T, n_steps)
+        ok = all(abs(est['mean'] - exact) <= 4 * est['error'] + 1e-3
+                 for est, exact in ((e, e_exact), (m, m_exact)))
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {algorithm}: ⟨e⟩={e['mean']:.4f}±{e['error']:.4f}, ⟨|m|⟩={m['mean']:.4f}±{m['error']:.4f}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()